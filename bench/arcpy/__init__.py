@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+
+"""arcpy: Stand-in for the parts of arcpy the Best Hikes map script uses, for benchmarks without ArcGIS Pro.
+
+Feature classes and rasters are pickled into the geodatabase folder, projects
+are saved as JSON, and every geoprocessing tool and project edit can be
+charged a latency through HIKE_FAKE_LATENCY, or made to fail through
+HIKE_FAKE_FAIL; see _base.delay.
+"""
+
+from ._base import (CIM, Array, EnvManager, ExecuteError, Extent, Field, Geometry, Point, PointGeometry,
+                    Polygon, Polyline, Raster, SpatialReference, AsShape, Exists, GetSigninToken, ListFeatureClasses,
+                    ListFields, ListRasters, NumPyArrayToRaster, ValidateFieldName, call_stats, env)
+from . import analysis, cartography, conversion, da, management, mp
+
+def AddMessage(message):
+    print(message)
+
+def GetInstallInfo():
+    return {'ProductName': 'stand-in', 'Version': '0'}
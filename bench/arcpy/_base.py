@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+
+"""_base.py: Datasets, geometries, spatial references and latency shared by the arcpy stand-in."""
+
+# SETUP
+
+import os
+import re
+import copy
+import json
+import time
+import pickle
+import fnmatch
+import threading
+
+import numpy as np
+
+# seconds added to each call, by call name, toolbox or '*'; see delay
+latency = {}
+if os.environ.get('HIKE_FAKE_LATENCY'):
+    value = os.environ['HIKE_FAKE_LATENCY']
+    latency = json.loads(value) if value.lstrip().startswith('{') else {'gp': float(value)}
+
+# calls made through the stand-in and the latency they were charged, by call name
+call_stats = {}
+
+# call name that raises ExecuteError, to test how builds recover from a failed tool; see delay
+fail_call = os.environ.get('HIKE_FAKE_FAIL')
+
+# datasets created in this process, keyed by normalized path
+datasets = {}
+dataset_lock = threading.Lock()
+
+# meters per unit of geographic coordinate systems, at the equator
+degree_m = 111319.49079327357
+
+# FUNCTIONS
+
+def delay(name, cat='gp'):
+    """
+    Sleeps for the latency configured for a call and counts it.
+
+    HIKE_FAKE_LATENCY is either seconds charged to every geoprocessing tool,
+    or a JSON object keyed by call name (e.g. 'management.CreateFeatureclass'),
+    toolbox or module (e.g. 'management', 'mp'), category ('gp', 'map') or '*'.
+    A call named in HIKE_FAKE_FAIL raises ExecuteError after its latency.
+
+    Parameters:
+    name (str): Call name, e.g. 'management.AddField' or 'mp.addLayer'.
+    cat (str): Call category, 'gp' for tools or 'map' for project edits.
+
+    Returns:
+    None
+    """
+    seconds = latency.get(name, latency.get(name.split('.')[0], latency.get(cat, latency.get('*', 0))))
+    stats = call_stats.setdefault(name, {'calls': 0, 'latency': 0.0})
+    stats['calls'] += 1
+    stats['latency'] += seconds
+    if seconds:
+        time.sleep(seconds)
+    if name == fail_call:
+        raise ExecuteError(f'ERROR 999999: {name} failed (HIKE_FAKE_FAIL)')
+
+def key(path):
+    """
+    Normalizes a dataset path or layer to its dataset key.
+    """
+    path = getattr(path, 'dataSource', path)
+    path = str(path)
+    if path.lower().startswith('memory\\') or path.lower().startswith('memory/'):
+        return 'memory/' + path[7:].lower()
+    return os.path.normcase(os.path.abspath(path))
+
+def in_memory(path):
+    return key(path).startswith('memory/')
+
+def load(path):
+    """
+    Returns a dataset, reading it from disk on first use.
+
+    Parameters:
+    path (str or Layer): Dataset path, or a layer drawing it.
+
+    Returns:
+    Dataset dictionary, or None if it does not exist.
+    """
+    k = key(path)
+    with dataset_lock:
+        if k not in datasets and not in_memory(k) and os.path.isfile(k):
+            with open(k, 'rb') as f:
+                datasets[k] = pickle.load(f)
+        return datasets.get(k)
+
+def save(path, ds):
+    """
+    Stores a dataset, writing it to disk unless it is in the memory workspace.
+
+    Returns:
+    None
+    """
+    k = key(path)
+    with dataset_lock:
+        datasets[k] = ds
+    if not in_memory(k):
+        os.makedirs(os.path.dirname(k), exist_ok=True)
+        with open(k + '.tmp', 'wb') as f:
+            pickle.dump(ds, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(k + '.tmp', k)
+
+def drop(path):
+    """
+    Deletes a dataset from memory and disk.
+
+    Returns:
+    True if it existed.
+    """
+    k = key(path)
+    with dataset_lock:
+        found = datasets.pop(k, None) is not None
+    if not in_memory(k) and os.path.isfile(k):
+        os.remove(k)
+        found = True
+    return found
+
+def check_output(path):
+    """
+    Raises like arcpy when a tool would replace an existing dataset while overwriteOutput is off.
+    """
+    if not env.overwriteOutput and load(path) is not None:
+        raise ExecuteError(f'ERROR 000258: Output {path} already exists')
+
+def new_dataset(kind, geometry=None, sr=None):
+    return {'kind': kind, 'geometry': geometry, 'sr': sr,
+            'fields': [{'name': 'OBJECTID', 'type': 'OID'}], 'rows': []}
+
+def wildcard(names, pattern):
+    """
+    Filters names by an arcpy wildcard, case-insensitive.
+    """
+    if not pattern:
+        return list(names)
+    return [n for n in names if fnmatch.fnmatch(n.lower(), pattern.lower())]
+
+class CIM:
+    """
+    Cartographic Information Model object whose missing members are created on first read.
+
+    Parameters:
+    kwargs: Initial members.
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = CIM()
+        self.__dict__[name] = value
+        return value
+
+    def __deepcopy__(self, memo):
+        return CIM(**copy.deepcopy(self.__dict__, memo))
+
+def symbol_cim(layers=3):
+    """
+    Returns a CIM symbol reference with colored symbol layers.
+    """
+    return CIM(symbol=CIM(symbolLayers=[CIM(color=CIM(values=[0, 0, 0, 100])) for _ in range(layers)]))
+
+def label_class_cim(name):
+    """
+    Returns the CIM definition of a label class.
+    """
+    return CIM(name=name, visibility=True, expression='$feature.NAME',
+               textSymbol=CIM(symbol=CIM(fontFamilyName='Tahoma', height=8,
+                                         symbol=symbol_cim(1).symbol)))
+
+class SpatialReference:
+    """
+    Coordinate system of a WKID or WKT.
+
+    Parameters:
+    item (int): WKID.
+    text (str): WKT text.
+    """
+    def __init__(self, item=None, text=None):
+        if isinstance(item, str) and item.strip().isdigit():
+            item = int(item)
+        self.factoryCode = item if isinstance(item, int) else 0
+        self.text = text if text is not None else (item if isinstance(item, str) else '')
+        wkt = self.text.lstrip().upper()
+        if self.factoryCode in (4326, 4269) or wkt.startswith('GEOGCS'):
+            self.type = 'Geographic'
+            self.metersPerUnit = degree_m
+        else:
+            self.type = 'Projected'
+            units = re.findall(r'UNIT\["[^"]+",\s*([-\d.eE]+)\]', self.text)
+            self.metersPerUnit = float(units[-1]) if units else 1.0
+        self.name = re.match(r'\w+\["([^"]+)"', self.text).group(1) if self.text else str(self.factoryCode)
+
+    def exportToString(self):
+        return self.text or str(self.factoryCode)
+
+    def __eq__(self, other):
+        return isinstance(other, SpatialReference) and self.exportToString() == other.exportToString()
+
+    def __hash__(self):
+        return hash(self.exportToString())
+
+class Point:
+    def __init__(self, X=None, Y=None, Z=None, M=None, ID=None):
+        self.X, self.Y, self.Z, self.M, self.ID = X, Y, Z, M, ID
+
+class Array(list):
+    pass
+
+class Geometry:
+    """
+    Geometry held as Esri JSON.
+
+    Parameters:
+    geometry_type (str): 'point', 'polyline' or 'polygon'.
+    esri_json (dict): Esri JSON geometry.
+    """
+    def __init__(self, geometry_type, esri_json, spatial_reference=None):
+        self.type = geometry_type
+        self.json = esri_json
+        self.spatialReference = spatial_reference
+
+    @property
+    def JSON(self):
+        return json.dumps(self.json)
+
+    def coords(self):
+        """
+        Returns the vertices as an (N, 2) array.
+        """
+        g = self.json
+        if 'x' in g:
+            return np.array([[g['x'], g['y']]], dtype=float)
+        parts = g.get('paths') or g.get('rings') or []
+        pts = [pt[:2] for part in parts for pt in part]
+        return np.array(pts, dtype=float).reshape(-1, 2)
+
+    @property
+    def extent(self):
+        xy = self.coords()
+        if not len(xy):
+            return Extent(0, 0, 0, 0, spatial_reference=self.spatialReference)
+        return Extent(*xy.min(axis=0), *xy.max(axis=0), spatial_reference=self.spatialReference)
+
+    @property
+    def pointCount(self):
+        return len(self.coords())
+
+def Polygon(inputs, spatial_reference=None, has_z=False, has_m=False):
+    ring = [[p.X, p.Y] for p in inputs]
+    return Geometry('polygon', {'rings': [ring]}, spatial_reference)
+
+def Polyline(inputs, spatial_reference=None, has_z=False, has_m=False):
+    path = [[p.X, p.Y] for p in inputs]
+    return Geometry('polyline', {'paths': [path]}, spatial_reference)
+
+def PointGeometry(point, spatial_reference=None, has_z=False, has_m=False):
+    return Geometry('point', {'x': point.X, 'y': point.Y}, spatial_reference)
+
+def AsShape(geojson_struct, esri_json=False):
+    """
+    Converts Esri JSON, or GeoJSON, to a geometry.
+    """
+    g = geojson_struct
+    if not esri_json:
+        g = esri_geometry(g)
+    if 'x' in g:
+        kind = 'point'
+    elif 'rings' in g:
+        kind = 'polygon'
+    else:
+        kind = 'polyline'
+    sr = g.get('spatialReference', {}).get('wkid')
+    return Geometry(kind, g, SpatialReference(sr) if sr else None)
+
+def esri_geometry(geo):
+    """
+    Converts a GeoJSON geometry to Esri JSON.
+    """
+    kind, c = geo['type'], geo['coordinates']
+    if kind == 'Point':
+        return {'x': c[0], 'y': c[1]}
+    if kind == 'LineString':
+        return {'paths': [c]}
+    if kind == 'MultiLineString':
+        return {'paths': c}
+    if kind == 'Polygon':
+        return {'rings': c}
+    if kind == 'MultiPolygon':
+        return {'rings': [ring for poly in c for ring in poly]}
+    raise ValueError(f'Unsupported GeoJSON geometry {kind}')
+
+class Extent:
+    def __init__(self, XMin=None, YMin=None, XMax=None, YMax=None, ZMin=None, ZMax=None, MMin=None, MMax=None,
+                 spatial_reference=None):
+        self.XMin, self.YMin, self.XMax, self.YMax = [None if v is None else float(v)
+                                                      for v in (XMin, YMin, XMax, YMax)]
+        self.spatialReference = spatial_reference
+
+    @property
+    def width(self):
+        return self.XMax - self.XMin
+
+    @property
+    def height(self):
+        return self.YMax - self.YMin
+
+    @property
+    def polygon(self):
+        ring = [[self.XMin, self.YMin], [self.XMin, self.YMax], [self.XMax, self.YMax],
+                [self.XMax, self.YMin], [self.XMin, self.YMin]]
+        return Geometry('polygon', {'rings': [ring]}, self.spatialReference)
+
+    def overlaps_box(self, box):
+        return box[0] <= self.XMax and box[2] >= self.XMin and box[1] <= self.YMax and box[3] >= self.YMin
+
+    def projectAs(self, spatial_reference, transformation_name=None):
+        import hike_crs
+        src = self.spatialReference.exportToString() if self.spatialReference else 4326
+        box = hike_crs.transform_extent((self.XMin, self.YMin, self.XMax, self.YMax),
+                                        src, spatial_reference.exportToString())
+        return Extent(*box, spatial_reference=spatial_reference)
+
+class Environment:
+    """
+    Geoprocessing environment settings.
+    """
+    def __init__(self):
+        self.addOutputsToMap = True
+        self.overwriteOutput = False
+        self.workspace = None
+        self.scratchWorkspace = None
+        self.extent = None
+        self.outputCoordinateSystem = None
+
+env = Environment()
+
+class EnvManager:
+    """
+    Sets environment settings for the enclosed block.
+    """
+    def __init__(self, **kwargs):
+        self.settings = kwargs
+
+    def __enter__(self):
+        self.saved = {k: getattr(env, k, None) for k in self.settings}
+        for k, v in self.settings.items():
+            setattr(env, k, v)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for k, v in self.saved.items():
+            setattr(env, k, v)
+        return False
+
+class Field:
+    def __init__(self, name, type='String', length=255):
+        self.name = name
+        self.aliasName = name
+        self.baseName = name
+        self.type = type
+        self.length = length
+
+class Raster:
+    """
+    Raster dataset held as a NumPy array.
+
+    Parameters:
+    inRaster (str): Path of a saved raster.
+    """
+    def __init__(self, inRaster, array=None, lower_left=None, cellsize=None, sr=None):
+        self.catalogPath = None if array is not None else str(inRaster)
+        if array is None:
+            ds = load(inRaster)
+            if ds is None or ds['kind'] != 'raster':
+                raise RuntimeError(f'ERROR 000732: Input Raster: Dataset {inRaster} does not exist or is not supported')
+            array, lower_left, cellsize, sr = ds['array'], ds['lower_left'], ds['cellsize'], ds['sr']
+        self.array = array
+        self.lower_left = lower_left
+        self.cellsize = cellsize
+        self.sr = sr
+        self.height, self.width = array.shape[:2]
+        self.meanCellWidth, self.meanCellHeight = cellsize
+
+    @property
+    def extent(self):
+        x0, y0 = self.lower_left
+        return Extent(x0, y0, x0 + self.width * self.meanCellWidth, y0 + self.height * self.meanCellHeight,
+                      spatial_reference=self.spatialReference)
+
+    @property
+    def spatialReference(self):
+        return SpatialReference(self.sr) if isinstance(self.sr, int) else SpatialReference(text=self.sr or '')
+
+    def save(self, name):
+        delay('Raster.save')
+        check_output(name)
+        save(name, {'kind': 'raster', 'geometry': None, 'sr': self.sr, 'fields': [], 'rows': [],
+                    'array': self.array, 'lower_left': self.lower_left, 'cellsize': self.cellsize})
+        self.catalogPath = name
+
+def NumPyArrayToRaster(in_array, lower_left_corner=None, x_cell_size=None, y_cell_size=None,
+                       value_to_nodata=None):
+    delay('NumPyArrayToRaster')
+    ll = (lower_left_corner.X, lower_left_corner.Y) if lower_left_corner is not None else (0.0, 0.0)
+    cx = x_cell_size or 1.0
+    return Raster(None, np.array(in_array, copy=True), ll, (cx, y_cell_size or cx))
+
+def Exists(dataset):
+    delay('Exists', 'map')
+    if load(dataset) is not None:
+        return True
+    return not in_memory(dataset) and os.path.exists(key(dataset))
+
+def _list(kinds, wild_card=None):
+    """
+    Lists the datasets of the given kinds in env.workspace, None if it is not set.
+    """
+    ws = env.workspace
+    if not ws or not os.path.isdir(ws):
+        return None
+    names = [n for n in sorted(os.listdir(ws)) if not n.endswith('.tmp')]
+    return wildcard([n for n in names if (load(os.path.join(ws, n)) or {}).get('kind') in kinds], wild_card)
+
+def ListFeatureClasses(wild_card=None, feature_type=None, feature_dataset=None):
+    return _list(('feature',), wild_card)
+
+def ListRasters(wild_card=None, raster_type=None):
+    return _list(('raster',), wild_card)
+
+def ListFields(dataset, wild_card=None, field_type=None):
+    ds = load(dataset)
+    names = getattr(dataset, 'service_fields', None)
+    if names is not None:
+        return [Field(n) for n in wildcard(names, wild_card)]
+    if ds is None:
+        raise RuntimeError(f'ERROR 000732: Dataset {dataset} does not exist or is not supported')
+    return [Field(f['name'], f['type']) for f in ds['fields'] if f['name'] in wildcard([f['name']], wild_card)]
+
+def ValidateFieldName(name, workspace=None):
+    name = re.sub(r'\W', '_', name)
+    return '_' + name if name[:1].isdigit() else name
+
+def GetSigninToken():
+    return {'token': 'stand-in', 'expires': time.time() + 3600, 'referer': ''}
+
+class ExecuteError(Exception):
+    pass
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+"""analysis.py: Analysis toolbox of the arcpy stand-in."""
+
+# SETUP
+
+import copy
+
+import numpy as np
+
+from . import _base as _b
+
+# FUNCTIONS
+
+def PairwiseClip(in_features, clip_features, out_feature_class, cluster_tolerance=None):
+    """
+    Keeps the features whose bounding box meets the clip features' extent.
+    """
+    _b.delay('analysis.PairwiseClip')
+    _b.check_output(out_feature_class)
+    src = _b.load(in_features)
+    if src is None:
+        raise _b.ExecuteError(f'ERROR 000732: Input Features: Dataset {in_features} does not exist or is not supported')
+    clip = clip_features if isinstance(clip_features, _b.Geometry) else None
+    if clip is None:
+        rows = _b.load(clip_features)['rows']
+        clip = _b.AsShape({'rings': [r for row in rows for r in row['SHAPE']['rings']]}, True)
+    ext = clip.extent
+    out = dict(src, rows=[])
+    for row in src['rows']:
+        xy = _b.AsShape(row['SHAPE'], True).coords()
+        if len(xy) and ext.overlaps_box(np.concatenate((xy.min(axis=0), xy.max(axis=0)))):
+            out['rows'].append(copy.deepcopy(row))
+    _b.save(out_feature_class, out)
+    return out_feature_class
+
+def Clip(in_features, clip_features, out_feature_class, cluster_tolerance=None):
+    return PairwiseClip(in_features, clip_features, out_feature_class, cluster_tolerance)
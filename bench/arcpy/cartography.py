@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+"""cartography.py: Cartography toolbox of the arcpy stand-in."""
+
+# SETUP
+
+import copy
+
+from . import _base as _b
+
+# FUNCTIONS
+
+def _copy(in_features, out_features):
+    _b.check_output(out_features)
+    _b.save(out_features, copy.deepcopy(_b.load(in_features)))
+    return out_features
+
+def SimplifyLine(in_features, out_feature_class, algorithm='POINT_REMOVE', tolerance=None, *args, **kwargs):
+    _b.delay('cartography.SimplifyLine')
+    return _copy(in_features, out_feature_class)
+
+def SmoothLine(in_features, out_feature_class, algorithm='PAEK', tolerance=None, *args, **kwargs):
+    _b.delay('cartography.SmoothLine')
+    return _copy(in_features, out_feature_class)
+
+def SmoothPolygon(in_features, out_feature_class, algorithm='PAEK', tolerance=None, *args, **kwargs):
+    _b.delay('cartography.SmoothPolygon')
+    return _copy(in_features, out_feature_class)
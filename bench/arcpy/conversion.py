@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+"""conversion.py: Conversion toolbox of the arcpy stand-in."""
+
+# SETUP
+
+import json
+
+from . import _base as _b
+
+# FUNCTIONS
+
+def JSONToFeatures(in_json_file, out_features, geometry_type=None):
+    """
+    Writes the features of an Esri JSON or GeoJSON file to a feature class.
+    """
+    _b.delay('conversion.JSONToFeatures')
+    _b.check_output(out_features)
+    with open(in_json_file) as f:
+        data = json.load(f)
+    geojson = data.get('type') == 'FeatureCollection'
+    ds = _b.new_dataset('feature', (geometry_type or data.get('geometryType', 'esriGeometryPolyline')
+                                    .replace('esriGeometry', '')).upper(),
+                        4326 if geojson else data.get('spatialReference', {}).get('wkid'))
+    names = {}
+    for i, feat in enumerate(data.get('features', [])):
+        attrs = feat.get('properties' if geojson else 'attributes') or {}
+        geom = feat.get('geometry')
+        if geom is None:
+            continue
+        row = dict(attrs, OBJECTID=i + 1, SHAPE=_b.esri_geometry(geom) if geojson else geom)
+        ds['rows'].append(row)
+        names.update(dict.fromkeys(attrs))
+    ds['fields'] += [{'name': n, 'type': 'TEXT'} for n in names if n != 'OBJECTID']
+    _b.save(out_features, ds)
+    return out_features
+
+def RasterToPolygon(in_raster, out_polygon_features, simplify='SIMPLIFY', raster_field='Value', *args, **kwargs):
+    _b.delay('conversion.RasterToPolygon')
+    _b.check_output(out_polygon_features)
+    ds = _b.new_dataset('feature', 'POLYGON')
+    ds['fields'].append({'name': 'gridcode', 'type': 'LONG'})
+    _b.save(out_polygon_features, ds)
+    return out_polygon_features
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""da.py: Insert, search and update cursors of the arcpy stand-in."""
+
+# SETUP
+
+from ._base import Geometry, AsShape, load, save, delay
+
+# FUNCTIONS
+
+def _dataset(in_table):
+    ds = load(in_table)
+    if ds is None or ds['kind'] != 'feature':
+        raise RuntimeError(f'ERROR 000732: Input Table: Dataset {in_table} does not exist or is not supported')
+    return ds
+
+def _check_fields(ds, field_names):
+    names = {f['name'].lower() for f in ds['fields']}
+    for name in field_names:
+        if not name.upper().startswith('SHAPE@') and name.lower() not in names:
+            raise RuntimeError(f'Cannot find field \'{name}\'')
+
+def _read(row, name):
+    """
+    Returns the value of a cursor field from a stored row.
+    """
+    token = name.upper()
+    shape = row.get('SHAPE')
+    if token == 'SHAPE@':
+        return None if shape is None else AsShape(shape, True)
+    if token == 'SHAPE@JSON':
+        return None if shape is None else AsShape(shape, True).JSON
+    if token == 'SHAPE@XY':
+        return None if shape is None else tuple(AsShape(shape, True).coords().mean(axis=0))
+    if token == 'OID@':
+        return row.get('OBJECTID')
+    return row.get(name)
+
+def _write(row, name, value):
+    """
+    Stores a cursor field value in a row.
+    """
+    token = name.upper()
+    if token in ('SHAPE@', 'SHAPE@JSON'):
+        row['SHAPE'] = value.json if isinstance(value, Geometry) else value
+    elif token == 'SHAPE@XY':
+        row['SHAPE'] = {'x': float(value[0]), 'y': float(value[1])}
+    else:
+        row[name] = value
+
+class InsertCursor:
+    """
+    Appends rows to a feature class, written when the cursor is closed.
+    """
+    def __init__(self, in_table, field_names):
+        delay('da.InsertCursor')
+        self.path = in_table
+        self.ds = _dataset(in_table)
+        self.fields = list(field_names)
+        _check_fields(self.ds, self.fields)
+        self.rows = []
+
+    def insertRow(self, row):
+        rec = {'OBJECTID': len(self.ds['rows']) + len(self.rows) + 1}
+        for name, value in zip(self.fields, row):
+            _write(rec, name, value)
+        self.rows.append(rec)
+        return rec['OBJECTID']
+
+    def close(self):
+        if self.rows is not None:
+            self.ds['rows'].extend(self.rows)
+            save(self.path, self.ds)
+            self.rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+class SearchCursor:
+    """
+    Reads rows of a feature class.
+    """
+    def __init__(self, in_table, field_names, where_clause=None):
+        delay('da.SearchCursor')
+        self.ds = _dataset(in_table)
+        self.fields = list(field_names)
+        _check_fields(self.ds, self.fields)
+
+    def __iter__(self):
+        for rec in self.ds['rows']:
+            yield tuple(_read(rec, name) for name in self.fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+class UpdateCursor(SearchCursor):
+    """
+    Reads rows of a feature class and writes updated rows back when closed.
+    """
+    def __init__(self, in_table, field_names, where_clause=None):
+        delay('da.UpdateCursor')
+        super().__init__(in_table, field_names, where_clause)
+        self.path = in_table
+        self.current = None
+        self.changed = False
+
+    def __iter__(self):
+        for rec in self.ds['rows']:
+            self.current = rec
+            yield [_read(rec, name) for name in self.fields]
+
+    def updateRow(self, row):
+        for name, value in zip(self.fields, row):
+            _write(self.current, name, value)
+        self.changed = True
+
+    def deleteRow(self):
+        self.ds['rows'].remove(self.current)
+        self.changed = True
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.changed:
+            save(self.path, self.ds)
+        return False
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""management.py: Data Management toolbox of the arcpy stand-in."""
+
+# SETUP
+
+import os
+import json
+
+from . import _base as _b
+
+# FUNCTIONS
+
+def _sr(spatial_reference):
+    if spatial_reference is None:
+        return None
+    if isinstance(spatial_reference, _b.SpatialReference):
+        return spatial_reference.factoryCode or spatial_reference.text
+    return spatial_reference
+
+def CreateFileGDB(out_folder_path, out_name, out_version='CURRENT'):
+    _b.delay('management.CreateFileGDB')
+    name = out_name if out_name.lower().endswith('.gdb') else out_name + '.gdb'
+    os.makedirs(os.path.join(out_folder_path, name), exist_ok=True)
+    return os.path.join(out_folder_path, name)
+
+def CreateFeatureclass(out_path, out_name, geometry_type='POLYGON', template=None, has_m='DISABLED',
+                       has_z='DISABLED', spatial_reference=None, *args, **kwargs):
+    _b.delay('management.CreateFeatureclass')
+    out_fc = os.path.join(out_path, out_name)
+    _b.check_output(out_fc)
+    _b.save(out_fc, _b.new_dataset('feature', geometry_type.upper(), _sr(spatial_reference)))
+    return out_fc
+
+def AddField(in_table, field_name, field_type, field_precision=None, field_scale=None, field_length=None,
+             field_alias=None, field_is_nullable='NULLABLE', field_is_required='NON_REQUIRED', field_domain=None):
+    _b.delay('management.AddField')
+    ds = _b.load(in_table)
+    if ds is None:
+        raise _b.ExecuteError(f'ERROR 000732: Input Table: Dataset {in_table} does not exist or is not supported')
+    if any(f['name'].lower() == field_name.lower() for f in ds['fields']):
+        raise _b.ExecuteError(f'ERROR 000012: {field_name} already exists')
+    ds['fields'].append({'name': field_name, 'type': field_type, 'length': field_length})
+    for row in ds['rows']:
+        row.setdefault(field_name, None)
+    _b.save(in_table, ds)
+    return in_table
+
+def Delete(in_data, data_type=None):
+    _b.delay('management.Delete')
+    if not _b.drop(in_data):
+        raise _b.ExecuteError(f'ERROR 000732: Input Data Element: Dataset {in_data} does not exist or is not supported')
+    return in_data
+
+def DefineProjection(in_dataset, coor_system):
+    _b.delay('management.DefineProjection')
+    ds = _b.load(in_dataset)
+    ds['sr'] = _sr(coor_system)
+    _b.save(in_dataset, ds)
+    return in_dataset
+
+def GetCount(in_rows):
+    _b.delay('management.GetCount')
+    return [str(len(_b.load(in_rows)['rows']))]
+
+def SaveToLayerFile(in_layer, out_layer, is_relative_path=None, version=None):
+    _b.delay('management.SaveToLayerFile')
+    with open(out_layer, 'w') as f:
+        json.dump(in_layer.to_layer_file(), f)
+    return out_layer
+
+def XYTableToPoint(in_table, out_feature_class, x_field, y_field, z_field=None, coordinate_system=None):
+    _b.delay('management.XYTableToPoint')
+    _b.check_output(out_feature_class)
+    import csv
+    ds = _b.new_dataset('feature', 'POINT', _sr(coordinate_system))
+    with open(in_table, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        names = [c for c in reader.fieldnames if c not in (x_field, y_field)]
+        ds['fields'] += [{'name': _b.ValidateFieldName(c), 'type': 'TEXT'} for c in names]
+        for i, rec in enumerate(reader):
+            row = {_b.ValidateFieldName(c): rec[c] for c in names}
+            row.update(OBJECTID=i + 1, SHAPE={'x': float(rec[x_field]), 'y': float(rec[y_field])})
+            ds['rows'].append(row)
+    _b.save(out_feature_class, ds)
+    return out_feature_class
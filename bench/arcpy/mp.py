@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+
+"""mp.py: Projects, maps, layers, symbology and layouts of the arcpy stand-in."""
+
+# SETUP
+
+import os
+import copy
+import json
+
+from . import _base as _b
+
+# layer properties each kind of layer supports
+layer_props = {'basemap': {'NAME', 'LONGNAME', 'VISIBLE', 'TRANSPARENCY'},
+               'feature': {'NAME', 'LONGNAME', 'VISIBLE', 'TRANSPARENCY', 'DATASOURCE', 'SHOWLABELS',
+                           'DEFINITIONQUERY', 'SYMBOLOGY', 'CONNECTIONPROPERTIES'},
+               'raster': {'NAME', 'LONGNAME', 'VISIBLE', 'TRANSPARENCY', 'DATASOURCE', 'SYMBOLOGY',
+                          'CONNECTIONPROPERTIES'},
+               'service': {'NAME', 'LONGNAME', 'VISIBLE', 'TRANSPARENCY', 'DATASOURCE', 'SHOWLABELS',
+                           'DEFINITIONQUERY', 'SYMBOLOGY'}}
+
+# label classes and fields of a layer added straight from a feature service
+service_labels = [f'Label Class {i}' for i in range(6)]
+service_fields = ['OBJECTID', 'NAME', 'Shape']
+
+# FUNCTIONS
+
+class Symbol:
+    """
+    Point, line or polygon symbol of a renderer.
+    """
+    def __init__(self, name='Default', color=None):
+        self.name = name
+        self.color = color or {'RGB': [130, 130, 130, 100]}
+        self.outlineColor = {'RGB': [110, 110, 110, 100]}
+        self.outlineWidth = 0.7
+        self.size = 8
+        self.angle = 0
+
+    def applySymbolFromGallery(self, filter, index=0):
+        _b.delay('mp.applySymbolFromGallery', 'map')
+        self.name = f'{filter}:{index}'
+
+    def listSymbolsFromGallery(self, filter):
+        _b.delay('mp.listSymbolsFromGallery', 'map')
+        return [Symbol(f'{filter}:{i}') for i in range(3)]
+
+class Item:
+    def __init__(self, value):
+        self.values = [[value]]
+        self.label = value
+        self.description = ''
+        self.symbol = Symbol()
+
+class ItemGroup:
+    def __init__(self, heading, items):
+        self.heading = heading
+        self.items = items
+
+class SimpleRenderer:
+    def __init__(self):
+        self.type = 'SimpleRenderer'
+        self.symbol = Symbol()
+        self.label = ''
+
+class UniqueValueRenderer:
+    """
+    Renderer with one symbol per unique value of its fields in the layer's data.
+    """
+    def __init__(self, source):
+        self.type = 'UniqueValueRenderer'
+        self.source = source
+        self._fields = []
+        self.groups = []
+
+    @property
+    def fields(self):
+        return self._fields
+
+    @fields.setter
+    def fields(self, names):
+        _b.delay('mp.UniqueValueRenderer.fields', 'map')
+        self._fields = list(names)
+        ds = _b.load(self.source) if self.source else None
+        rows = ds['rows'] if ds else []
+        values = sorted({','.join(str(row.get(n)) for n in self._fields) for row in rows})
+        self.groups = [ItemGroup(','.join(self._fields), [Item(v) for v in values])] if values else []
+
+class Symbology:
+    def __init__(self, kind, source):
+        self.source = source
+        self.renderer = SimpleRenderer() if kind in ('feature', 'service') else None
+        self.colorizer = _b.CIM(type='RasterStretchColorizer', gamma=1.0) if kind == 'raster' else None
+
+    def updateRenderer(self, renderer_type):
+        _b.delay('mp.updateRenderer', 'map')
+        self.renderer = UniqueValueRenderer(self.source) if renderer_type == 'UniqueValueRenderer' else SimpleRenderer()
+
+class LabelClass:
+    """
+    Label class of a layer, backed by the layer's CIM definition.
+    """
+    def __init__(self, layer, name):
+        self.layer = layer
+        self.name = name
+        self.expression = '$feature.NAME'
+        self.expressionEngine = 'Arcade'
+        self.SQLQuery = ''
+        self.visible = True
+
+    def getDefinition(self, cim_version='V3'):
+        return next(c for c in self.layer.getDefinition(cim_version).labelClasses if c.name == self.name)
+
+    def setDefinition(self, definition):
+        cim = self.layer.getDefinition('V3')
+        cim.labelClasses = [definition if c.name == self.name else c for c in cim.labelClasses]
+        self.layer.setDefinition(cim)
+
+class Layer:
+    """
+    Map layer drawing a dataset, a service or the basemap.
+
+    Parameters:
+    name (str): Name in the table of contents.
+    kind (str): 'basemap', 'feature', 'raster' or 'service'.
+    dataSource (str): Dataset path or service URL.
+    labels (list): Label class names.
+    """
+    def __init__(self, name, kind='feature', dataSource='', labels=None, fields=None):
+        self.name = name
+        self.kind = kind
+        self.dataSource = dataSource
+        self.label_names = list(labels if labels is not None else (['Class 1'] if kind == 'feature' else []))
+        self.service_fields = fields
+        self.visible = True
+        self.showLabels = False
+        self.transparency = 0
+        self.definitionQuery = ''
+        self._symbology = Symbology(kind, dataSource)
+        self._cim = None
+
+    @property
+    def longName(self):
+        return self.name
+
+    @property
+    def isFeatureLayer(self):
+        return self.kind in ('feature', 'service')
+
+    @property
+    def isRasterLayer(self):
+        return self.kind == 'raster'
+
+    @property
+    def isBasemapLayer(self):
+        return self.kind == 'basemap'
+
+    def supports(self, layer_property):
+        return layer_property.upper() in layer_props[self.kind]
+
+    @property
+    def symbology(self):
+        _b.delay('mp.symbology.get', 'map')
+        return copy.deepcopy(self._symbology)
+
+    @symbology.setter
+    def symbology(self, sym):
+        _b.delay('mp.symbology.set', 'map')
+        self._symbology = copy.deepcopy(sym)
+        self._cim = None
+
+    def getDefinition(self, cim_version='V3'):
+        _b.delay('mp.Layer.getDefinition', 'map')
+        if self._cim is None:
+            renderer = self._symbology.renderer
+            groups = [_b.CIM(heading=grp.heading,
+                             classes=[_b.CIM(label=itm.label, values=itm.values, symbol=_b.symbol_cim())
+                                      for itm in grp.items])
+                      for grp in getattr(renderer, 'groups', [])]
+            self._cim = _b.CIM(name=self.name, visibility=self.visible,
+                               labelClasses=[_b.label_class_cim(n) for n in self.label_names],
+                               renderer=_b.CIM(groups=groups, symbol=_b.symbol_cim()))
+        return copy.deepcopy(self._cim)
+
+    def setDefinition(self, definition):
+        _b.delay('mp.Layer.setDefinition', 'map')
+        self._cim = copy.deepcopy(definition)
+        self.label_names = [c.name for c in self._cim.labelClasses]
+
+    def listLabelClasses(self, wildcard=None):
+        return [LabelClass(self, n) for n in _b.wildcard(self.label_names, wildcard)]
+
+    @property
+    def connectionProperties(self):
+        return {'connection_info': {'database': os.path.dirname(self.dataSource)},
+                'dataset': os.path.basename(self.dataSource),
+                'workspace_factory': 'File Geodatabase'}
+
+    def updateConnectionProperties(self, current_connection_info, new_connection_info,
+                                   auto_update_joins_and_relates=True, validate=True, ignore_case=False):
+        _b.delay('mp.updateConnectionProperties', 'map')
+        if isinstance(new_connection_info, dict):
+            self.dataSource = os.path.join(new_connection_info['connection_info']['database'],
+                                           new_connection_info['dataset'])
+        else:
+            self.dataSource = self.dataSource.replace(current_connection_info, new_connection_info)
+        self.kind = 'feature' if self.kind == 'service' else self.kind
+        self._symbology.source = self.dataSource
+        if getattr(self._symbology.renderer, 'source', None) is not None:
+            self._symbology.renderer.source = self.dataSource
+
+    def to_layer_file(self):
+        """
+        Returns the layer's settings as saved in a layer file or project.
+        """
+        return {'name': self.name, 'kind': self.kind, 'dataSource': self.dataSource,
+                'labelClasses': self.label_names, 'fields': self.service_fields,
+                'visible': self.visible, 'showLabels': self.showLabels,
+                'transparency': self.transparency, 'definitionQuery': self.definitionQuery}
+
+    @classmethod
+    def from_layer_file(cls, d):
+        lyr = cls(d['name'], d.get('kind', 'feature'), d.get('dataSource', ''), d.get('labelClasses'),
+                  d.get('fields'))
+        for k in ('visible', 'showLabels', 'transparency', 'definitionQuery'):
+            if k in d:
+                setattr(lyr, k, d[k])
+        return lyr
+
+class LayerFile:
+    """
+    Layer file (.lyrx) written by SaveToLayerFile.
+    """
+    def __init__(self, layer_file_path):
+        _b.delay('mp.LayerFile', 'map')
+        self.filePath = layer_file_path
+        with open(layer_file_path) as f:
+            self.layers = [json.load(f)]
+
+    def listLayers(self, wildcard=None):
+        return [Layer.from_layer_file(d) for d in self.layers if _b.wildcard([d['name']], wildcard)]
+
+class Map:
+    """
+    Map with its table of contents, top layer first.
+    """
+    def __init__(self, name, layers=None):
+        self.name = name
+        self.mapType = 'MAP'
+        self.layers = layers if layers is not None else []
+        self.spatialReference = _b.SpatialReference(3857)
+
+    def listLayers(self, wildcard=None):
+        _b.delay('mp.listLayers', 'map')
+        return [lyr for lyr in self.layers if _b.wildcard([lyr.name], wildcard)]
+
+    def listTables(self, wildcard=None):
+        return []
+
+    def addDataFromPath(self, data_path, web_service_type='AUTO', custom_parameters=None):
+        _b.delay('mp.addDataFromPath', 'map')
+        if data_path.lower().startswith(('http://', 'https://')):
+            parts = data_path.rstrip('/').split('/')
+            if parts[-1].lower() == 'imageserver':
+                lyr = Layer(parts[-2], 'raster', data_path)
+            else:
+                lyr = Layer(f'{parts[-3]}_{parts[-1]}', 'service', data_path, service_labels, service_fields)
+        else:
+            ds = _b.load(data_path)
+            if ds is None:
+                raise ValueError(data_path)
+            lyr = Layer(os.path.basename(data_path), ds['kind'], data_path)
+        self.layers.insert(0, lyr)
+        return lyr
+
+    def addLayer(self, add_layer_or_layerfile, add_position='AUTO_ARRANGE'):
+        _b.delay('mp.addLayer', 'map')
+        if isinstance(add_layer_or_layerfile, LayerFile):
+            new = add_layer_or_layerfile.listLayers()
+        else:
+            new = [Layer.from_layer_file(add_layer_or_layerfile.to_layer_file())]
+        self.layers[0:0] = new
+        return new
+
+    def removeLayer(self, remove_layer):
+        _b.delay('mp.removeLayer', 'map')
+        self.layers.remove(remove_layer)
+
+class Element:
+    """
+    Layout element with a CIM definition.
+    """
+    def __init__(self, name, type, **kwargs):
+        self.name = name
+        self.type = type
+        self._cim = _b.CIM(name=name)
+        self.__dict__.update(kwargs)
+
+    def getDefinition(self, cim_version='V3'):
+        _b.delay('mp.Element.getDefinition', 'map')
+        return copy.deepcopy(self._cim)
+
+    def setDefinition(self, definition):
+        _b.delay('mp.Element.setDefinition', 'map')
+        self._cim = copy.deepcopy(definition)
+
+class Layout:
+    def __init__(self, name, pageWidth=8.5, pageHeight=11, pageUnits='INCH'):
+        self.name = name
+        self.pageWidth = pageWidth
+        self.pageHeight = pageHeight
+        self.pageUnits = pageUnits
+        self.elements = []
+
+    def listElements(self, element_type=None, wildcard=None):
+        return [e for e in self.elements
+                if (element_type is None or e.type.upper() == element_type.upper())
+                and _b.wildcard([e.name], wildcard)]
+
+    def createMapFrame(self, geometry, map, name=None):
+        _b.delay('mp.createMapFrame', 'map')
+        mf = Element(name or 'Map Frame', 'MAPFRAME_ELEMENT', map=map)
+        mf._cim.view = _b.CIM(camera=_b.CIM(x=0.0, y=0.0, scale=24000))
+        self.elements.append(mf)
+        return mf
+
+    def createMapSurroundElement(self, geometry, mapsurround_type, mapframe=None, style_item=None, name=None):
+        _b.delay('mp.createMapSurroundElement', 'map')
+        el = Element(name or mapsurround_type, 'MAPSURROUND_ELEMENT', mapFrame=mapframe)
+        self.elements.append(el)
+        return el
+
+    def getDefinition(self, cim_version='V3'):
+        return _b.CIM(name=self.name, elements=[e.getDefinition(cim_version) for e in self.elements])
+
+    def setDefinition(self, definition):
+        for e, cim in zip(self.elements, definition.elements):
+            e.setDefinition(cim)
+
+class StyleItem:
+    def __init__(self, name, itemType, style):
+        self.name = name
+        self.itemType = itemType
+        self.style = style
+
+class ArcGISProject:
+    """
+    Project holding maps and layouts, saved as JSON.
+
+    A project is opened from its path, or 'CURRENT'; a path whose file is not
+    a saved stand-in project opens the default project with one map, 'Map',
+    holding the 'Topographic' basemap.
+
+    Parameters:
+    aprx_path (str): Project path, or 'CURRENT'.
+    """
+    def __init__(self, aprx_path='CURRENT'):
+        _b.delay('mp.ArcGISProject', 'map')
+        self.filePath = aprx_path
+        self.homeFolder = os.path.dirname(os.path.abspath(aprx_path)) if aprx_path != 'CURRENT' else os.getcwd()
+        self.defaultGeodatabase = os.path.join(self.homeFolder, 'Default.gdb')
+        self.maps = [Map('Map', [Layer('Topographic', 'basemap')])]
+        self.layouts = []
+        self._styles = ['ArcGIS 2D']
+        saved = None
+        if aprx_path != 'CURRENT' and os.path.isfile(aprx_path):
+            try:
+                with open(aprx_path) as f:
+                    saved = json.load(f)
+            except ValueError:
+                saved = None
+        if saved:
+            self.maps = [Map(m['name'], [Layer.from_layer_file(d) for d in m['layers']])
+                         for m in saved.get('maps', [])]
+            self.layouts = [Layout(name) for name in saved.get('layouts', [])]
+            self._styles = saved.get('styles', self._styles)
+
+    def listMaps(self, wildcard=None):
+        return [m for m in self.maps if _b.wildcard([m.name], wildcard)]
+
+    def listLayouts(self, wildcard=None):
+        return [lyt for lyt in self.layouts if _b.wildcard([lyt.name], wildcard)]
+
+    def createMap(self, name, map_type='MAP'):
+        self.maps.append(Map(name))
+        return self.maps[-1]
+
+    def createLayout(self, page_width, page_height, page_units, name=None):
+        _b.delay('mp.createLayout', 'map')
+        self.layouts.append(Layout(name or 'Layout', page_width, page_height, page_units))
+        return self.layouts[-1]
+
+    def createTextElement(self, container, geometry, graphic_type=None, text=None, text_size=None,
+                          font_family_name=None, font_style_name=None, name=None, *args, **kwargs):
+        _b.delay('mp.createTextElement', 'map')
+        el = Element(name or 'Text', 'TEXT_ELEMENT', text=text, textSize=text_size)
+        container.elements.append(el)
+        return el
+
+    def listStyleItems(self, style_path, style_item_class=None, wildcard=None):
+        return [StyleItem(wildcard or style_item_class, style_item_class, style_path)]
+
+    @property
+    def styles(self):
+        return list(self._styles)
+
+    def updateStyles(self, style_list):
+        _b.delay('mp.updateStyles', 'map')
+        self._styles = list(style_list)
+
+    def save(self):
+        _b.delay('mp.ArcGISProject.save', 'map')
+        if self.filePath == 'CURRENT':
+            return
+        self.saveACopy(self.filePath)
+
+    def saveACopy(self, file_name):
+        data = {'maps': [{'name': m.name, 'layers': [lyr.to_layer_file() for lyr in m.layers]}
+                         for m in self.maps],
+                'layouts': [lyt.name for lyt in self.layouts],
+                'styles': self._styles}
+        with open(file_name + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(file_name + '.tmp', file_name)
@@ -5,13 +5,37 @@
 # SETUP
 
 import os
+import sys
+import json
+import tempfile
+import numpy as np
 import arcpy as ap
 
-# set ArcGIS project to current project
-aprx = ap.mp.ArcGISProject("CURRENT")
+# helper modules are kept alongside this script
+code_dir = r'C:\Users\kwong\Desktop\best-hikes\best-hikes'
+if code_dir not in sys.path:
+    sys.path.append(code_dir)
+
+import hike_tracks
+import hike_terrain
+import hike_services
+import hike_build
+import hike_landcover
+import hike_poi
+import hike_buffer
+import hike_crs
+import hike_stages
+import hike_trace
+import hike_memory
+import hike_project
+
+# set ArcGIS project to current project, or to a trail's copy in a batch build
+aprx = ap.mp.ArcGISProject(os.environ.get('HIKE_APRX', "CURRENT"))
 
 # FUNCTIONS
 
+reg = hike_project.Registry(aprx)
+
 def map_obj(map_name):
     """
     Identifies Map Object by provided name and returns result.
@@ -22,7 +46,7 @@ def map_obj(map_name):
     Returns:
     Map object
     """
-    return aprx.listMaps(map_name)[0]
+    return reg.map(map_name)
 
 def lyr_obj(map_obj, lyr_name):
     """
@@ -35,7 +59,7 @@ def lyr_obj(map_obj, lyr_name):
     Returns:
     Layer object
     """
-    return map_obj.listLayers(lyr_name)[0]
+    return reg.layer(map_obj, lyr_name)
 
 def lyt_obj(lyt_name):
     """
@@ -47,7 +71,23 @@ def lyt_obj(lyt_name):
     Returns:
     Layout object
     """
-    return aprx.listLayouts(lyt_name)[0]
+    return reg.layout(lyt_name)
+
+def add_data(m, path, **kwargs):
+    """
+    Adds data to a map and indexes the new layer.
+
+    Parameters:
+    m (map object): The map to add to.
+    path (str): Path or URL of the data.
+    kwargs: Passed on to addDataFromPath.
+
+    Returns:
+    lyr (Layer object): The added layer.
+    """
+    lyr = m.addDataFromPath(path, **kwargs)
+    reg.added(m, lyr)
+    return(lyr)
 
 def lyr_rename(lyr, newName):
     """
@@ -62,6 +102,7 @@ def lyr_rename(lyr, newName):
     """
     oldName = str(lyr.name)
     lyr.name = lyr.name.replace(lyr.name, newName)
+    reg.renamed(lyr, oldName)
     print(f'Layer \'{oldName}\' renamed to: \'{lyr.name}\'')
     pass
 
@@ -97,6 +138,7 @@ def lyr_remove(m, lyr):
     try:
         lyrname = lyr.name
         m.removeLayer(lyr)
+        reg.removed(m, lyr)
         print(f'Layer \'{lyrname}\' removed')
     except:
         print('Layer not found')
@@ -121,6 +163,7 @@ trails_dict = {'jms': {'trail_name': 'Dryden Rail Trail - Jim Schug Trail',
                        'mf_camScale': 35000,
                        'roads': 'roads8'},
                'lp': {'trail_name': 'Lindsay-Parsons Preserve',
+                      'route': 'Lindsay-Parsons',
                       'topo_ext': '-76.5307 42.3005 -76.4988 42.3259 ',
                       'mf_camx': -76.5155907,
                       'mf_camy': 42.3139858,
@@ -144,42 +187,308 @@ def color_builder(color, alpha):
     color_exp.append(alpha)
     return {'RGB': color_exp}
 
+## Spatial references
+wgs84 = hike_crs.wgs84_wkid
+utm18n = hike_crs.utm_wkid
+sr_cache = {}
+
+def sref(spec):
+    """
+    Returns the SpatialReference of a WKID or WKT, creating each one only once.
+
+    Parameters:
+    spec (int or str): WKID, or WKT text.
+
+    Returns:
+    SpatialReference object.
+    """
+    if spec not in sr_cache:
+        sr_cache[spec] = ap.SpatialReference(spec) if isinstance(spec, int) else ap.SpatialReference(text=spec)
+    return(sr_cache[spec])
+
 # PROJECT CODE
 m = map_obj('Map')
 
 ## Setting Directories
 aprx_dir = r'C:\Users\kwong\Desktop\best-hikes\SpatialFiles'
 aprx_gdb = r'C:\Users\kwong\Desktop\best-hikes\MyProject.gdb'
+# batch and benchmark builds point the script at their own folders
+aprx_dir = os.environ.get('HIKE_DATA', aprx_dir)
+aprx_gdb = os.environ.get('HIKE_GDB', aprx_gdb)
+if not ap.Exists(aprx_gdb):
+    ap.management.CreateFileGDB(os.path.dirname(aprx_gdb), os.path.basename(aprx_gdb))
+
+## Build manifest of derived datasets in aprx_gdb
+build_manifest = hike_build.Manifest(os.path.splitext(aprx_gdb)[0] + '.manifest.json')
+
+# stages completed by interrupted trail builds, see gen_trail
+journal_path = os.path.splitext(aprx_gdb)[0] + '.journal.json'
+
+# timing trace of the last trail build, viewable in chrome://tracing or Perfetto
+trace_path = os.path.splitext(aprx_gdb)[0] + '.trace.json'
+
+# working memory cap of the hillshade, contour and land cover stages, e.g. '1 GB'; None holds whole rasters
+memory_budget = os.environ.get('HIKE_MEMORY')
+
+def stage_layer(out_path):
+    """
+    Returns the map layer drawing a dataset, adding the dataset if no layer does.
+
+    Parameters:
+    out_path (str): Path of the dataset.
+
+    Returns:
+    lyr (Layer object): Layer drawing the dataset.
+    """
+    for lyr in m.listLayers():
+        if lyr.supports('DATASOURCE') and os.path.normcase(lyr.dataSource) == os.path.normcase(out_path):
+            return(lyr)
+    return(add_data(m, out_path))
+
+def build_stage(out_path, inputs, params, build):
+    """
+    Builds a derived dataset unless the manifest shows its inputs are unchanged.
+
+    Parameters:
+    out_path (str): Path of the output dataset.
+    inputs (list): Paths of input files.
+    params (dict): Stage parameters, e.g. extent or hillshade settings.
+    build (function): Creates the output dataset.
+
+    Returns:
+    lyr (Layer object): Layer drawing the output.
+    """
+    build_manifest.stage(out_path, inputs, params, build, ap.Exists, ap.management.Delete)
+    return(stage_layer(out_path))
 
 # Turn off basemap
 lyr = lyr_obj(m, 'Topographic')
 lyr.visible = False
 
 # TRACKS
-ap.conversion.GPXtoFeatures(
-    Input_GPX_File = os.path.join(aprx_dir, 'best-hikes-all-routes-22Jan25.gpx'),
-    Output_Feature_class = os.path.join(aprx_gdb, 'hike_routes_points'),
-    Output_Type = 'POINTS'
-)
+def write_tracks(out_fc, tracks):
+    """
+    Writes tracks to a new polyline feature class, one feature per track name.
 
-lyr = ap.management.PointsToLine(
-    Input_Features = 'hike_routes_points',
-    Output_Feature_Class = os.path.join(aprx_gdb, 'hike_routes_tracks'),
-    Line_Field = "Name",
-    Sort_Field = None,
-    Close_Line = "NO_CLOSE",
-    Line_Construction_Method = "CONTINUOUS",
-    Attribute_Source = "NONE",
-    Transfer_Fields = None
-)
+    Parameters:
+    out_fc (str): Path of the output polyline feature class.
+    tracks (dict): Track name to (N, 2+) array of lon, lat[, ele].
 
-lyr = lyr_obj(m, 'hike_routes_tracks')
+    Returns:
+    None
+    """
+    ap.management.CreateFeatureclass(os.path.dirname(out_fc), os.path.basename(out_fc),
+                                     'POLYLINE', spatial_reference=sref(wgs84))
+    ap.management.AddField(out_fc, 'Name', 'TEXT', field_length=255)
+
+    with ap.da.InsertCursor(out_fc, ['SHAPE@', 'Name']) as cur:
+        for name, coords in tracks.items():
+            if len(coords) < 2:
+                continue
+            shp = ap.AsShape(hike_tracks.track_json(coords), True)
+            cur.insertRow([shp, name])
+    pass
 
-sym = lyr.symbology
+def gen_tracks(gpx_path, out_fc):
+    """
+    Generates route polylines straight from a GPX file, one feature per track name.
 
-sym.renderer.symbol.outlineWidth = 3.4
-sym.renderer.symbol.outlineColor = {'RGB': [52, 52, 52, 60]}
-lyr.symbology = sym
+    The full-resolution polylines are kept as the source of the routes and
+    are not drawn; trail maps draw the copy simplify_routes writes.
+
+    Parameters:
+    gpx_path (str): Path to the GPX file.
+    out_fc (str): Path of the output polyline feature class.
+
+    Returns:
+    None
+    """
+    def build():
+        tracks = hike_tracks.read_gpx_tracks(gpx_path)
+        write_tracks(out_fc, tracks)
+        print(f'Tracks written: {hike_tracks.track_summary(tracks)}')
+
+    build_manifest.stage(out_fc, [gpx_path], {}, build, ap.Exists, ap.management.Delete)
+    pass
+
+def read_routes(fc, name_field='Name'):
+    """
+    Reads polyline features into coordinate arrays keyed by name.
+
+    Parameters:
+    fc (str): Path or layer name of a polyline feature class.
+    name_field (str): Field holding the route name.
+
+    Returns:
+    routes (dict): Route name to (N, 3) array of lon, lat, ele.
+    """
+    routes = {}
+    with ap.da.SearchCursor(fc, ['SHAPE@JSON', name_field]) as cur:
+        for shp_json, name in cur:
+            paths = json.loads(shp_json).get('paths', [])
+            xy = [pt[:2] + [float('nan')] for path in paths for pt in path]
+            routes[name] = np.array(xy, dtype=float).reshape(-1, 3)
+    return(routes)
+
+def simplify_routes(trail, routes, out_fc, width=3.4):
+    """
+    Writes the routes simplified for the trail's map scale to their own feature class.
+
+    The full-resolution source is never changed. The simplified copy is a
+    manifest stage, rebuilt when the routes, scale or line width change.
+
+    Parameters:
+    trail (str): Name of trail whose mf_camScale sets the tolerance.
+    routes (dict): Route name to full-resolution coordinate array.
+    out_fc (str): Path of the simplified polyline feature class.
+    width (float): Printed line width of the route symbol in points.
+
+    Returns:
+    lyr (Layer object): Layer drawing the simplified routes.
+    stats (dict): Vertex counts before and after simplification.
+    """
+    scale = trails_dict[trail]['mf_camScale']
+    simp, stats = hike_tracks.simplify_tracks(routes, scale, width)
+    # routes that collapse to a point keep their full-resolution line
+    simp = {name: coords if len(coords) > 1 else routes[name] for name, coords in simp.items()}
+    lyr = build_stage(out_fc, [], {'routes': hike_build.array_digest(routes), 'scale': scale, 'width': width},
+                      lambda: write_tracks(out_fc, simp))
+    print(f'{os.path.basename(out_fc)} simplified at 1:{scale}: '
+          f'{stats["removed"]} of {stats["before"]} vertices removed')
+    return(lyr, stats)
+
+# GPX file of every route, written to hike_routes_tracks by the tracks stage of a build
+routes_gpx = os.path.join(aprx_dir, r'best-hikes-all-routes-22Jan25.gpx')
+route_tracks = hike_tracks.read_gpx_tracks(routes_gpx)
+
+def gen_route_buffers(routes, distance='2000 Feet'):
+    """
+    Buffers every route in UTM 18N and writes the corridors to route_buffer.
+
+    Parameters:
+    routes (dict): Route name to coordinate array.
+    distance (str or float): Buffer distance, e.g. '2000 Feet', or meters.
+
+    Returns:
+    lyr (Layer object): Route buffer layer.
+    extents (dict): Route name to its buffer extent in UTM 18N and WGS84.
+    """
+    out_fc = os.path.join(aprx_gdb, r'route_buffer')
+    buffers, extents = hike_buffer.buffer_routes(routes, distance)
+
+    def build():
+        ap.management.CreateFeatureclass(os.path.dirname(out_fc), os.path.basename(out_fc), 'POLYGON',
+                                         spatial_reference=sref(utm18n))
+        ap.management.AddField(out_fc, 'Name', 'TEXT')
+        with ap.da.InsertCursor(out_fc, ['SHAPE@', 'Name']) as cur:
+            for name, poly in buffers.items():
+                cur.insertRow([ap.AsShape(poly, True), name])
+
+    lyr = build_stage(out_fc, [], {'routes': hike_build.array_digest(routes),
+                                   'distance': distance}, build)
+    return(lyr, extents)
+
+def route_trail(route):
+    """
+    Finds the trails_dict key of a route, by its 'route' entry or trail name.
+
+    Names must match exactly; trails named differently from their GPX route set 'route'.
+
+    Parameters:
+    route (str): Route name from the GPX file.
+
+    Returns:
+    Trail key (str), or None if no trail matches.
+    """
+    return(hike_tracks.route_trail(trails_dict, route))
+
+def trail_routes(trail):
+    """
+    Selects the routes of a trail.
+
+    Parameters:
+    trail (str): Name of trail.
+
+    Returns:
+    routes (dict): Route name to coordinate array.
+    """
+    return({name: coords for name, coords in route_tracks.items() if (route_trail(name) or name) == trail})
+
+# trails_dict as completed by frame_trails, read by hike_batch and hike_preview
+trails_json = os.path.join(aprx_dir, r'trails.json')
+
+def frame_trails(routes, overwrite=False, roads=None, out_path=trails_json):
+    """
+    Computes extents and cameras for every route and writes them into trails_dict.
+
+    Routes without a trail get a new entry keyed by route name, drawing the
+    roads layer of the trail with the nearest scale. Hand-tuned values are
+    kept unless overwrite is set. The completed trails_dict is saved so
+    batch builds and previews see the added trails too.
+
+    Parameters:
+    routes (dict): Route name to coordinate array.
+    overwrite (bool): Replace existing topo_ext and camera values.
+    roads (str): Roads service for new entries, or None to pick it by scale.
+    out_path (str): JSON file the completed trails_dict is saved to, or None to keep it in memory.
+
+    Returns:
+    frames (dict): Output of hike_tracks.track_frames.
+    """
+    frames = hike_tracks.track_frames(routes)
+    hike_tracks.add_frames(trails_dict, frames, overwrite, roads)
+    if out_path:
+        tmp = f'{out_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(trails_dict, f, indent=1, default=float)
+        os.replace(tmp, out_path)
+        print(f'Framed {len(frames)} routes in one pass; {len(trails_dict)} trails in trails_dict')
+    return(frames)
+
+def read_frames(path=trails_json):
+    """
+    Fills trails_dict with the trails and framing saved by frame_trails.
+
+    Values written in trails_dict above win, as they do in frame_trails.
+
+    Parameters:
+    path (str): JSON file saved by frame_trails.
+
+    Returns:
+    None
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            for key, attr in json.load(f).items():
+                trails_dict[key] = dict(attr, **trails_dict.get(key, {}))
+    pass
+
+if os.environ.get('HIKE_TRAIL'):
+    # batch workers share trails.json, so each only reads it and frames its own trail in memory
+    read_frames()
+    frame_trails(trail_routes(os.environ['HIKE_TRAIL']), out_path=None)
+else:
+    frame_trails(route_tracks)
+
+def gen_routes(trail, width=3.4):
+    """
+    Draws the routes simplified for a trail's map scale.
+
+    Parameters:
+    trail (str): Name of trail.
+    width (float): Printed line width of the routes in points.
+
+    Returns:
+    stats (dict): Vertex counts before and after simplification.
+    """
+    lyr, stats = simplify_routes(trail, route_tracks, os.path.join(aprx_gdb, r'hike_routes_simplified'), width)
+
+    sym = lyr.symbology
+
+    sym.renderer.symbol.outlineWidth = width
+    sym.renderer.symbol.outlineColor = {'RGB': [52, 52, 52, 60]}
+    lyr.symbology = sym
+    return(stats)
 
 def gen_flltPreserve():
     """
@@ -188,12 +497,14 @@ def gen_flltPreserve():
     Returns: 
     None
     """
-    lyr = ap.conversion.JSONToFeatures(
-        in_json_file=os.path.join(aprx_dir, r'fllt-preserve-boundaries.geojson'),
-        out_features=os.path.join(aprx_gdb, r'flltPreserve'),
-        geometry_type="POLYGON"
-    )
-    lyr = lyr_obj(m, 'flltPreserve')
+    in_json = os.path.join(aprx_dir, r'fllt-preserve-boundaries.geojson')
+    out_fc = os.path.join(aprx_gdb, r'flltPreserve')
+    lyr = build_stage(out_fc, [in_json], {'geometry_type': 'POLYGON'},
+                      lambda: ap.conversion.JSONToFeatures(
+                          in_json_file=in_json,
+                          out_features=out_fc,
+                          geometry_type="POLYGON"
+                      ))
     
     sym = lyr.symbology
     sym.updateRenderer('SimpleRenderer')
@@ -211,12 +522,14 @@ def gen_flltTrails():
     Returns:
     None
     """
-    lyr = ap.conversion.JSONToFeatures(
-        in_json_file=os.path.join(aprx_dir, r'fllt-trails.geojson'),
-        out_features=os.path.join(aprx_gdb, r'flltTrails'),
-        geometry_type="POLYLINE"
-    )
-    lyr = lyr_obj(m, 'flltTrails')
+    in_json = os.path.join(aprx_dir, r'fllt-trails.geojson')
+    out_fc = os.path.join(aprx_gdb, r'flltTrails')
+    lyr = build_stage(out_fc, [in_json], {'geometry_type': 'POLYLINE'},
+                      lambda: ap.conversion.JSONToFeatures(
+                          in_json_file=in_json,
+                          out_features=out_fc,
+                          geometry_type="POLYLINE"
+                      ))
     
     sym = lyr.symbology
     sym.updateRenderer('SimpleRenderer')
@@ -226,6 +539,115 @@ def gen_flltTrails():
     lyr.symbology = sym
     pass
 
+## Service layers
+nys_streets = r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Streets/MapServer'
+nys_hydro = r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Hydrography/MapServer'
+usa_rails = r'https://services.arcgis.com/P3ePLMYs2RVChkJx/ArcGIS/rest/services/USA_Railroads_1/FeatureServer'
+
+usa_nlcd = r'https://landscape10.arcgis.com/arcgis/rest/services/USA_NLCD_Land_Cover/ImageServer'
+
+svc_dir = os.path.join(aprx_dir, r'service_cache')
+svc_margin = 0.05
+svc_cache = hike_services.FeatureCache(os.path.join(svc_dir, r'features.sqlite'))
+
+def svc_template(svc_url, layer):
+    """
+    Returns the layer file and drawn fields of a service layer, saving them on first use.
+
+    The layer file keeps the service's symbology and label classes. The fields
+    are those referenced by its label expressions, renderer and queries.
+
+    Parameters:
+    svc_url (str): MapServer or FeatureServer URL.
+    layer (str): Layer id in the service.
+
+    Returns:
+    lyrx (str): Path of the saved layer file.
+    fields (list): Field names the layer draws with.
+    """
+    svc_name = svc_url.rstrip('/').split('/')[-2]
+    lyrx = os.path.join(svc_dir, f'{svc_name}_{layer}.lyrx')
+    fields_json = os.path.join(svc_dir, f'{svc_name}_{layer}.fields.json')
+    if not os.path.exists(lyrx) or not os.path.exists(fields_json):
+        live = add_data(m, '/'.join((svc_url, str(layer))),
+                                 web_service_type = 'ARCGIS_SERVER_WEB',
+                                 custom_parameters = {})
+        exprs = []
+        if live.supports('SHOWLABELS'):
+            for lblClass in live.listLabelClasses():
+                exprs += [lblClass.expression, lblClass.SQLQuery]
+        if live.supports('DEFINITIONQUERY'):
+            exprs.append(live.definitionQuery)
+        exprs += getattr(live.symbology.renderer, 'fields', None) or []
+        fields = hike_services.expression_fields(exprs, [f.name for f in ap.ListFields(live)])
+
+        # other builds may share the service cache, so write under temporary names and swap in
+        tmp = f'.{os.getpid()}.tmp'
+        ap.management.SaveToLayerFile(live, lyrx + tmp + '.lyrx')
+        lyr_remove(m, live)
+        with open(fields_json + tmp, 'w') as f:
+            json.dump(fields, f)
+        os.replace(lyrx + tmp + '.lyrx', lyrx)
+        os.replace(fields_json + tmp, fields_json)
+    with open(fields_json) as f:
+        fields = json.load(f)
+    return(lyrx, fields)
+
+def add_cached_layer(svc_url, layer, ext, name, margin=svc_margin):
+    """
+    Adds a service layer to the map from features queried for the trail extent.
+
+    Only features inside the extent plus a margin and only the fields the
+    layer draws with are requested. They are kept in the local service cache,
+    clipped to the padded extent, and drawn with the service's own symbology
+    and label classes from its saved layer file. The clipped feature class
+    is a manifest stage, rebuilt only when the cached features change.
+
+    Parameters:
+    svc_url (str): MapServer or FeatureServer URL.
+    layer (str): Layer id in the service.
+    ext (str): Extent as 'xmin ymin xmax ymax ' in WGS84.
+    name (str): Name of the layer in the table of contents.
+    margin (float): Fraction of the extent added on each side.
+
+    Returns:
+    lyr (Layer object): Layer drawing the cached features.
+    """
+    lyrx, fields = svc_template(svc_url, layer)
+    qry_ext = hike_services.pad_extent(ext, margin)
+    fset = svc_cache.get(svc_url, layer, qry_ext, fields)
+
+    fc_name = f'svc_{name}'
+    out_fc = os.path.join(aprx_gdb, fc_name)
+    clip_poly = ap.Extent(*qry_ext, spatial_reference=sref(wgs84)).polygon
+
+    def build():
+        # JSONToFeatures reads a file; a private temporary one keeps parallel builds apart
+        fd, json_path = tempfile.mkstemp(suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(fset, f)
+            with ap.EnvManager(addOutputsToMap=False):
+                ap.conversion.JSONToFeatures(json_path, r'memory\svc_features')
+                ap.analysis.PairwiseClip(r'memory\svc_features', clip_poly, out_fc)
+        finally:
+            os.remove(json_path)
+            if ap.Exists(r'memory\svc_features'):
+                ap.management.Delete(r'memory\svc_features')
+
+    build_manifest.stage(out_fc, [], {'svc': svc_url, 'layer': layer, 'ext': qry_ext, 'fields': fields,
+                                      'features': fset}, build, ap.Exists, ap.management.Delete)
+    print(f'Layer \'{name}\': {len(fset["features"])} features, {len(fields)} fields from service')
+
+    lyr = m.addLayer(ap.mp.LayerFile(lyrx))[0]
+    reg.added(m, lyr)
+    lyr.updateConnectionProperties(lyr.connectionProperties,
+                                   {'connection_info': {'database': aprx_gdb},
+                                    'dataset': fc_name,
+                                    'workspace_factory': 'File Geodatabase'})
+    lyr_rename(lyr, name)
+    return(lyr)
+
 roads_svc = {'roads4': '4',
                      'roads5': '5',
                      'roads6': '6',
@@ -234,19 +656,18 @@ roads_svc = {'roads4': '4',
                      'roads9': '9',
                      'roads10': '10'}
 
-def gen_roads(scale):
+def gen_roads(scale, ext):
     """
     Generates layer of NYS roads as polyline.
 
+    Parameters:
+    scale (str): Layer id of the NYS_Streets scale level.
+    ext (str): Extent of the trail map.
+
     Returns:
     None
     """
-    svcpath = r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Streets/MapServer/'
-    
-    lyr = m.addDataFromPath(''.join((svcpath, scale)),
-                     web_service_type = 'ARCGIS_SERVER_WEB',
-                     custom_parameters = {})
-    lyr_rename(lyr, 'roads')
+    lyr = add_cached_layer(nys_streets, scale, ext, 'roads')
     
     lyr = lyr_obj(m, 'roads')
     sym = lyr.symbology 
@@ -269,45 +690,52 @@ def gen_roadsLabels(lyr, labels=True):
     Returns:
     None
     """
+    with hike_project.CIMEdit(lyr) as tx:
+        lbl_classes = tx.label_classes()
+        if lyr.supports('SHOWLABELS'):
+            lbl_cim = lbl_classes[3]
+            lbl_cim.textSymbol.symbol.fontFamilyName = 'Times New Roman'
+            lbl_cim.textSymbol.symbol.height = 7
+            lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
+        roads_label_cim(lbl_classes)
     if lyr.supports('SHOWLABELS'):
-        lblClass = lyr.listLabelClasses()[3]
-        lbl_cim = lblClass.getDefinition('V3')
-        lbl_cim.textSymbol.symbol.fontFamilyName = 'Times New Roman'
-        lbl_cim.textSymbol.symbol.height = 7
-        lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
-        lblClass.setDefinition(lbl_cim)
         lyr.showLabels = labels
+    pass
 
-    for lblClass in lyr.listLabelClasses():
-        if lblClass.name == 'Label Class 3':
-            hwynum_cim = lblClass.getDefinition('V3')
-            hwynum_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
-            hwynum_cim.textSymbol.symbol.callout = 'PointSymbol'
-            hwynum_cim.visibility = True
-            lblClass.setDefinition(hwynum_cim)
-        elif lblClass.name == 'Label Class 5':
-            hwyname_cim = lblClass.getDefinition('V3')
-            hwyname_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
-            hwyname_cim.maplexLabelPlacementProperties.linePlacementMethod = 'OffsetCurvedFromLine'
-            hwyname_cim.visibility = True
-            lblClass.setDefinition(hwyname_cim)
+def roads_label_cim(lbl_classes):
+    """
+    Shows highway number and name labels on roads and hides the other label classes.
+
+    Parameters:
+    lbl_classes (list): Label class CIM definitions of the roads layer.
+
+    Returns:
+    None
+    """
+    for lbl_cim in lbl_classes:
+        if lbl_cim.name == 'Label Class 3':
+            lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
+            lbl_cim.textSymbol.symbol.callout = 'PointSymbol'
+            lbl_cim.visibility = True
+        elif lbl_cim.name == 'Label Class 5':
+            lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
+            lbl_cim.maplexLabelPlacementProperties.linePlacementMethod = 'OffsetCurvedFromLine'
+            lbl_cim.visibility = True
         else:
-            lbl_cim = lblClass.getDefinition('V3')
             lbl_cim.visibility = False
-            lblClass.setDefinition(lbl_cim)
-        pass
+    pass
 
-def gen_rails():
+def gen_rails(ext):
     """
     Generates layer of railroads as polyline.
 
+    Parameters:
+    ext (str): Extent of the trail map.
+
     Returns:
     None
     """
-    lyr = m.addDataFromPath(r'https://services.arcgis.com/P3ePLMYs2RVChkJx/ArcGIS/rest/services/USA_Railroads_1/FeatureServer/0',
-                     web_service_type = 'ARCGIS_SERVER_WEB',
-                     custom_parameters = {})
-    lyr_rename(lyr, 'rails')
+    lyr = add_cached_layer(usa_rails, '0', ext, 'rails')
     
     sym = lyr.symbology 
     sym.updateRenderer('SimpleRenderer')
@@ -320,17 +748,17 @@ def gen_rails():
 # 33 jim schug trail, z = 40,000
 # road name lbl class 5, hwy_num class 3
 
-def gen_waterfeatures(topo=False, labels=False):
+def gen_waterfeatures(ext, topo=False, labels=False):
     """
     Generates layer of water features as polygon.
 
+    Parameters:
+    ext (str): Extent of the trail map.
+
     Returns:
     None
     """
-    lyr = m.addDataFromPath(r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Hydrography/MapServer/9',
-                     web_service_type = 'ARCGIS_SERVER_WEB',
-                     custom_parameters = {})
-    lyr_rename(lyr, 'hydro')
+    lyr = add_cached_layer(nys_hydro, '9', ext, 'hydro')
     
     sym = lyr.symbology
     sym.updateRenderer('SimpleRenderer')
@@ -360,27 +788,26 @@ def gen_waterlabels(lyr, labels):
     None
     """
     if lyr.supports('SHOWLABELS'):
-        lblClass = lyr.listLabelClasses()[0]
-        lbl_cim = lblClass.getDefinition('V3')
-        lbl_cim.textSymbol.symbol.fontFamilyName = 'Times New Roman'
-        lbl_cim.textSymbol.symbol.height = 7
-        lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
-        lblClass.setDefinition(lbl_cim)
+        with hike_project.CIMEdit(lyr) as tx:
+            lbl_cim = tx.label_classes()[0]
+            lbl_cim.textSymbol.symbol.fontFamilyName = 'Times New Roman'
+            lbl_cim.textSymbol.symbol.height = 7
+            lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
         lyr.showLabels = labels
     pass
 
 # Need to add labels to water bodies
-def gen_streams(topo=False, labels=False):
+def gen_streams(ext, topo=False, labels=False):
     """
     Generates stream features as polyline.
 
+    Parameters:
+    ext (str): Extent of the trail map.
+
     Returns:
     None
     """
-    lyr = m.addDataFromPath(r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Hydrography/MapServer/15',
-                     web_service_type = 'ARCGIS_SERVER_WEB',
-                     custom_parameters = {})
-    lyr_rename(lyr, 'streams')
+    lyr = add_cached_layer(nys_hydro, '15', ext, 'streams')
     
     sym = lyr.symbology
     sym.updateRenderer('SimpleRenderer')
@@ -407,14 +834,15 @@ def gen_streamlabels(lyr, labels):
     None
     """
     if lyr.supports('SHOWLABELS'):
-        lblClass = lyr.listLabelClasses()[0]
-        lbl_cim = lblClass.getDefinition('V3')
-        lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
-        lblClass.setDefinition(lbl_cim)
+        with hike_project.CIMEdit(lyr) as tx:
+            lbl_cim = tx.label_classes()[0]
+            lbl_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
         lyr.showLabels = labels
     pass
 # Need to reformat labels
 
+tompkins_dem = r'https://elevation.its.ny.gov/arcgis/rest/services/County_Tompkins2008_2_meter/ImageServer'
+
 def addTompkinsDEM():
     """
     Adds DEM layer of Tompkins County.
@@ -422,27 +850,152 @@ def addTompkinsDEM():
     Returns:
     lyr (Layer object): Tompkins County DEM
     """
-    lyr = m.addDataFromPath(r'https://elevation.its.ny.gov/arcgis/rest/services/County_Tompkins2008_2_meter/ImageServer',
+    lyr = add_data(m, tompkins_dem,
                      web_service_type = 'ARCGIS_SERVER_WEB',
                      custom_parameters = {})
     return(lyr)
 
-ocs = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],VERTCS["WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PARAMETER["Vertical_Shift",0.0],PARAMETER["Direction",1.0],UNIT["Meter",1.0]]'
+ocs = wgs84
 ext_lp1 = '-76.5271191647879 42.3051024869337 -76.5054331313753 42.3211945965332 '
 
 ext_lp3 = '-76.525825108996 42.3054403361241 -76.5044214385469 42.3202781463147 '
 
-def createHillshade(ocs, ext, gdb):
-    with arcpy.EnvManager(extent = (ext + ocs)):
-        arcpy.ddd.HillShade(
-            in_raster="County_Tompkins2008_2_meter",
-            out_raster=os.path.join(gdb, r'HillSha_Coun1'),
-            azimuth=315,
-            altitude=45,
-            model_shadows="NO_SHADOWS",
-            z_factor=1
-        )
-    lyr = lyr_obj(m, 'HillSha_Coun1')
+dem_store_dir = os.path.join(aprx_dir, r'dem_store_tompkins')
+
+def open_dem_store(in_raster=tompkins_dem, path=dem_store_dir):
+    """
+    Opens the local Tompkins DEM store, creating an empty one on first use.
+
+    Parameters:
+    in_raster (str): Source raster path or service URL.
+    path (str): Directory of the store.
+
+    Returns:
+    store (DEMStore): Memory-mapped DEM store.
+    fetch (function): Reads a cell window from the source raster.
+    """
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        store = hike_terrain.DEMStore(path, 'r+')
+    else:
+        ras = ap.Raster(in_raster)
+        store = hike_terrain.DEMStore.create(path, (ras.height, ras.width),
+                                             (ras.extent.XMin, ras.extent.YMax),
+                                             (ras.meanCellWidth, ras.meanCellHeight),
+                                             ras.spatialReference.exportToString())
+
+    def fetch(r0, r1, c0, c1):
+        # plain REST so tiles can be pulled from worker threads
+        x0, y0 = store.meta['origin']
+        cx, cy = store.meta['cellsize']
+        bbox = (x0 + c0 * cx, y0 - r1 * cy, x0 + c1 * cx, y0 - r0 * cy)
+        return hike_services.fetch_image(in_raster, bbox, (c1 - c0, r1 - r0), store.meta['wkt'])
+    return(store, fetch)
+
+def dem_extent(ext, ocs, wkt):
+    """
+    Projects an extent string into the DEM coordinate system.
+
+    Uses the cached NumPy transforms, and arcpy only for coordinate systems
+    they do not cover.
+
+    Parameters:
+    ext (str): Extent as 'xmin ymin xmax ymax ' in the ocs coordinate system.
+    ocs (int or str): WKID or WKT of the coordinate system the extent is given in.
+    wkt (str): WKT of the DEM coordinate system.
+
+    Returns:
+    List of xmin, ymin, xmax, ymax in DEM coordinates.
+    """
+    try:
+        return(hike_crs.transform_extent(ext, ocs, wkt))
+    except ValueError:
+        xmin, ymin, xmax, ymax = [float(v) for v in ext.split()]
+        win = ap.Extent(xmin, ymin, xmax, ymax, spatial_reference=sref(ocs)).projectAs(sref(wkt))
+        return([win.XMin, win.YMin, win.XMax, win.YMax])
+
+def read_dem_window(ext, ocs):
+    """
+    Reads the DEM cells covering an extent from the local DEM store.
+
+    Tiles not yet in the store are pulled from the county ImageServer once.
+
+    Parameters:
+    ext (str): Extent as 'xmin ymin xmax ymax ' in the ocs coordinate system.
+    ocs (int or str): WKID or WKT of the coordinate system the extent is given in.
+
+    Returns:
+    dem (ndarray): 2D view of the DEM window, NoData as NaN.
+    ll (Point): Lower-left corner of the window in DEM coordinates.
+    cellsize (tuple): Cell width and height.
+    sr (SpatialReference): Spatial reference of the DEM.
+    """
+    store, fetch = open_dem_store()
+    sr = sref(store.meta['wkt'])
+    dem, ul = store.window(*dem_extent(ext, ocs, store.meta['wkt']), fetch)
+    cellsize = tuple(store.meta['cellsize'])
+    ll = ap.Point(ul[0], ul[1] - dem.shape[0] * cellsize[1])
+    return(dem, ll, cellsize, sr)
+
+def gen_profiles(trail, spacing=20.0):
+    """
+    Computes distance, elevation gain and loss and elevation profiles for the routes of a trail.
+
+    Elevations are sampled from the local Tompkins DEM store under each route
+    vertex, and the results are cached next to the project geodatabase.
+
+    Parameters:
+    trail (str): Name of trail.
+    spacing (float): Profile sample spacing in meters.
+
+    Returns:
+    stats (dict): Route name to distance, gain, loss, min and max elevation in meters.
+    profiles (dict): Route name to (M, 2) array of distance and elevation.
+    """
+    routes = trail_routes(trail)
+    out_path = os.path.splitext(aprx_gdb)[0] + f'.{trail}.profiles.npz'
+
+    def build():
+        store, fetch = open_dem_store()
+        to_dem = hike_crs.transformer(wgs84, store.meta['wkt'])
+        stats, profiles = hike_tracks.track_profiles(routes, lambda lon, lat: store.sample(*to_dem(lon, lat), fetch), spacing)
+        hike_tracks.save_profiles(out_path, stats, profiles)
+
+    build_manifest.stage(out_path, [], {'routes': hike_build.array_digest(routes), 'dem': tompkins_dem,
+                                        'spacing': spacing}, build)
+    stats, profiles = hike_tracks.load_profiles(out_path)
+    for name, st in stats.items():
+        if np.isnan(st['gain']):
+            print(f'{name}: {st["distance"] / 1609.344:.2f} mi, no DEM coverage')
+            continue
+        print(f'{name}: {st["distance"] / 1609.344:.2f} mi, +{st["gain"] * 3.28084:.0f} ft / '
+              f'-{st["loss"] * 3.28084:.0f} ft')
+    return(stats, profiles)
+
+def createHillshade(ocs, ext, gdb, params=hike_terrain.hillshade_params):
+    """
+    Creates the hillshade for an extent from the local Tompkins DEM store with the NumPy engine.
+
+    Parameters:
+    ocs (int or str): WKID or WKT of the coordinate system of the extent.
+    ext (str): Extent as 'xmin ymin xmax ymax '.
+    gdb (str): Geodatabase to write HillSha_Coun1 into.
+    params (dict): Hillshade azimuth, altitude and z_factor.
+
+    Returns:
+    lyr (Layer object): Hillshade layer.
+    """
+    out_ras = os.path.join(gdb, r'HillSha_Coun1')
+
+    def build():
+        with hike_memory.MemoryMonitor('hillshade', memory_budget is not None):
+            dem, ll, cellsize, sr = read_dem_window(ext, ocs)
+            hs = hike_terrain.hillshade(dem, cellsize, budget=memory_budget, **params)
+            # NaN cells of the float hillshade are written as NoData
+            ras = ap.NumPyArrayToRaster(hs, ll, cellsize[0], cellsize[1])
+            ras.save(out_ras)
+            ap.management.DefineProjection(out_ras, sr)
+
+    lyr = build_stage(out_ras, [], dict(params, dem=tompkins_dem, ext=ext, ocs=ocs), build)
     return(lyr)
 
 def editHillshade(lyr):
@@ -458,31 +1011,119 @@ def editHillshade(lyr):
     lyr.symbology = sym
     pass
 
-def gen_fields(trail):
+contour_symbols = {'1': {'color': {'RGB': [64, 64, 64, 100]},
+                          'outlineWidth': 1},
+                   '0': {'color': {'RGB': [80, 80, 80, 100]},
+                         'outlineWidth': 0.3}}
+
+def gen_contours(trail, ocs, params=hike_terrain.contour_params, detail=0.5):
+    """
+    Traces contours for the trail's topo extent from the local Tompkins DEM store.
+
+    Lines are classified major or minor by elevation as they are traced, so
+    no per-row field calculation is needed.
+
+    Parameters:
+    trail (str): Name of trail to generate contours.
+    ocs (int or str): WKID or WKT of the coordinate system of the extent.
+    params (dict): Contour interval, major interval and z_factor.
+    detail (float): Smallest line detail kept on the printed map, in points.
+
+    Returns:
+    lyr (Layer object): Contours layer.
+    """
+    ext = trails_dict[trail]['topo_ext']
+    tol = hike_tracks.simplify_tolerance(trails_dict[trail]['mf_camScale'], detail)
+    out_fc = os.path.join(aprx_gdb, r'Contours')
+
+    def build():
+        with hike_memory.MemoryMonitor('contours', memory_budget is not None):
+            dem, ll, cellsize, sr = read_dem_window(ext, ocs)
+            ul = (ll.X, ll.Y + dem.shape[0] * cellsize[1])
+            lines, stats = hike_terrain.contours(dem, cellsize, ul, tol=tol / sr.metersPerUnit,
+                                                 budget=memory_budget, **params)
+            ap.management.CreateFeatureclass(os.path.dirname(out_fc), os.path.basename(out_fc),
+                                             'POLYLINE', spatial_reference=sr)
+            ap.management.AddField(out_fc, 'CONTOUR', 'DOUBLE')
+            ap.management.AddField(out_fc, 'major', 'TEXT', field_length=1)
+            with ap.da.InsertCursor(out_fc, ['SHAPE@', 'CONTOUR', 'major']) as cur:
+                for level, major, xy in lines:
+                    cur.insertRow([ap.AsShape({'paths': [xy.tolist()]}, True), level, str(int(major))])
+        print(f'Contours: {stats["lines"]} lines on {stats["levels"]} levels in {stats["strips"]} strips, '
+              f'{stats["vertices_before"]} -> {stats["vertices_after"]} vertices')
+
+    lyr = build_stage(out_fc, [], dict(params, dem=tompkins_dem, ext=ext, ocs=ocs, tol=round(tol, 3)), build)
+    contour_sym(lyr)
+    return(lyr)
+
+def contour_sym(lyr):
+    """
+    Draws major contours heavier than minor ones.
+
+    Parameters:
+    lyr (Layer object): Contours layer.
+
+    Returns:
+    None
+    """
+    lyr_rename(lyr, 'Contours')
+    sym = lyr.symbology
+    sym.updateRenderer('UniqueValueRenderer')
+    sym.renderer.fields = ['major']
+    for grp in sym.renderer.groups:
+        for itm in grp.items:
+            itm.symbol.color = contour_symbols[itm.values[0][0]]['color']
+            itm.symbol.outlineWidth = contour_symbols[itm.values[0][0]]['outlineWidth']
+    lyr.symbology = sym
+    pass
+
+def gen_fields(trail, classes=hike_landcover.stipple_classes, detail=1.0):
     """
     Generate fields as polygon layer from raster NLCD.
 
+    Only the land cover classes drawn on the map are traced into polygons;
+    cells of every other class are dropped before any geometry is built.
+    Shared edges are smoothed and simplified once for the trail's print
+    scale, so neighbouring fields stay gap-free.
+
     Parameters:
     trail (str): Name of trail to generate fields.
+    classes (list): NLCD class codes to vectorize.
+    detail (float): Smallest edge detail kept on the printed map, in points.
 
     Returns:
     None
     """
-    
-    nlcd = m.addDataFromPath(r'https://www.arcgis.com/home/item.html?id=3ccf118ed80748909eb85c6d262b426f')
-
-    ext_str = trails_dict[trail]['topo_ext'] + ocs
-     
-    with ap.EnvManager(extent=ext_str):
-        lyr = ap.conversion.RasterToPolygon(
-            in_raster="USA NLCD Land Cover",
-            out_polygon_features=os.path.join(aprx_gdb, r'RasterT_USA_NLC2'),
-            simplify="NO_SIMPLIFY",
-            raster_field="Value",
-            create_multipart_features="MULTIPLE_OUTER_PART",
-            max_vertices_per_feature=None
-        )
-    fields_sym()
+    ext = trails_dict[trail]['topo_ext']
+    scale = trails_dict[trail]['mf_camScale']
+    tol = hike_tracks.simplify_tolerance(scale, detail)
+    nlcd_npz = nlcd_window(trail)
+    out_fc = os.path.join(aprx_gdb, r'RasterT_USA_NLC2')
+
+    def build():
+        with hike_memory.MemoryMonitor('fields', memory_budget is not None):
+            nlcd = np.load(nlcd_npz)
+            ap.management.CreateFeatureclass(os.path.dirname(out_fc), os.path.basename(out_fc),
+                                             'POLYGON', spatial_reference=sref(wgs84))
+            ap.management.AddField(out_fc, 'gridcode', 'LONG')
+            total = {'strips': 0, 'arcs': 0, 'vertices_before': 0, 'vertices_after': 0,
+                     'trace_seconds': 0, 'generalize_seconds': 0}
+            # each strip's polygons are written before the next strip is traced
+            with ap.da.InsertCursor(out_fc, ['SHAPE@', 'gridcode']) as cur:
+                for feats, stats in hike_landcover.generalize_strips(nlcd['codes'], nlcd['extent'], classes,
+                                                                     tol, budget=memory_budget):
+                    for code, poly in feats:
+                        cur.insertRow([ap.AsShape(poly, True), code])
+                    total['strips'] += 1
+                    for k in total.keys() - {'strips'}:
+                        total[k] += stats[k]
+        print(f'Land cover at 1:{scale} ({tol:.1f} m): {total["arcs"]} shared arcs in {total["strips"]} strips, '
+              f'{total["vertices_before"]} -> {total["vertices_after"]} vertices, '
+              f'traced in {total["trace_seconds"]:.2f} s, generalized in {total["generalize_seconds"]:.2f} s')
+
+    lyr = build_stage(out_fc, [nlcd_npz], {'ext': ext, 'classes': classes, 'tol': round(tol, 3),
+                                           'budget': memory_budget}, build)
+    fields_sym(lyr)
     pass
 
 def fields_sym(lyr=False):
@@ -514,12 +1155,9 @@ def fields_sym(lyr=False):
     lyr.symbology = sym
 
     # edit symbol in cim
-    lyr_cim = lyr.getDefinition('V3')
-    for grp in lyr_cim.renderer.groups:
-        for grpclass in grp.classes:
-            if grpclass.label in ['71', '81']:
-                grpclass.symbol.symbol.symbolLayers[2].color.values = [255, 255, 255, 0]
-    lyr.setDefinition(lyr_cim)
+    with hike_project.CIMEdit(lyr) as tx:
+        for grpclass in tx.renderer_classes(['71', '81']):
+            grpclass.symbol.symbol.symbolLayers[2].color.values = [255, 255, 255, 0]
     
     pass
 
@@ -600,21 +1238,45 @@ def addStyle(styl_path):
 
 addStyle(os.path.join(aprx_styl, r'Government.stylx'))
 
-def add_POI():
+poi_index = hike_poi.POIIndex(os.path.join(aprx_dir, r'POI_hikes_18Jan25.csv'))
+
+def add_POI(trail, route=None, distance=609.6):
     """
-    Generates layer of points of interest as points.
+    Generates layer of the points of interest shown on a trail's map.
+
+    Points are picked from the grid index over the POI table, so only the
+    trail's points are written and symbolized.
+
+    Parameters:
+    trail (str): Name of trail whose topo_ext selects the points.
+    route (ndarray): Route coordinates; selects points within distance of it instead [opt]
+    distance (float): Route buffer distance in meters.
 
     Returns:
     None
     """
-    ap.management.XYTableToPoint(
-        in_table = os.path.join(aprx_dir, r'POI_hikes_18Jan25.csv'),
-        out_feature_class = os.path.join(aprx_gdb, r'POI_hikes'),
-        x_field="longitude",
-        y_field="latitude",
-        z_field=None,
-        coordinate_system='GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]];-400 -400 1000000000;-100000 10000;-100000 10000;8.98315284119521E-09;0.001;0.001;IsHighPrecision'
-    )
+    out_fc = os.path.join(aprx_gdb, r'POI_hikes')
+    if route is None:
+        ext = [float(v) for v in trails_dict[trail]['topo_ext'].split()]
+        idx = poi_index.within(*ext)
+        params = {'ext': ext}
+    else:
+        idx = poi_index.near(route, distance)
+        params = {'route': hike_build.array_digest({trail: route}), 'distance': distance}
+    fields = [ap.ValidateFieldName(c, aprx_gdb) for c in poi_index.columns]
+
+    def build():
+        ap.management.CreateFeatureclass(os.path.dirname(out_fc), os.path.basename(out_fc),
+                                         'POINT', spatial_reference=sref(wgs84))
+        # field types as XYTableToPoint reads them from the CSV
+        for name, field_type in zip(fields, poi_index.types):
+            ap.management.AddField(out_fc, name, field_type)
+        with ap.da.InsertCursor(out_fc, ['SHAPE@XY'] + fields) as cur:
+            for xy, values in poi_index.records(idx):
+                cur.insertRow([xy] + values)
+        print(f'POI: {len(idx)} of {len(poi_index.xy)} points selected for {trail}')
+
+    lyr = build_stage(out_fc, [poi_index.csv_path], params, build)
     
     poi_symbols = {'Bus stop': {'icon': 'Mass Transit',
                                 'index': 0},
@@ -634,7 +1296,6 @@ def add_POI():
                                'index': 0}
                   }
     
-    lyr = lyr_obj(m, 'POI_hikes')
     sym = lyr.symbology
     
     sym.updateRenderer('UniqueValueRenderer')
@@ -649,29 +1310,231 @@ def add_POI():
     lyr.symbology = sym
     pass
 
+def trail_services(trail):
+    """
+    Lists the service layers drawn on a trail map.
+
+    Parameters:
+    trail (str): Name of trail.
+
+    Returns:
+    Dictionary of layer name to (service URL, layer id).
+    """
+    return {'hydro': (nys_hydro, '9'),
+            'streams': (nys_hydro, '15'),
+            'roads': (nys_streets, roads_svc[trails_dict[trail]['roads']]),
+            'rails': (usa_rails, '0')}
+
+def fetch_nlcd(ext, token=None, cell=30):
+    """
+    Reads the NLCD land cover codes for an extent at roughly native resolution.
+
+    Parameters:
+    ext (str or sequence): Extent in WGS84.
+    token (str): ArcGIS Online token for the subscriber NLCD service.
+    cell (float): Approximate cell size in meters.
+
+    Returns:
+    Dictionary of the class code array and its extent.
+    """
+    xmin, ymin, xmax, ymax = hike_services.pad_extent(ext, 0)
+    x0, y0, x1, y1 = hike_crs.transform_extent((xmin, ymin, xmax, ymax), wgs84, utm18n)
+    ncols = max(int((x1 - x0) / cell), 1)
+    nrows = max(int((y1 - y0) / cell), 1)
+    codes = hike_services.fetch_image(usa_nlcd, (xmin, ymin, xmax, ymax), (ncols, nrows),
+                                      wgs84, 'U8', token)
+    return {'codes': codes, 'extent': [xmin, ymin, xmax, ymax]}
+
+def save_nlcd(nlcd_npz, ext, token=None):
+    """
+    Fetches the NLCD window of an extent and swaps it into the service cache in one step.
+
+    Parameters:
+    nlcd_npz (str): Output .npz path.
+    ext (str or sequence): Extent in WGS84.
+    token (str): ArcGIS Online token for the subscriber NLCD service.
+
+    Returns:
+    None
+    """
+    tmp = f'{nlcd_npz}.{os.getpid()}.tmp.npz'
+    np.savez_compressed(tmp, **fetch_nlcd(ext, token))
+    os.replace(tmp, nlcd_npz)
+
+def nlcd_window(trail):
+    """
+    Returns the local NLCD window of a trail, fetching it if it is not cached yet.
+
+    Parameters:
+    trail (str): Name of trail.
+
+    Returns:
+    Path of nlcd_<trail>.npz (str)
+    """
+    nlcd_npz = os.path.join(svc_dir, f'nlcd_{trail}.npz')
+    if not os.path.exists(nlcd_npz):
+        token = (ap.GetSigninToken() or {}).get('token')
+        save_nlcd(nlcd_npz, trails_dict[trail]['topo_ext'], token)
+    return(nlcd_npz)
+
+def trail_fetch_jobs(trail):
+    """
+    Lists the remote inputs of a trail as independent fetch jobs.
+
+    The service features land in the service cache, the DEM tiles in the DEM
+    store and the NLCD window, if not cached yet, in nlcd_<trail>.npz, where
+    the gen_* functions pick them up without further requests.
+
+    Parameters:
+    trail (str): Name of trail.
+
+    Returns:
+    jobs (dict): Job name ('hydro', 'streams', 'roads', 'rails', 'dem', 'nlcd') to blocking callable.
+    """
+    ext = trails_dict[trail]['topo_ext']
+    qry_ext = hike_services.pad_extent(ext, svc_margin)
+    jobs = {}
+    for name, (svc_url, layer) in trail_services(trail).items():
+        lyrx, fields = svc_template(svc_url, layer)
+        jobs[name] = (lambda svc_url=svc_url, layer=layer, fields=fields:
+                      svc_cache.get(svc_url, layer, qry_ext, fields))
+
+    store, fetch = open_dem_store()
+    dem_tiles = store.tiles(*store.cells(*dem_extent(ext, ocs, store.meta['wkt'])))
+    jobs['dem'] = lambda: store.fill(fetch, dem_tiles)
+
+    nlcd_npz = os.path.join(svc_dir, f'nlcd_{trail}.npz')
+    if not os.path.exists(nlcd_npz):
+        token = (ap.GetSigninToken() or {}).get('token')
+        jobs['nlcd'] = lambda: save_nlcd(nlcd_npz, ext, token)
+    return(jobs)
+
+def fetch_trail(trail):
+    """
+    Fetches every remote input of a trail concurrently before the layers are styled.
+
+    Parameters:
+    trail (str): Name of trail.
+
+    Returns:
+    results (dict): Job name to result, or to the exception it raised.
+    """
+    results = hike_services.fetch_all(trail_fetch_jobs(trail))
+    for name, res in results.items():
+        if isinstance(res, Exception):
+            print(f'Fetch of \'{name}\' failed: {res}')
+    return(results)
+
+## Build trace
+# every gen_*, add*, create* and set_mf call, geoprocessing tool and REST request is timed
+tracer = hike_trace.tracer
+tracer.trace_functions(globals(), ('gen_', 'add', 'create', 'set_mf'))
+
+# arcpy functions timed while a trail builds, restored afterwards: (module, span prefix, names or None for all)
+gp_traced = [(getattr(ap, tbx), tbx + '.', None) for tbx in ('management', 'conversion', 'analysis', 'cartography')]
+gp_traced.append((ap, '', ['NumPyArrayToRaster']))
+
 # -- INIT ABOVE --
 # -- SAMPLE CODE --
 
+def trail_stages(trail):
+    """
+    Declares the build of a trail map as a graph of stages.
+
+    Fetches run in parallel as soon as the build starts. Stages that edit the
+    map or the geodatabase run one at a time in the order below, which is the
+    order their layers stack in, each waiting only for the data it reads.
+
+    Parameters:
+    trail (str): Name of trail.
+
+    Returns:
+    graph (StageGraph): Stages of the trail build.
+    """
+    ext = trails_dict[trail]['topo_ext']
+    graph = hike_stages.StageGraph()
+    for name, job in trail_fetch_jobs(trail).items():
+        graph.add(f'fetch_{name}', job, outputs=[name], serial=False, optional=True)
+    fetched = set(graph.stages)
+
+    def reads(*names):
+        return [n for n in names if f'fetch_{n}' in fetched]
+
+    graph.add('tracks', lambda: gen_tracks(routes_gpx, os.path.join(aprx_gdb, r'hike_routes_tracks')))
+    graph.add('routes', lambda: gen_routes(trail, 3.4))
+    graph.add('profiles', lambda: gen_profiles(trail), reads('dem'))
+    graph.add('water', lambda: gen_waterfeatures(ext, topo = True, labels = True), reads('hydro'))
+    graph.add('streams', lambda: gen_streams(ext, topo = True, labels = False), reads('streams'))
+    graph.add('roads', lambda: gen_roads(roads_svc[trails_dict[trail]['roads']], ext), reads('roads'))
+    graph.add('rails', lambda: gen_rails(ext), reads('rails'))
+    graph.add('hillshade', lambda: editHillshade(createHillshade(ocs, ext, aprx_gdb)), reads('dem'))
+    graph.add('contours', lambda: gen_contours(trail, ocs), reads('dem'))
+    graph.add('camera', lambda: set_mf(trail, False))
+    graph.add('fields', lambda: gen_fields(trail), reads('nlcd'))
+    graph.add('poi', lambda: add_POI(trail))
+    graph.add('fllt_preserve', gen_flltPreserve)
+    graph.add('fllt_trails', gen_flltTrails)
+    return(graph)
+
+def build_items():
+    """
+    Lists the layers in the map and the datasets in the geodatabase, for the build journal.
+
+    Returns:
+    List of 'layer:<long name>' and 'dataset:<name>' items.
+    """
+    with ap.EnvManager(workspace=aprx_gdb):
+        datasets = (ap.ListFeatureClasses() or []) + (ap.ListRasters() or [])
+    return([f'layer:{lyr.longName}' for lyr in m.listLayers()] + [f'dataset:{name}' for name in datasets])
+
+def rollback_items(items):
+    """
+    Removes the layers a failed stage left in the map and deletes the datasets it wrote.
+
+    Datasets written outside the build manifest are deleted too, so the
+    resumed stage never finds its own half-built output in the way.
+
+    Parameters:
+    items (list): Items from build_items added by the stage.
+
+    Returns:
+    None
+    """
+    layers = [item[len('layer:'):] for item in items if item.startswith('layer:')]
+    for lyr in m.listLayers():
+        if lyr.longName in layers:
+            lyr_remove(m, lyr)
+    for item in items:
+        if item.startswith('dataset:'):
+            ap.management.Delete(os.path.join(aprx_gdb, item[len('dataset:'):]))
+    pass
+
 def gen_trail(trail): 
-    gen_waterfeatures(topo = True,
-                      labels = True)
-    gen_streams(topo = True,
-               labels = False)
-    gen_roads(roads_svc[trails_dict[trail]['roads']])
-    gen_rails()
-    addTompkinsDEM()
-    topo = createHillshade(ocs, trails_dict[trail]['topo_ext'], aprx_gdb)
-    editHillshade(topo)
-    set_mf(trail, False)
-    gen_fields(trail)
-    add_POI()
-    gen_flltPreserve()
-    gen_flltTrails()
-    for lyr in ('hike_routes_points', 'USA NLCD Land Cover'):
-        lyr_rmv = lyr_obj(m, lyr)
-        lyr_remove(m, lyr_rmv)
+    graph = trail_stages(trail)
+    journal = hike_stages.StageJournal(journal_path, trail)
+    tracer.reset()
+    hike_memory.memory_log.clear()
+    try:
+        with tracer.traced_modules(gp_traced, 'gp'):
+            graph.run(journal=journal, snapshot=build_items, rollback=rollback_items)
+    finally:
+        tracer.write(trace_path, {'trail': trail})
+    graph.report()
+    hike_trace.print_summary(hike_trace.summarize([trace_path], ('stage', 'gp', 'rest'), 10))
+    hike_memory.print_summary()
+    print(f'Layer lookups: {reg.stats}')
+    print(f'CIM transactions: {hike_project.cim_stats}')
     pass
 
+# batch builds (hike_batch.py) run one trail per process and stop here
+if os.environ.get('HIKE_TRAIL'):
+    try:
+        gen_trail(os.environ['HIKE_TRAIL'])
+    finally:
+        # keep the completed stages' layers for the resumed build
+        aprx.save()
+    sys.exit(0)
+
 gen_trail('lp')
 
 # -- SAMPLE CODE --
@@ -679,23 +1542,8 @@ gen_trail('lp')
 
 lyr = lyr_obj(m, 'roads')
 
-for lblClass in lyr.listLabelClasses():
-    if lblClass.name == 'Label Class 3':
-        hwynum_cim = lblClass.getDefinition('V3')
-        hwynum_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
-        hwynum_cim.textSymbol.symbol.callout = 'PointSymbol'
-        hwynum_cim.visibility = True
-        lblClass.setDefinition(hwynum_cim)
-    elif lblClass.name == 'Label Class 5':
-        hwyname_cim = lblClass.getDefinition('V3')
-        hwyname_cim.textSymbol.symbol.symbol.symbolLayers[0].color.values = [52, 52, 52, 100]
-        hwyname_cim.maplexLabelPlacementProperties.linePlacementMethod = 'OffsetCurvedFromLine'
-        hwyname_cim.visibility = True
-        lblClass.setDefinition(hwyname_cim)
-    else:
-        lbl_cim = lblClass.getDefinition('V3')
-        lbl_cim.visibility = False
-        lblClass.setDefinition(lbl_cim)
+with hike_project.CIMEdit(lyr) as tx:
+    roads_label_cim(tx.label_classes())
 
 # BEST HIKES ROUTES
 sym = lyr.symbology
@@ -704,8 +1552,8 @@ sym.renderer.symbol.outlineWidth = 2.5
 sym.renderer.symbol.outlineColor = {'RGB': [52, 52, 52, 60]}
 lyr.symbology = sym
 
-m.addDataFromPath(os.path.join(aprx_gdb, r'besthikes_routes'))
-lyr = lyr_obj(m, 'besthikes_routes')
+besthikes = read_routes(os.path.join(aprx_gdb, r'besthikes_routes'))
+lyr, stats = simplify_routes('lp', besthikes, os.path.join(aprx_gdb, r'besthikes_routes_simplified'), 4)
 
 sym = lyr.symbology
 sym.renderer.symbol.outlineWidth = 4
@@ -715,34 +1563,12 @@ lyr.symbology = sym
 # LAND COVER
 def gen_fields():
     
-    nlcd = m.addDataFromPath(r'https://www.arcgis.com/home/item.html?id=3ccf118ed80748909eb85c6d262b426f')
+    nlcd = add_data(m, r'https://www.arcgis.com/home/item.html?id=3ccf118ed80748909eb85c6d262b426f')
     
-    temp_buff = ap.analysis.PairwiseBuffer(
-        in_features="besthikes_routes",
-        out_feature_class=os.path.join(aprx_gdb, r'route_buffer'),
-        buffer_distance_or_field="2000 Feet",
-        dissolve_option="NONE",
-        dissolve_field=None,
-        method="PLANAR",
-        max_deviation="0 DecimalDegrees"
-    )
-    
-    lyr = lyr_obj(m, 'route_buffer')
-    lyr_sel = ap.management.SelectLayerByAttribute(lyr, 'NEW_SELECTION', 
-                                                   '"Name" = \'Lindsay-Parsons\'')
-    
-    mv = aprx.activeView
-    lyrExt = mv.getLayerExtent(lyr, True)
-    
-    lyr = lyr_obj(m, 'route_buffer')
-    sr = ap.Describe(lyr).spatialReference
-    
-    sr_wkt = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],VERTCS["WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PARAMETER["Vertical_Shift",0.0],PARAMETER["Direction",1.0],UNIT["Meter",1.0]]'
-
-    ext_str = str(lyrExt)[:-11] + sr_wkt
-    print(ext_str)
+    lyr, buffer_ext = gen_route_buffers(besthikes, '2000 Feet')
+    ext = buffer_ext['Lindsay-Parsons']['wgs84']
     
-    with ap.EnvManager(extent=ext_str):
+    with ap.EnvManager(extent=ap.Extent(*ext, spatial_reference=sref(wgs84))):
         ap.conversion.RasterToPolygon(
             in_raster="USA NLCD Land Cover",
             out_polygon_features=os.path.join(aprx_gdb, r'RasterT_USA_NLC2'),
@@ -782,8 +1608,9 @@ for lyr_name in lyrlist:
 # HILLSHADE
 def createHillshade(ocs, ext, gdb, lp):
     if lp is True:
-        with arcpy.EnvManager(outputCoordinateSystem = ocs,
-                              extent = (ext + ocs)):
+        with arcpy.EnvManager(outputCoordinateSystem = sref(ocs),
+                              extent = ap.Extent(*[float(v) for v in ext.split()],
+                                                 spatial_reference = sref(ocs))):
             arcpy.ddd.HillShade(
                 in_raster="County_Tompkins2008_2_meter",
                 out_raster=os.path.join(gdb, r'HillSha_Coun1'),
@@ -797,7 +1624,6 @@ def createHillshade(ocs, ext, gdb, lp):
 # ext_lp2 - far range (less hills)
 # ext_lp3 - med range (med hills)
 
-ocs = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],VERTCS["WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PARAMETER["Vertical_Shift",0.0],PARAMETER["Direction",1.0],UNIT["Meter",1.0]]'
 ext_lp1 = '-76.5271191647879 42.3051024869337 -76.5054331313753 42.3211945965332 '
 ext_lp2 = '-76.5306704765596 42.3004776482477 -76.4988311322597 42.3258859175778 '
 ext_lp3 = '-76.525825108996 42.3054403361241 -76.5044214385469 42.3202781463147 '
@@ -812,35 +1638,10 @@ lyr.symbology = sym
 lyr.transparency = 10
 
 # CONTOURS
-lyr = m.addDataFromPath(os.path.join(aprx_dir, r'TompCty_Contours\Tompkins_County_Natural_Resources_Inventory_(OLD).shp'))
-lyr_rename(lyr, 'Contours')
-contour_symbols = {'1': {'color': {'RGB': [64, 64, 64, 100]},
-                        'outlineWidth': 1},
-                  '0': {'color': {'RGB': [80, 80, 80, 100]},
-                       'outlineWidth': 0.3}}
-
-sym = lyr.symbology
-
-ap.management.CalculateField(
-    in_table="Contours",
-    field="major",
-    expression="!CONTOUR! % 200 == 0",
-    expression_type="PYTHON3",
-    code_block="",
-    field_type="TEXT",
-    enforce_domains="NO_ENFORCE_DOMAINS"
-)
-
-sym.updateRenderer('UniqueValueRenderer')
-sym.renderer.fields = ["major"]
-for grp in sym.renderer.groups:
-    for itm in grp.items:
-        itm.symbol.color = contour_symbols[itm.values[0][0]]['color']
-        itm.symbol.outlineWidth = contour_symbols[itm.values[0][0]]['outlineWidth']
-lyr.symbology = sym
+lyr = gen_contours('lp', ocs)
 
 # HYDRO
-lyr = m.addDataFromPath(r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Hydrography/MapServer/9',
+lyr = add_data(m, r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Hydrography/MapServer/9',
                  web_service_type = 'ARCGIS_SERVER_WEB',
                  custom_parameters = {})
 lyr_rename(lyr, 'hydro')
@@ -855,7 +1656,7 @@ lyr.symbology = sym
 # Need to add labels to water bodies
 
 # STREAMS
-lyr = m.addDataFromPath(r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Hydrography/MapServer/15',
+lyr = add_data(m, r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Hydrography/MapServer/15',
                  web_service_type = 'ARCGIS_SERVER_WEB',
                  custom_parameters = {})
 lyr_rename(lyr, 'streams')
@@ -876,7 +1677,7 @@ if lyr.supports('SHOWLABELS'):
 
 
 # ROADS
-lyr = m.addDataFromPath(r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Streets/MapServer/7',
+lyr = add_data(m, r'https://gisservices.its.ny.gov/arcgis/rest/services/NYS_Streets/MapServer/7',
                  web_service_type = 'ARCGIS_SERVER_WEB',
                  custom_parameters = {})
 lyr_rename(lyr, 'roads')
@@ -923,7 +1724,7 @@ ap.management.XYTableToPoint(
     x_field="longitude",
     y_field="latitude",
     z_field=None,
-    coordinate_system='GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]];-400 -400 1000000000;-100000 10000;-100000 10000;8.98315284119521E-09;0.001;0.001;IsHighPrecision'
+    coordinate_system=sref(wgs84)
 )
 
 poi_symbols = {'Bus stop': {'icon': 'Mass Transit',
@@ -959,7 +1760,7 @@ for grp in sym.renderer.groups:
 lyr.symbology = sym
 
 # RAILS
-lyr = m.addDataFromPath(r'https://services.arcgis.com/P3ePLMYs2RVChkJx/ArcGIS/rest/services/USA_Railroads_1/FeatureServer/0',
+lyr = add_data(m, r'https://services.arcgis.com/P3ePLMYs2RVChkJx/ArcGIS/rest/services/USA_Railroads_1/FeatureServer/0',
                  web_service_type = 'ARCGIS_SERVER_WEB',
                  custom_parameters = {})
 lyr_rename(lyr, 'rails')
@@ -1006,7 +1807,7 @@ lyr.symbology = sym
 #                  web_service_type = 'ARCGIS_SERVER_WEB',
 #                  custom_parameters = {})
 
-lyr = lyr_obj(m, 'hike_routes_tracks')
+lyr = lyr_obj(m, 'hike_routes_simplified')
 
 sym = lyr.symbology
 
@@ -1031,7 +1832,7 @@ ap.management.XYTableToPoint(
     x_field="longitude",
     y_field="latitude",
     z_field=None,
-    coordinate_system='GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]];-400 -400 1000000000;-100000 10000;-100000 10000;8.98315284119521E-09;0.001;0.001;IsHighPrecision'
+    coordinate_system=sref(wgs84)
 )
 
 poi_symbols = {'Bus stop': {'icon': 'Mass Transit',
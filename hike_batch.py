@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""hike_batch.py: Builds Best Hikes trail maps in parallel, one worker process per trail."""
+
+# SETUP
+
+import os
+import sys
+import ast
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import hike_trace
+
+code_dir = os.path.dirname(os.path.abspath(__file__))
+template = os.path.join(code_dir, 'hike-template.py')
+
+# trails_dict as last completed by frame_trails in the map script, kept in its data folder
+trails_file = 'trails.json'
+
+# FUNCTIONS
+
+def read_script_values(script=template, names=('trails_dict',)):
+    """
+    Reads literal module-level values, e.g. trails_dict, from the map script without running it.
+
+    Parameters:
+    script (str): Path of the map script.
+    names (sequence): Names of the assignments to read.
+
+    Returns:
+    values (dict): Name to value for each literal assignment found.
+    """
+    with open(script) as f:
+        tree = ast.parse(f.read(), script)
+    values = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            name = getattr(target, 'id', None)
+            if name in names and name not in values:
+                try:
+                    values[name] = ast.literal_eval(node.value)
+                except ValueError:
+                    pass
+    return values
+
+def data_folder(script=template, env=None):
+    """
+    Returns the map data folder a build of the script uses: HIKE_DATA if set, else its aprx_dir.
+
+    Parameters:
+    script (str): Path of the map script.
+    env (dict): Environment of the build, defaults to this process's.
+
+    Returns:
+    Path of the data folder (str), or None if neither is set.
+    """
+    env = os.environ if env is None else env
+    return env.get('HIKE_DATA') or read_script_values(script, ['aprx_dir']).get('aprx_dir')
+
+def read_trails(script=template, data_dir=None):
+    """
+    Reads trails_dict from the map script without running it.
+
+    Trails that frame_trails added for routes without a hand-written entry
+    are read from the trails file it saves in the data folder. Hand-written
+    values in the script win, as they do in frame_trails.
+
+    Parameters:
+    script (str): Path of the map script.
+    data_dir (str): Map data folder, defaults to data_folder(script).
+
+    Returns:
+    trails (dict): Trail key to trail attributes.
+    """
+    values = read_script_values(script, ['trails_dict'])
+    if 'trails_dict' not in values:
+        raise ValueError(f'trails_dict not found in {script}')
+    trails = values['trails_dict']
+    path = os.path.join(data_dir or data_folder(script) or '', trails_file)
+    if os.path.exists(path):
+        with open(path) as f:
+            framed = json.load(f)
+        for key, attr in framed.items():
+            trails[key] = dict(attr, **trails.get(key, {}))
+    return trails
+
+def trail_keys(keys, script=template, data_dir=None):
+    """
+    Expands a list of trail keys, where 'all' selects every trail.
+
+    Parameters:
+    keys (list): Trail keys, or ['all'].
+    script (str): Path of the map script.
+    data_dir (str): Map data folder, defaults to data_folder(script).
+
+    Returns:
+    List of trail keys.
+    """
+    trails = read_trails(script, data_dir)
+    if 'all' in keys:
+        return list(trails)
+    unknown = [k for k in keys if k not in trails]
+    if unknown:
+        raise ValueError(f'Unknown trails: {", ".join(unknown)}')
+    return list(keys)
+
+def run_trail(trail, aprx_path, out_dir, python=sys.executable, script=template, stub_dir=None, memory=None,
+              extra_env=None):
+    """
+    Builds one trail in its own process, project copy and scratch geodatabase.
+
+    Parameters:
+    trail (str): Trail key.
+    aprx_path (str): ArcGIS Pro project to copy.
+    out_dir (str): Batch output folder; the trail works in out_dir/<trail>.
+    python (str): Python interpreter with arcpy, e.g. ArcGIS Pro's propy.bat.
+    script (str): Path of the map script.
+    stub_dir (str): Folder with a stand-in arcpy package put first on the path.
+    memory (str): Working memory cap of the raster stages, e.g. '1 GB'.
+    extra_env (dict): More environment variables for the build, e.g. HIKE_DATA.
+
+    Returns:
+    result (dict): Trail, status, return code, wall time and log path.
+    """
+    work = os.path.abspath(os.path.join(out_dir, trail))
+    script = os.path.abspath(script)
+    os.makedirs(work, exist_ok=True)
+    trail_aprx = os.path.join(work, f'{trail}.aprx')
+    # an interrupted build resumes in its saved project copy
+    journal = os.path.join(work, 'scratch.journal.json')
+    resume = False
+    if os.path.exists(trail_aprx) and os.path.exists(journal):
+        with open(journal) as f:
+            resume = trail in json.load(f)
+    if not resume:
+        shutil.copyfile(aprx_path, trail_aprx)
+
+    env = dict(os.environ,
+               HIKE_TRAIL=trail,
+               HIKE_APRX=trail_aprx,
+               HIKE_GDB=os.path.join(work, 'scratch.gdb'))
+    if memory:
+        env['HIKE_MEMORY'] = memory
+    env.update(extra_env or {})
+    if stub_dir:
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, (os.path.abspath(stub_dir), env.get('PYTHONPATH'))))
+
+    log_path = os.path.join(work, 'build.log')
+    t0 = time.perf_counter()
+    with open(log_path, 'w') as log:
+        proc = subprocess.run([python, script], cwd=work, env=env,
+                              stdout=log, stderr=subprocess.STDOUT)
+    return {'trail': trail,
+            'status': 'ok' if proc.returncode == 0 else 'failed',
+            'returncode': proc.returncode,
+            'seconds': round(time.perf_counter() - t0, 3),
+            'aprx': trail_aprx,
+            'log': log_path,
+            'trace': os.path.join(work, 'scratch.trace.json')}
+
+def build_trails(keys, aprx_path, out_dir, workers=None, **kwargs):
+    """
+    Builds several trails concurrently and merges their results and logs.
+
+    Each trail runs in a separate interpreter, so arcpy state is never shared
+    and throughput scales with the number of workers.
+
+    Parameters:
+    keys (list): Trail keys, or ['all'].
+    aprx_path (str): ArcGIS Pro project to copy for each trail.
+    out_dir (str): Batch output folder.
+    workers (int): Concurrent trail builds, defaults to the number of cores.
+    kwargs: Passed on to run_trail.
+
+    Returns:
+    results (list): One result dictionary per trail, in the order given.
+    """
+    script = kwargs.get('script', template)
+    keys = trail_keys(keys, script, data_folder(script, dict(os.environ, **(kwargs.get('extra_env') or {}))))
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda k: run_trail(k, aprx_path, out_dir, **kwargs), keys))
+    wall = time.perf_counter() - t0
+
+    with open(os.path.join(out_dir, 'batch.log'), 'w') as log:
+        for res in results:
+            log.write(f'===== {res["trail"]} ({res["status"]}, {res["seconds"]} s)\n')
+            with open(res['log']) as f:
+                log.write(f.read())
+    traces = [r['trace'] for r in results if os.path.exists(r['trace'])]
+    slowest = hike_trace.summarize(traces) if traces else []
+    summary = {'workers': workers,
+               'wall_seconds': round(wall, 3),
+               'trail_seconds': round(sum(r['seconds'] for r in results), 3),
+               'slowest_stages': slowest,
+               'trails': results}
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=1)
+
+    if slowest:
+        hike_trace.print_summary(slowest)
+    failed = [r['trail'] for r in results if r['status'] != 'ok']
+    print(f'Built {len(results) - len(failed)} of {len(results)} trails in {wall:.1f} s '
+          f'with {workers} workers' + (f'; failed: {", ".join(failed)}' if failed else ''))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('trails', nargs='+', help="trail keys from trails_dict, or 'all'")
+    parser.add_argument('--aprx', required=True, help='ArcGIS Pro project to copy for each trail')
+    parser.add_argument('--out', default='batch', help='output folder')
+    parser.add_argument('--workers', type=int, default=None, help='concurrent trail builds')
+    parser.add_argument('--python', default=sys.executable, help='interpreter with arcpy')
+    parser.add_argument('--stub', default=None, help='folder with a stand-in arcpy package')
+    parser.add_argument('--memory', default=None, help="working memory cap per trail for raster stages, e.g. '1 GB'")
+    args = parser.parse_args()
+    res = build_trails(args.trails, args.aprx, args.out, args.workers,
+                       python=args.python, stub_dir=args.stub, memory=args.memory)
+    sys.exit(0 if all(r['status'] == 'ok' for r in res) else 1)
@@ -0,0 +1,536 @@
+#!/usr/bin/env python
+
+"""hike_bench.py: Benchmarks the Best Hikes map pipeline on synthetic data with the arcpy stand-in."""
+
+# SETUP
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+
+import numpy as np
+
+import hike_crs
+import hike_poi
+import hike_batch
+import hike_trace
+import hike_preview
+import hike_terrain
+import hike_services
+
+code_dir = os.path.dirname(os.path.abspath(__file__))
+
+# folder holding the arcpy stand-in package, put first on the path of benchmark builds
+bench_dir = os.path.join(code_dir, 'bench')
+
+# bumped when the fixtures change, so older fixture folders are rebuilt
+fixture_version = 1
+
+# fixtures are rebuilt before the service cache would count their features as stale
+fixture_max_age = 20 * 86400
+
+# feature, route and point counts of the 1x fixtures, multiplied by the scale
+base_counts = {'routes': 50,
+               'poi': 120,
+               'preserves': 20,
+               'fllt_trails': 60,
+               'hydro': 40,
+               'streams': 150,
+               'roads': 400,
+               'rails': 6}
+
+# vertices per synthetic route, and DEM and NLCD cell sizes in meters at 1x;
+# raster cells shrink by the square root of the scale so cell counts grow with it
+route_points = 400
+dem_cell = 2.0
+nlcd_cell = 30.0
+
+# NLCD classes drawn into the land cover fixture
+nlcd_classes = [11, 21, 22, 41, 42, 43, 52, 71, 81, 82, 90]
+
+# POI types, the keys of poi_symbols in add_POI
+poi_types = ['Bus stop', 'Geology', 'Historic', 'Lean-to', 'Parking', 'Trailhead', 'Viewpoint', 'Waterfall']
+
+# service layer fixtures: geometry and number of label classes of the saved layer file
+service_layers = {'hydro': ('polygon', 1),
+                  'streams': ('polyline', 1),
+                  'roads': ('polyline', 6),
+                  'rails': ('polyline', 1)}
+
+# coordinate system of the DEM fixture
+utm18n_wkt = ('PROJCS["WGS_1984_UTM_Zone_18N",GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",'
+              'SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],'
+              'UNIT["Degree",0.0174532925199433]],PROJECTION["Transverse_Mercator"],'
+              'PARAMETER["False_Easting",500000.0],PARAMETER["False_Northing",0.0],'
+              'PARAMETER["Central_Meridian",-75.0],PARAMETER["Scale_Factor",0.9996],'
+              'PARAMETER["Latitude_Of_Origin",0.0],UNIT["Meter",1.0]]')
+
+# FUNCTIONS
+
+def script_values(script=hike_batch.template):
+    """
+    Reads the trails, service URLs and margin the fixtures have to match from the map script.
+
+    Returns:
+    Dictionary of trails_dict, nys_streets, nys_hydro, usa_rails, roads_svc and svc_margin.
+    """
+    names = ['trails_dict', 'nys_streets', 'nys_hydro', 'usa_rails', 'roads_svc', 'svc_margin']
+    values = hike_batch.read_script_values(script, names)
+    missing = [n for n in names if n not in values]
+    if missing:
+        raise ValueError(f'{", ".join(missing)} not found in {script}')
+    return values
+
+def random_walk(rng, start, n, step, bounds):
+    """
+    Draws a smooth random walk of lon, lat vertices that stays inside a box.
+
+    Parameters:
+    rng (Generator): Random number generator.
+    start (tuple): First vertex, lon and lat.
+    n (int): Number of vertices.
+    step (float): Step length in degrees.
+    bounds (list): xmin, ymin, xmax, ymax the walk is folded back into.
+
+    Returns:
+    (n, 2) array of lon, lat.
+    """
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.25, n))
+    xy = np.asarray(start) + np.cumsum(np.column_stack((np.cos(heading), np.sin(heading))) * step, axis=0)
+    lo, hi = np.asarray(bounds[:2]), np.asarray(bounds[2:])
+    span = hi - lo
+    # reflect vertices leaving the box back inside it
+    xy = np.abs((xy - lo) % (2 * span) - span)
+    return hi - xy
+
+def ring(rng, center, radius, n):
+    """
+    Draws an irregular closed ring around a center.
+
+    Returns:
+    List of [lon, lat] vertices, first repeated last.
+    """
+    angle = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    r = radius * (1 + 0.3 * np.sin(angle * rng.integers(2, 5) + rng.uniform(0, 6)))
+    xy = np.column_stack((center[0] + r * np.cos(angle) * 1.35, center[1] + r * np.sin(angle)))
+    xy = np.round(xy, 7).tolist()
+    return xy + xy[:1]
+
+def write_gpx(path, routes):
+    """
+    Writes routes as GPX tracks with elevations.
+
+    Parameters:
+    path (str): Output GPX path.
+    routes (dict): Route name to (N, 3) array of lon, lat, ele.
+
+    Returns:
+    None
+    """
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="hike_bench" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        for name, coords in routes.items():
+            f.write(f'<trk><name>{name}</name><trkseg>\n')
+            f.writelines(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.1f}</ele></trkpt>\n'
+                         for lon, lat, ele in coords)
+            f.write('</trkseg></trk>\n')
+        f.write('</gpx>\n')
+
+def elevation(x, y):
+    """
+    Synthetic terrain of ridges and valleys, in meters, for UTM coordinates.
+    """
+    return (380 + 90 * np.sin(x / 950.0) * np.cos(y / 1300.0) + 35 * np.sin((x + 2 * y) / 430.0)
+            + 6 * np.sin(x / 61.0) * np.cos(y / 47.0))
+
+def feature_set(rng, geometry, count, ext, vertices=24):
+    """
+    Draws an Esri JSON feature set of random lines or polygons inside an extent.
+
+    Parameters:
+    rng (Generator): Random number generator.
+    geometry (str): 'polyline' or 'polygon'.
+    count (int): Number of features.
+    ext (list): xmin, ymin, xmax, ymax in WGS84.
+    vertices (int): Vertices per feature.
+
+    Returns:
+    Esri JSON feature set (dict)
+    """
+    xmin, ymin, xmax, ymax = ext
+    size = min(xmax - xmin, ymax - ymin)
+    feats = []
+    for i in range(count):
+        start = (rng.uniform(xmin, xmax), rng.uniform(ymin, ymax))
+        if geometry == 'polygon':
+            geom = {'rings': [ring(rng, start, size * rng.uniform(0.005, 0.03), vertices)]}
+        else:
+            path = random_walk(rng, start, vertices, size * 0.01, ext)
+            geom = {'paths': [np.round(path, 7).tolist()]}
+        feats.append({'attributes': {'OBJECTID': i + 1, 'NAME': f'Feature {i + 1}'}, 'geometry': geom})
+    return {'geometryType': 'esriGeometry' + geometry.capitalize(),
+            'spatialReference': {'wkid': 4326},
+            'fields': [{'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+                       {'name': 'NAME', 'type': 'esriFieldTypeString'}],
+            'features': feats}
+
+def build_fixtures(data_dir, scale, trail='lp', seed=0, script=hike_batch.template):
+    """
+    Writes the synthetic data folder one trail build reads, at a multiple of the 1x data size.
+
+    The folder stands in for the SpatialFiles folder (HIKE_DATA): GPX routes,
+    POI table, FLLT GeoJSON, a filled DEM store, the trail's NLCD window, and
+    a service cache holding the trail's features with their layer files, so
+    builds run without any network access.
+
+    Parameters:
+    data_dir (str): Fixture folder.
+    scale (float): Multiple of the 1x counts and raster cell counts.
+    trail (str): Trail whose extent the fixtures cover.
+    seed (int): Random seed.
+    script (str): Path of the map script.
+
+    Returns:
+    meta (dict): Fixture description, also saved as fixture.json.
+    """
+    meta_path = os.path.join(data_dir, 'fixture.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if (meta.get('version') == fixture_version and meta.get('scale') == scale and meta.get('trail') == trail
+                and meta.get('seed') == seed and time.time() - meta.get('created', 0) < fixture_max_age):
+            return meta
+        shutil.rmtree(data_dir)
+    t0 = time.perf_counter()
+    values = script_values(script)
+    attr = values['trails_dict'][trail]
+    ext = [float(v) for v in attr['topo_ext'].split()]
+    counts = {k: max(int(round(v * scale)), 1) for k, v in base_counts.items()}
+    rng = np.random.default_rng(seed)
+    svc_dir = os.path.join(data_dir, 'service_cache')
+    os.makedirs(svc_dir, exist_ok=True)
+
+    # DEM store covering the trail extent, filled tile by tile
+    x0, y0, x1, y1 = hike_crs.transform_extent(ext, hike_crs.wgs84_wkid, utm18n_wkt)
+    cell = dem_cell / np.sqrt(scale)
+    pad = 200.0
+    shape = (int(np.ceil((y1 - y0 + 2 * pad) / cell)), int(np.ceil((x1 - x0 + 2 * pad) / cell)))
+    origin = (x0 - pad, y1 + pad)
+    store = hike_terrain.DEMStore.create(os.path.join(data_dir, 'dem_store_tompkins'), shape, origin,
+                                         (cell, cell), utm18n_wkt)
+
+    def dem_tile(r0, r1, c0, c1):
+        xs = origin[0] + (np.arange(c0, c1) + 0.5) * cell
+        ys = origin[1] - (np.arange(r0, r1) + 0.5) * cell
+        return elevation(xs[None, :], ys[:, None]).astype(np.float32)
+    store.fill(dem_tile)
+    to_utm = hike_crs.transformer(hike_crs.wgs84_wkid, utm18n_wkt)
+
+    # routes inside the trail extent, the trail's own route first
+    step = (ext[2] - ext[0]) / route_points * 0.8
+    center = ((ext[0] + ext[2]) / 2, (ext[1] + ext[3]) / 2)
+    names = [attr.get('route', attr['trail_name'])] + [f'Bench Route {i}' for i in range(1, counts['routes'])]
+    routes = {}
+    for i, name in enumerate(names):
+        start = center if i == 0 else (rng.uniform(ext[0], ext[2]), rng.uniform(ext[1], ext[3]))
+        xy = random_walk(rng, start, route_points, step, ext)
+        ele = elevation(*to_utm(xy[:, 0], xy[:, 1]))
+        routes[name] = np.column_stack((xy, ele))
+    write_gpx(os.path.join(data_dir, hike_preview.gpx_name), routes)
+
+    # POI table over an area four times the trail extent
+    w, h = ext[2] - ext[0], ext[3] - ext[1]
+    poi_path = os.path.join(data_dir, hike_preview.poi_name)
+    lon = rng.uniform(ext[0] - w / 2, ext[2] + w / 2, counts['poi'])
+    lat = rng.uniform(ext[1] - h / 2, ext[3] + h / 2, counts['poi'])
+    with open(poi_path, 'w', newline='') as f:
+        f.write('name,type,longitude,latitude\n')
+        f.writelines(f'POI {i + 1},{poi_types[i % len(poi_types)]},{x:.7f},{y:.7f}\n'
+                     for i, (x, y) in enumerate(zip(lon, lat)))
+    # index the table now so its one-off build is not timed
+    hike_poi.POIIndex(poi_path)
+
+    # FLLT preserves and trails
+    for name, geometry, count in (('fllt-preserve-boundaries.geojson', 'polygon', counts['preserves']),
+                                  ('fllt-trails.geojson', 'polyline', counts['fllt_trails'])):
+        fset = feature_set(rng, geometry, count, ext, 48)
+        geo = {'type': 'FeatureCollection',
+               'features': [{'type': 'Feature', 'properties': {'NAME': ft['attributes']['NAME']},
+                             'geometry': ({'type': 'Polygon', 'coordinates': ft['geometry']['rings']}
+                                          if geometry == 'polygon' else
+                                          {'type': 'LineString', 'coordinates': ft['geometry']['paths'][0]})}
+                            for ft in fset['features']]}
+        with open(os.path.join(data_dir, name), 'w') as f:
+            json.dump(geo, f)
+
+    # NLCD window of smooth land cover patches
+    ncell = nlcd_cell / np.sqrt(scale)
+    nx, ny = max(int((x1 - x0) / ncell), 1), max(int((y1 - y0) / ncell), 1)
+    gx, gy = np.meshgrid(np.linspace(0, 6, nx), np.linspace(0, 6, ny))
+    field = np.sin(gx * 1.3 + 0.4) * np.cos(gy * 0.9) + 0.5 * np.sin(gx * 2.7 - gy * 1.9)
+    bins = np.quantile(field, np.linspace(0, 1, len(nlcd_classes) + 1)[1:-1])
+    codes = np.asarray(nlcd_classes, dtype=np.uint8)[np.digitize(field, bins)]
+    np.savez_compressed(os.path.join(svc_dir, f'nlcd_{trail}.npz'), codes=codes,
+                        extent=np.asarray(hike_services.pad_extent(ext, 0)))
+
+    # service layer files, drawn fields and cached features of the trail
+    layers = {'hydro': (values['nys_hydro'], '9'),
+              'streams': (values['nys_hydro'], '15'),
+              'roads': (values['nys_streets'], values['roads_svc'][attr['roads']]),
+              'rails': (values['usa_rails'], '0')}
+    qry_ext = hike_services.pad_extent(ext, values['svc_margin'])
+    fsets = {}
+    for name, (svc_url, layer) in layers.items():
+        geometry, nlabels = service_layers[name]
+        svc_name = svc_url.rstrip('/').split('/')[-2]
+        with open(os.path.join(svc_dir, f'{svc_name}_{layer}.lyrx'), 'w') as f:
+            json.dump({'name': f'{svc_name}_{layer}', 'kind': 'service', 'dataSource': f'{svc_url}/{layer}',
+                       'labelClasses': [f'Label Class {i}' for i in range(nlabels)], 'fields': ['NAME']}, f)
+        with open(os.path.join(svc_dir, f'{svc_name}_{layer}.fields.json'), 'w') as f:
+            json.dump(['NAME'], f)
+        fsets[(svc_url.rstrip('/'), layer)] = feature_set(rng, geometry, counts[name], qry_ext)
+    cache = hike_services.FeatureCache(os.path.join(svc_dir, 'features.sqlite'),
+                                       fetch=lambda svc_url, layer, extent, fields: fsets[(svc_url, layer)])
+    for svc_url, layer in layers.values():
+        cache.get(svc_url, layer, qry_ext, ['NAME'])
+    cache.close()
+
+    # empty stand-in project, copied for every build
+    with open(os.path.join(data_dir, 'bench.aprx'), 'w') as f:
+        json.dump({}, f)
+
+    size = sum(os.path.getsize(os.path.join(d, n)) for d, _, files in os.walk(data_dir) for n in files)
+    meta = {'version': fixture_version, 'scale': scale, 'trail': trail, 'seed': seed, 'created': time.time(),
+            'counts': dict(counts, route_vertices=counts['routes'] * route_points),
+            'dem_shape': list(shape), 'nlcd_shape': list(codes.shape),
+            'megabytes': round(size / 2**20, 1), 'seconds': round(time.perf_counter() - t0, 2)}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=1)
+    print(f'Fixtures {scale}x: DEM {shape[0]}x{shape[1]}, NLCD {codes.shape[0]}x{codes.shape[1]}, '
+          f'{counts["routes"]} routes, {sum(counts[n] for n in service_layers)} service features, '
+          f'{meta["megabytes"]} MB in {meta["seconds"]} s')
+    return meta
+
+def trace_metrics(trace):
+    """
+    Reads the per-stage and end-to-end timings of a build from its trace.
+
+    Parameters:
+    trace (str): Trace JSON written by the build.
+
+    Returns:
+    metrics (dict): Seconds of 'gen_trail' (first stage start to last stage end),
+        'stage.<name>' for each stage, and totals of 'gp' tools and 'rest' requests.
+    functions (dict): Seconds per map function, e.g. 'gen_roads'.
+    """
+    events, _ = hike_trace.load_events(trace)
+    stages = [e for e in events if e['cat'] == 'stage']
+    metrics = {}
+    if stages:
+        start = min(e['ts'] for e in stages)
+        end = max(e['ts'] + e['dur'] for e in stages)
+        metrics['gen_trail'] = (end - start) / 1e6
+    for e in stages:
+        metrics[f'stage.{e["name"]}'] = metrics.get(f'stage.{e["name"]}', 0) + e['dur'] / 1e6
+    for cat in ('gp', 'rest'):
+        metrics[cat] = sum(e['dur'] for e in events if e['cat'] == cat) / 1e6
+    functions = {}
+    for e in events:
+        if e['cat'] == 'map':
+            functions[e['name']] = functions.get(e['name'], 0) + e['dur'] / 1e6
+    return metrics, functions
+
+def git_commit():
+    """
+    Returns the short commit hash of the working tree, marked '+' if it has changes.
+    """
+    try:
+        head = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=code_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=code_dir,
+                               capture_output=True, text=True).stdout.strip()
+        return head + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_bench(scale, data_root, out_root, trail='lp', runs=1, latency=None, memory=None, seed=0):
+    """
+    Times cold builds of one trail on the fixtures of one scale.
+
+    Each run builds in a fresh scratch geodatabase and project copy through
+    hike_batch, with the arcpy stand-in first on the path. Timings are the
+    medians over the runs.
+
+    Parameters:
+    scale (float): Fixture scale.
+    data_root (str): Folder holding one fixture folder per scale.
+    out_root (str): Folder holding the build folders.
+    trail (str): Trail to build.
+    runs (int): Builds to time.
+    latency (str): Seconds per geoprocessing tool, or JSON by call name; see bench/arcpy/_base.py.
+    memory (str): Working memory cap of the raster stages, e.g. '1 GB'.
+    seed (int): Fixture random seed.
+
+    Returns:
+    record (dict): Settings, fixture description, status and median timings of the runs.
+    """
+    data_dir = os.path.abspath(os.path.join(data_root, f'{scale:g}x'))
+    meta = build_fixtures(data_dir, scale, trail, seed)
+    out_dir = os.path.join(out_root, f'{scale:g}x')
+    extra_env = {'HIKE_DATA': data_dir}
+    if latency:
+        extra_env['HIKE_FAKE_LATENCY'] = str(latency)
+
+    samples, functions, status = [], [], 'ok'
+    for i in range(runs):
+        shutil.rmtree(os.path.join(out_dir, trail), ignore_errors=True)
+        res = hike_batch.run_trail(trail, os.path.join(data_dir, 'bench.aprx'), out_dir, stub_dir=bench_dir,
+                                   memory=memory, extra_env=extra_env)
+        if res['status'] != 'ok' or not os.path.exists(res['trace']):
+            status = 'failed'
+            with open(res['log']) as f:
+                tail = f.read().splitlines()[-15:]
+            print(f'Build {scale:g}x run {i + 1} failed ({res["returncode"]}), see {res["log"]}:')
+            print('\n'.join(tail))
+            break
+        metrics, funcs = trace_metrics(res['trace'])
+        metrics['process'] = res['seconds']
+        samples.append(metrics)
+        functions.append(funcs)
+        print(f'{scale:g}x run {i + 1}/{runs}: process {res["seconds"]:.2f} s, '
+              f'gen_trail {metrics.get("gen_trail", 0):.2f} s')
+
+    def medians(rows):
+        names = sorted({k for r in rows for k in r})
+        return {k: round(statistics.median(r.get(k, 0) for r in rows), 4) for k in names}
+
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'scale': scale,
+            'trail': trail,
+            'runs': len(samples),
+            'latency': latency,
+            'memory': memory,
+            'status': status,
+            'fixture': {k: meta[k] for k in ('counts', 'dem_shape', 'nlcd_shape', 'megabytes')},
+            'metrics': medians(samples) if samples else {},
+            'functions': medians(functions) if functions else {}}
+
+def load_history(path):
+    """
+    Reads the stored benchmark records.
+
+    Returns:
+    List of records, oldest first.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def baseline(record, history):
+    """
+    Finds the latest successful record with the same scale, trail, settings and host.
+
+    Returns:
+    Record (dict), or None.
+    """
+    same = ('scale', 'trail', 'latency', 'memory', 'host')
+    for old in reversed(history):
+        if old['status'] == 'ok' and all(old.get(k) == record.get(k) for k in same):
+            return old
+    return None
+
+def compare(record, base, threshold=0.2, floor=0.05):
+    """
+    Compares the timings of a record with its baseline.
+
+    A metric regresses when it is slower by more than the threshold and by
+    more than the floor, so sub-second noise on tiny stages is not flagged.
+
+    Parameters:
+    record (dict): New record.
+    base (dict): Baseline record.
+    threshold (float): Allowed slowdown as a fraction.
+    floor (float): Smallest slowdown in seconds that counts.
+
+    Returns:
+    rows (list): Metric, baseline and new seconds, change and regression flag.
+    """
+    rows = []
+    for name, new in record['metrics'].items():
+        old = base['metrics'].get(name)
+        if old is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        rows.append({'metric': name, 'base': old, 'new': new, 'change': change,
+                     'regression': new - old > floor and change > threshold})
+    return rows
+
+def print_comparison(record, base, rows):
+    """
+    Prints the output of compare as a table.
+
+    Returns:
+    None
+    """
+    print(f'{record["scale"]:g}x against {base["time"]} ({base["commit"]}):')
+    print(f'{"metric":<28} {"base s":>9} {"new s":>9} {"change":>8}')
+    for r in rows:
+        print(f'{r["metric"][:28]:<28} {r["base"]:>9.3f} {r["new"]:>9.3f} {r["change"]:>+8.1%}'
+              + ('  REGRESSION' if r['regression'] else ''))
+    pass
+
+def print_record(record):
+    """
+    Prints the timings of a record without a baseline.
+
+    Returns:
+    None
+    """
+    print(f'{record["scale"]:g}x ({record["status"]}), no baseline:')
+    for name, value in record['metrics'].items():
+        print(f'{name[:28]:<28} {value:>9.3f}')
+    pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scales', nargs='+', type=float, default=[1, 10], help='fixture sizes, e.g. 1 10 100')
+    parser.add_argument('--trail', default='lp', help='trail to build')
+    parser.add_argument('--runs', type=int, default=3, help='builds per scale; the median is stored')
+    parser.add_argument('--latency', default=None,
+                        help="seconds per geoprocessing tool, or JSON by call name, e.g. '{\"mp\": 0.01}'")
+    parser.add_argument('--memory', default=None, help="working memory cap of the raster stages, e.g. '1 GB'")
+    parser.add_argument('--data', default=os.path.join(bench_dir, 'fixtures'), help='fixture folder')
+    parser.add_argument('--out', default=os.path.join(bench_dir, 'runs'), help='build folder')
+    parser.add_argument('--results', default=os.path.join(bench_dir, 'results.jsonl'), help='benchmark history')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown flagged as a regression')
+    parser.add_argument('--floor', type=float, default=0.05, help='smallest slowdown in seconds flagged')
+    parser.add_argument('--fail', action='store_true', help='exit with 1 on a regression')
+    args = parser.parse_args()
+
+    history = load_history(args.results)
+    failed = regressed = False
+    for scale in args.scales:
+        record = run_bench(scale, args.data, args.out, args.trail, args.runs, args.latency, args.memory)
+        base = baseline(record, history)
+        if base and record['status'] == 'ok':
+            rows = compare(record, base, args.threshold, args.floor)
+            print_comparison(record, base, rows)
+            regressed = regressed or any(r['regression'] for r in rows)
+        else:
+            print_record(record)
+        failed = failed or record['status'] != 'ok'
+        history.append(record)
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    sys.exit(1 if failed or (args.fail and regressed) else 0)
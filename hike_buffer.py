@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""hike_buffer.py: Buffers routes and computes route corridor extents in UTM 18N."""
+
+# SETUP
+
+import re
+
+import numpy as np
+
+from hike_crs import transform, transformer, wgs84_wkid, utm_wkid
+from hike_tracks import dp_mask
+from hike_terrain import contour_segments, stitch_segments, edge_points
+
+# meters per linear unit, keyed by lowercase unit name
+linear_units = {'meters': 1.0,
+                'meter': 1.0,
+                'feet': 0.3048,
+                'foot': 0.3048,
+                'kilometers': 1000.0,
+                'miles': 1609.344}
+
+# FUNCTIONS
+
+def to_meters(distance):
+    """
+    Converts a distance like '2000 Feet' or a number of meters to meters.
+
+    Parameters:
+    distance (str or float): Distance with a linear unit, or meters.
+
+    Returns:
+    Distance in meters (float)
+    """
+    if isinstance(distance, str):
+        value, unit = re.match(r'\s*([\d.]+)\s*(\w+)', distance).groups()
+        return float(value) * linear_units[unit.lower()]
+    return float(distance)
+
+def project_routes(routes):
+    """
+    Projects every route to UTM 18N in a single call.
+
+    Parameters:
+    routes (dict): Route name to (N, 2+) lon, lat array.
+
+    Returns:
+    Dictionary of route name to (N, 2) easting, northing array.
+    """
+    names = [n for n, xy in routes.items() if len(xy)]
+    if not names:
+        return {}
+    lonlat = np.concatenate([routes[n][:, :2] for n in names])
+    parts = np.split(transform(lonlat, wgs84_wkid, utm_wkid), np.cumsum([len(routes[n]) for n in names[:-1]]))
+    return dict(zip(names, parts))
+
+def route_extents(routes, distance):
+    """
+    Computes the buffered extent of every route at once.
+
+    The extent of a buffer is the route's bounding box grown by the buffer
+    distance, so no buffer geometry is needed.
+
+    Parameters:
+    routes (dict): Route name to (N, 2+) lon, lat array.
+    distance (str or float): Buffer distance, e.g. '2000 Feet', or meters.
+
+    Returns:
+    Dictionary of route name to {'utm': extent, 'wgs84': extent}, each (xmin, ymin, xmax, ymax).
+    """
+    d = to_meters(distance)
+    utm = project_routes(routes)
+    if not utm:
+        return {}
+    names = list(utm)
+    xy = np.concatenate([utm[n] for n in names])
+    starts = np.cumsum([0] + [len(utm[n]) for n in names[:-1]])
+    lo = np.minimum.reduceat(xy, starts) - d
+    hi = np.maximum.reduceat(xy, starts) + d
+
+    # corners and edge midpoints of each box, unprojected together
+    fx = np.array([0, 0.5, 1, 1, 1, 0.5, 0, 0])
+    fy = np.array([0, 0, 0, 0.5, 1, 1, 1, 0.5])
+    bx = lo[:, :1] + fx * (hi[:, :1] - lo[:, :1])
+    by = lo[:, 1:] + fy * (hi[:, 1:] - lo[:, 1:])
+    lon, lat = transformer(utm_wkid, wgs84_wkid)(bx, by)
+    wgs = np.column_stack((lon.min(axis=1), lat.min(axis=1), lon.max(axis=1), lat.max(axis=1)))
+    return {n: {'utm': tuple(np.hstack((lo[i], hi[i])).tolist()),
+                'wgs84': tuple(wgs[i].tolist())}
+            for i, n in enumerate(names)}
+
+def _ring_depth(rings):
+    """
+    Counts how many other rings contain each ring.
+
+    Parameters:
+    rings (list): (N, 2) closed rings that do not cross.
+
+    Returns:
+    List of nesting depths; odd depths are holes.
+    """
+    depth = []
+    for i, ring in enumerate(rings):
+        px, py = ring[0]
+        inside = 0
+        for j, other in enumerate(rings):
+            if i == j:
+                continue
+            x0, y0 = other[:-1, 0], other[:-1, 1]
+            x1, y1 = other[1:, 0], other[1:, 1]
+            cross = (y0 > py) != (y1 > py)
+            xc = x0[cross] + (py - y0[cross]) * (x1[cross] - x0[cross]) / (y1[cross] - y0[cross])
+            inside += int(np.count_nonzero(xc > px) % 2)
+        depth.append(inside)
+    return depth
+
+def buffer_route(xy, distance, resolution=24, piece=4):
+    """
+    Buffers a projected route with round ends and joins.
+
+    This is a raster approximation, not an exact geometric offset: the
+    outline is traced with marching squares on a grid of distances to the
+    route, interpolated between grid points, then simplified. Its vertices
+    lie within about 1% of the grid spacing (distance / resolution) of the
+    true buffer, and its edges within the simplification tolerance of an
+    eighth of the spacing, so it runs slightly inside round ends. A route
+    of one vertex is buffered as a disc. Each route segment only
+    measures the grid points in a band around it, long segments are split
+    into pieces first, so memory stays bounded by the band rather than by
+    grid size times route length.
+
+    Parameters:
+    xy (ndarray): (N, 2) route vertices in meters.
+    distance (float): Buffer distance in meters.
+    resolution (int): Grid points per buffer distance.
+    piece (float): Longest segment piece measured at once, in band widths.
+
+    Returns:
+    List of closed (M, 2) rings, outer rings clockwise and holes counter-clockwise.
+    """
+    h = distance / resolution
+    xy = xy[dp_mask(xy, h / 4)]
+    x0, y0 = xy.min(axis=0) - distance - 2 * h
+    x1, y1 = xy.max(axis=0) + distance + 2 * h
+    nx = int(np.ceil((x1 - x0) / h)) + 1
+    ny = int(np.ceil((y1 - y0) / h)) + 1
+
+    # grid points beyond the band never touch the outline, so they stay at inf
+    band = distance + 2 * h
+    if len(xy) > 1:
+        seg = xy[1:] - xy[:-1]
+        n = np.maximum(np.ceil(np.hypot(seg[:, 0], seg[:, 1]) / (piece * band)), 1).astype(np.int64)
+        step = np.repeat(seg / n[:, None], n, axis=0)
+        local = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        a = np.repeat(xy[:-1], n, axis=0) + local[:, None] * step
+        b = a + step
+    else:
+        # a single vertex is a zero-length segment, whose distances are those to the point
+        a = b = xy
+    field = np.full((ny, nx), np.inf)
+    lo = np.minimum(a, b) - band
+    hi = np.maximum(a, b) + band
+    c0 = np.maximum(np.floor((lo[:, 0] - x0) / h), 0).astype(np.int64)
+    c1 = np.minimum(np.ceil((hi[:, 0] - x0) / h) + 1, nx).astype(np.int64)
+    r0 = np.maximum(np.floor((y1 - hi[:, 1]) / h), 0).astype(np.int64)
+    r1 = np.minimum(np.ceil((y1 - lo[:, 1]) / h) + 1, ny).astype(np.int64)
+    for k in range(len(a)):
+        px = (x0 + h * np.arange(c0[k], c1[k]))[None, :] - a[k, 0]
+        py = (y1 - h * np.arange(r0[k], r1[k]))[:, None] - a[k, 1]
+        ab = b[k] - a[k]
+        t = np.clip((px * ab[0] + py * ab[1]) / max(ab @ ab, 1e-12), 0, 1)
+        d = np.hypot(px - t * ab[0], py - t * ab[1])
+        win = field[r0[k]:r1[k], c0[k]:c1[k]]
+        np.minimum(win, d, out=win)
+
+    a_ids, b_ids = contour_segments(field, distance)
+    rings = []
+    for ids in stitch_segments(a_ids, b_ids):
+        rc = edge_points(field, distance, np.array(ids))
+        ring = np.column_stack((x0 + rc[:, 1] * h, y1 - rc[:, 0] * h))
+        ring = ring[dp_mask(ring, h / 8)]
+        if len(ring) >= 4:
+            rings.append(ring)
+    for ring, depth in zip(rings, _ring_depth(rings)):
+        area = np.sum(ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1])
+        # clockwise outer rings have negative area with y up
+        if (area > 0) == (depth % 2 == 0):
+            ring[:] = ring[::-1]
+    return rings
+
+def buffer_routes(routes, distance, resolution=24):
+    """
+    Buffers every route in UTM 18N and returns Esri JSON polygons with their extents.
+
+    Parameters:
+    routes (dict): Route name to (N, 2+) lon, lat array.
+    distance (str or float): Buffer distance, e.g. '2000 Feet', or meters.
+    resolution (int): Grid points per buffer distance.
+
+    Returns:
+    buffers (dict): Route name to Esri JSON polygon in UTM 18N.
+    extents (dict): Output of route_extents.
+    """
+    d = to_meters(distance)
+    buffers = {name: {'rings': [r.tolist() for r in buffer_route(xy, d, resolution)],
+                      'spatialReference': {'wkid': utm_wkid}}
+               for name, xy in project_routes(routes).items()}
+    return buffers, route_extents(routes, d)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""hike_build.py: Tracks which Best Hikes datasets are up to date so rebuilds only redo what changed."""
+
+# SETUP
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+# FUNCTIONS
+
+def file_digest(path, stats=None, chunk=2**20):
+    """
+    Hashes the contents of a file, reusing the digest while size and mtime are unchanged.
+
+    Parameters:
+    path (str): Path of the file.
+    stats (dict): Path to [size, mtime, digest] of earlier hashes, updated in place.
+    chunk (int): Bytes read at a time.
+
+    Returns:
+    SHA-256 hex digest (str)
+    """
+    st = os.stat(path)
+    if stats is not None:
+        prev = stats.get(path)
+        if prev and prev[0] == st.st_size and prev[1] == st.st_mtime:
+            return prev[2]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    if stats is not None:
+        stats[path] = [st.st_size, st.st_mtime, digest]
+    return digest
+
+def array_digest(arrays):
+    """
+    Hashes a dictionary of NumPy arrays, e.g. route coordinates by name.
+
+    Parameters:
+    arrays (dict): Name to array.
+
+    Returns:
+    SHA-256 hex digest (str)
+    """
+    h = hashlib.sha256()
+    for name in sorted(arrays):
+        arr = np.ascontiguousarray(arrays[name])
+        h.update(str(name).encode('utf-8'))
+        h.update(str(arr.shape).encode('utf-8'))
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+class Manifest:
+    """
+    Build manifest recording the input hash each output was last built from.
+
+    The hash covers the contents of the input files and the stage parameters
+    such as extents or hillshade settings, so an output is rebuilt only when
+    something it depends on has changed.
+
+    Parameters:
+    path (str): Path of the manifest JSON file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = {'outputs': {}, 'files': {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+        self.stats = {'built': [], 'skipped': []}
+
+    def key(self, inputs=(), params=None):
+        """
+        Computes the hash of a stage's input files and parameters.
+
+        Parameters:
+        inputs (list): Paths of input files.
+        params (dict): JSON-serializable stage parameters.
+
+        Returns:
+        SHA-256 hex digest (str)
+        """
+        h = hashlib.sha256()
+        for path in inputs:
+            h.update(os.path.basename(path).encode('utf-8'))
+            h.update(file_digest(path, self.data['files']).encode('utf-8'))
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8'))
+        return h.hexdigest()
+
+    def is_current(self, output, key):
+        """
+        Checks whether an output was last built from the same inputs.
+
+        Parameters:
+        output (str): Output dataset path.
+        key (str): Hash from key().
+
+        Returns:
+        bool
+        """
+        return self.data['outputs'].get(output) == key
+
+    def record(self, output, key):
+        """
+        Records that an output has been built and saves the manifest.
+
+        Parameters:
+        output (str): Output dataset path.
+        key (str): Hash from key().
+
+        Returns:
+        None
+        """
+        self.data['outputs'][output] = key
+        self.save()
+
+    def forget(self, output):
+        """
+        Marks an output as needing a rebuild.
+
+        Parameters:
+        output (str): Output dataset path.
+
+        Returns:
+        None
+        """
+        if self.data['outputs'].pop(output, None) is not None:
+            self.save()
+
+    def save(self):
+        """
+        Writes the manifest to disk, replacing the file atomically.
+
+        Returns:
+        None
+        """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def stage(self, output, inputs, params, build, exists=os.path.exists, delete=None):
+        """
+        Runs a build step unless its output is current and still exists.
+
+        A stale output is deleted before it is rebuilt, since arcpy tools
+        will not replace it unless overwriteOutput is set. If the build
+        fails, a partly written output is deleted so the next run starts
+        clean.
+
+        Parameters:
+        output (str): Output dataset path.
+        inputs (list): Paths of input files.
+        params (dict): JSON-serializable stage parameters.
+        build (function): Called with no arguments to (re)build the output.
+        exists (function): Checks that the output dataset is present.
+        delete (function): Deletes a stale or partly written output dataset [opt]
+
+        Returns:
+        True if the output was built, False if it was skipped.
+        """
+        key = self.key(inputs, params)
+        if self.is_current(output, key) and exists(output):
+            self.stats['skipped'].append(output)
+            print(f'Stage \'{os.path.basename(output)}\' is up to date')
+            return False
+        self.forget(output)
+        if delete is not None and exists(output):
+            delete(output)
+        try:
+            build()
+        except Exception:
+            if delete is not None and exists(output):
+                delete(output)
+            raise
+        self.record(output, key)
+        self.stats['built'].append(output)
+        return True
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+
+"""hike_crs.py: Vectorized map projections and a registry of parsed coordinate systems for the Best Hikes maps."""
+
+# SETUP
+
+import re
+
+import numpy as np
+
+# WGS84 ellipsoid
+wgs84_a = 6378137.0
+wgs84_f = 1 / 298.257223563
+
+# UTM zone of Tompkins County
+utm_zone = 18
+
+# WKIDs used by the maps and services
+wgs84_wkid = 4326
+utm_wkid = 32618
+web_mercator_wkids = (3857, 102100)
+
+# FUNCTIONS
+
+def _tm_series(f=wgs84_f):
+    """
+    Computes the Krueger series coefficients of the transverse Mercator projection.
+
+    Parameters:
+    f (float): Ellipsoid flattening.
+
+    Returns:
+    Dictionary of the rectifying radius factor and the alpha, beta and delta series.
+    """
+    n = f / (2 - f)
+    return {'A': (1 + n ** 2 / 4 + n ** 4 / 64) / (1 + n),
+            'e': 2 * np.sqrt(n) / (1 + n),
+            'alpha': np.array([n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16 + 41 * n ** 4 / 180,
+                               13 * n ** 2 / 48 - 3 * n ** 3 / 5 + 557 * n ** 4 / 1440,
+                               61 * n ** 3 / 240 - 103 * n ** 4 / 140,
+                               49561 * n ** 4 / 161280]),
+            'beta': np.array([n / 2 - 2 * n ** 2 / 3 + 37 * n ** 3 / 96 - n ** 4 / 360,
+                              n ** 2 / 48 + n ** 3 / 15 - 437 * n ** 4 / 1440,
+                              17 * n ** 3 / 480 - 37 * n ** 4 / 840,
+                              4397 * n ** 4 / 161280]),
+            'delta': np.array([2 * n - 2 * n ** 2 / 3 - 2 * n ** 3 + 116 * n ** 4 / 45,
+                               7 * n ** 2 / 3 - 8 * n ** 3 / 5 - 227 * n ** 4 / 45,
+                               56 * n ** 3 / 15 - 136 * n ** 4 / 35,
+                               4279 * n ** 4 / 630])}
+
+tm_series = _tm_series()
+
+def utm_forward(lon, lat, zone=utm_zone, a=wgs84_a, k0=0.9996, false_easting=500000.0, false_northing=0.0):
+    """
+    Projects longitude, latitude arrays to UTM easting, northing.
+
+    Uses the 4th-order Krueger series, accurate to well under a millimeter
+    within the zone.
+
+    Parameters:
+    lon, lat (ndarray): Coordinates in degrees.
+    zone (int): UTM zone number.
+    a (float): Ellipsoid semi-major axis in meters.
+    k0 (float): Central meridian scale factor.
+    false_easting, false_northing (float): Offsets in meters.
+
+    Returns:
+    x, y (ndarray): Easting and northing in meters.
+    """
+    return tm_forward(lon, lat, zone * 6 - 183, a, k0, false_easting, false_northing)
+
+def tm_forward(lon, lat, lon0, a=wgs84_a, k0=0.9996, false_easting=0.0, false_northing=0.0):
+    """
+    Projects longitude, latitude arrays with a transverse Mercator projection.
+
+    Parameters:
+    lon, lat (ndarray): Coordinates in degrees.
+    lon0 (float): Central meridian in degrees.
+    a (float): Ellipsoid semi-major axis in meters.
+    k0 (float): Central meridian scale factor.
+    false_easting, false_northing (float): Offsets in meters.
+
+    Returns:
+    x, y (ndarray): Easting and northing in meters.
+    """
+    s = tm_series
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    lam = np.radians(np.asarray(lon, dtype=np.float64) - lon0)
+    e = s['e']
+    t = np.sinh(np.arctanh(np.sin(phi)) - e * np.arctanh(e * np.sin(phi)))
+    xi = np.arctan2(t, np.cos(lam))
+    eta = np.arctanh(np.sin(lam) / np.sqrt(1 + t ** 2))
+    j2 = 2 * np.arange(1, 5)[:, None]
+    xi_f, eta_f = xi.reshape(1, -1), eta.reshape(1, -1)
+    x = eta + (s['alpha'][:, None] * np.cos(j2 * xi_f) * np.sinh(j2 * eta_f)).sum(axis=0).reshape(eta.shape)
+    y = xi + (s['alpha'][:, None] * np.sin(j2 * xi_f) * np.cosh(j2 * eta_f)).sum(axis=0).reshape(xi.shape)
+    scale = k0 * a * s['A']
+    return false_easting + scale * x, false_northing + scale * y
+
+def utm_inverse(x, y, zone=utm_zone, a=wgs84_a, k0=0.9996, false_easting=500000.0, false_northing=0.0):
+    """
+    Converts UTM easting, northing arrays back to longitude, latitude.
+
+    Parameters:
+    x, y (ndarray): Easting and northing in meters.
+    zone (int): UTM zone number.
+    a (float): Ellipsoid semi-major axis in meters.
+    k0 (float): Central meridian scale factor.
+    false_easting, false_northing (float): Offsets in meters.
+
+    Returns:
+    lon, lat (ndarray): Coordinates in degrees.
+    """
+    return tm_inverse(x, y, zone * 6 - 183, a, k0, false_easting, false_northing)
+
+def tm_inverse(x, y, lon0, a=wgs84_a, k0=0.9996, false_easting=0.0, false_northing=0.0):
+    """
+    Converts transverse Mercator easting, northing arrays back to longitude, latitude.
+
+    Parameters:
+    x, y (ndarray): Easting and northing in meters.
+    lon0 (float): Central meridian in degrees.
+    a (float): Ellipsoid semi-major axis in meters.
+    k0 (float): Central meridian scale factor.
+    false_easting, false_northing (float): Offsets in meters.
+
+    Returns:
+    lon, lat (ndarray): Coordinates in degrees.
+    """
+    s = tm_series
+    scale = k0 * a * s['A']
+    xi = (np.asarray(y, dtype=np.float64) - false_northing) / scale
+    eta = (np.asarray(x, dtype=np.float64) - false_easting) / scale
+    j2 = 2 * np.arange(1, 5)[:, None]
+    xi_f, eta_f = xi.reshape(1, -1), eta.reshape(1, -1)
+    xi1 = xi - (s['beta'][:, None] * np.sin(j2 * xi_f) * np.cosh(j2 * eta_f)).sum(axis=0).reshape(xi.shape)
+    eta1 = eta - (s['beta'][:, None] * np.cos(j2 * xi_f) * np.sinh(j2 * eta_f)).sum(axis=0).reshape(eta.shape)
+    chi = np.arcsin(np.sin(xi1) / np.cosh(eta1))
+    lam = np.arctan2(np.sinh(eta1), np.cos(xi1))
+    chi_f = chi.reshape(1, -1)
+    phi = chi + (s['delta'][:, None] * np.sin(j2 * chi_f)).sum(axis=0).reshape(chi.shape)
+    return np.degrees(lam) + lon0, np.degrees(phi)
+
+def mercator_forward(lon, lat, r=wgs84_a):
+    """
+    Projects longitude, latitude arrays to Web Mercator.
+
+    Parameters:
+    lon, lat (ndarray): Coordinates in degrees.
+    r (float): Sphere radius in meters.
+
+    Returns:
+    x, y (ndarray): Web Mercator coordinates in meters.
+    """
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511287798, 85.0511287798)
+    return r * np.radians(lon), r * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+def mercator_inverse(x, y, r=wgs84_a):
+    """
+    Converts Web Mercator arrays back to longitude, latitude.
+
+    Parameters:
+    x, y (ndarray): Web Mercator coordinates in meters.
+    r (float): Sphere radius in meters.
+
+    Returns:
+    lon, lat (ndarray): Coordinates in degrees.
+    """
+    return (np.degrees(np.asarray(x, dtype=np.float64) / r),
+            np.degrees(2 * np.arctan(np.exp(np.asarray(y, dtype=np.float64) / r)) - np.pi / 2))
+
+def wkt_items(node):
+    """
+    Splits a WKT node such as PROJCS[...] into its top-level items.
+
+    Text after the node's closing bracket, e.g. a VERTCS, is ignored.
+
+    Parameters:
+    node (str): WKT text starting with the node keyword.
+
+    Returns:
+    List of item strings, e.g. '"NAD_1983_UTM_Zone_18N"' or 'UNIT["Meter",1.0]'.
+    """
+    start = node.index('[') + 1
+    items, depth, quoted, begin = [], 0, False, start
+    for i in range(start, len(node)):
+        ch = node[i]
+        if ch == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch == '[':
+            depth += 1
+        elif ch == ']':
+            if depth == 0:
+                items.append(node[begin:i].strip())
+                break
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            items.append(node[begin:i].strip())
+            begin = i + 1
+    return items
+
+class CRS:
+    """
+    Coordinate system parsed once from a WKID or Esri WKT.
+
+    Geographic systems, transverse Mercator systems such as UTM and state
+    plane zones, and Web Mercator are supported. NAD83 and WGS84 are treated
+    as the same datum, which is within a meter or two around Ithaca.
+
+    Parameters:
+    spec (int or str): WKID, or WKT text.
+    """
+    def __init__(self, spec):
+        self.spec = spec
+        self.unit = 1.0
+        if isinstance(spec, str) and spec.strip().isdigit():
+            spec = int(spec)
+        if isinstance(spec, int):
+            self._from_wkid(spec)
+        else:
+            self._from_wkt(spec)
+
+    def _from_wkid(self, wkid):
+        """
+        Sets the projection of a WKID.
+
+        Parameters:
+        wkid (int): Well-known ID.
+
+        Returns:
+        None
+        """
+        if wkid in (4326, 4269):
+            self.kind = 'geographic'
+        elif wkid in web_mercator_wkids:
+            self.kind = 'mercator'
+        elif 32601 <= wkid <= 32660 or 26901 <= wkid <= 26923:
+            self.kind = 'tm'
+            self.params = {'lon0': (wkid % 100) * 6 - 183, 'k0': 0.9996,
+                           'false_easting': 500000.0, 'false_northing': 0.0, 'lat0': 0.0}
+        else:
+            raise ValueError(f'Unsupported WKID {wkid}')
+
+    def _from_wkt(self, wkt):
+        """
+        Sets the projection of Esri WKT text.
+
+        Parameters:
+        wkt (str): WKT text.
+
+        Returns:
+        None
+        """
+        if not wkt.lstrip().upper().startswith('PROJCS'):
+            if wkt.lstrip().upper().startswith('GEOGCS'):
+                self.kind = 'geographic'
+                return
+            raise ValueError(f'Unsupported coordinate system {wkt[:40]}')
+        # only the PROJCS's own items, not those of its GEOGCS or of a VERTCS after it
+        items = ' '.join(item for item in wkt_items(wkt.lstrip()) if not item.upper().startswith('GEOGCS'))
+        proj = re.search(r'PROJECTION\["([^"]+)"', items).group(1).lower()
+        params = {k.lower(): float(v) for k, v in re.findall(r'PARAMETER\["([^"]+)",\s*([-\d.eE]+)\]', items)}
+        unit = re.search(r'UNIT\["([^"]+)",\s*([-\d.eE]+)\]', items)
+        self.unit = float(unit.group(2)) if unit else 1.0
+        if proj == 'transverse_mercator':
+            self.kind = 'tm'
+            self.params = {'lon0': params['central_meridian'],
+                           'k0': params.get('scale_factor', 1.0),
+                           'false_easting': params.get('false_easting', 0.0) * self.unit,
+                           'false_northing': params.get('false_northing', 0.0) * self.unit,
+                           'lat0': params.get('latitude_of_origin', 0.0)}
+        elif proj == 'mercator_auxiliary_sphere':
+            self.kind = 'mercator'
+        else:
+            raise ValueError(f'Unsupported projection {proj}')
+
+    def to_lonlat(self, x, y):
+        """
+        Converts coordinate arrays in this system to longitude, latitude.
+
+        Parameters:
+        x, y (ndarray): Coordinates in this system's units.
+
+        Returns:
+        lon, lat (ndarray): Coordinates in degrees.
+        """
+        if self.kind == 'geographic':
+            return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        x = np.asarray(x, dtype=np.float64) * self.unit
+        y = np.asarray(y, dtype=np.float64) * self.unit
+        if self.kind == 'mercator':
+            return mercator_inverse(x, y)
+        p = self.params
+        return tm_inverse(x, y + self._origin_northing(), p['lon0'], k0=p['k0'],
+                          false_easting=p['false_easting'], false_northing=p['false_northing'])
+
+    def from_lonlat(self, lon, lat):
+        """
+        Converts longitude, latitude arrays to this system.
+
+        Parameters:
+        lon, lat (ndarray): Coordinates in degrees.
+
+        Returns:
+        x, y (ndarray): Coordinates in this system's units.
+        """
+        if self.kind == 'geographic':
+            return np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        if self.kind == 'mercator':
+            x, y = mercator_forward(lon, lat)
+        else:
+            p = self.params
+            x, y = tm_forward(lon, lat, p['lon0'], k0=p['k0'],
+                              false_easting=p['false_easting'], false_northing=p['false_northing'])
+            y = y - self._origin_northing()
+        return x / self.unit, y / self.unit
+
+    def _origin_northing(self):
+        """
+        Northing of the latitude of origin on the central meridian.
+
+        Returns:
+        Meters (float)
+        """
+        if 'm0' not in self.params:
+            p = self.params
+            self.params['m0'] = float(tm_forward(p['lon0'], p['lat0'], p['lon0'], k0=p['k0'])[1]) if p['lat0'] else 0.0
+        return self.params['m0']
+
+# parsed coordinate systems keyed by WKID or WKT
+crs_cache = {}
+
+# transform functions keyed by (source, target)
+transform_cache = {}
+
+def crs_for(spec):
+    """
+    Returns the parsed coordinate system of a WKID or WKT, parsing each one once.
+
+    Parameters:
+    spec (int or str): WKID, or WKT text.
+
+    Returns:
+    CRS
+    """
+    if spec not in crs_cache:
+        crs_cache[spec] = CRS(spec)
+    return crs_cache[spec]
+
+def transformer(src, dst):
+    """
+    Returns a cached function that converts coordinate arrays between two systems.
+
+    Parameters:
+    src, dst (int or str): WKID or WKT of the source and target systems.
+
+    Returns:
+    Function of (x, y) arrays returning (x, y) arrays.
+    """
+    key = (src, dst)
+    if key not in transform_cache:
+        a, b = crs_for(src), crs_for(dst)
+        if a is b:
+            transform_cache[key] = lambda x, y: (np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        else:
+            transform_cache[key] = lambda x, y: b.from_lonlat(*a.to_lonlat(x, y))
+    return transform_cache[key]
+
+def transform(xy, src, dst):
+    """
+    Converts an (N, 2) coordinate array between two systems.
+
+    Parameters:
+    xy (ndarray): (N, 2+) coordinates; extra columns are dropped.
+    src, dst (int or str): WKID or WKT of the source and target systems.
+
+    Returns:
+    (N, 2) float64 array.
+    """
+    xy = np.asarray(xy, dtype=np.float64)
+    return np.column_stack(transformer(src, dst)(xy[:, 0], xy[:, 1]))
+
+def transform_extent(extent, src, dst, densify=8):
+    """
+    Converts an extent, following its edges so the result covers the projected box.
+
+    Parameters:
+    extent (sequence or str): xmin, ymin, xmax, ymax, or a 'xmin ymin xmax ymax ' string.
+    src, dst (int or str): WKID or WKT of the source and target systems.
+    densify (int): Points along each edge.
+
+    Returns:
+    List of xmin, ymin, xmax, ymax in the target system.
+    """
+    if isinstance(extent, str):
+        extent = extent.split()
+    xmin, ymin, xmax, ymax = [float(v) for v in extent]
+    t = np.linspace(0, 1, densify)
+    x = np.concatenate((xmin + t * (xmax - xmin), np.full(densify, xmax),
+                        xmax - t * (xmax - xmin), np.full(densify, xmin)))
+    y = np.concatenate((np.full(densify, ymin), ymin + t * (ymax - ymin),
+                        np.full(densify, ymax), ymax - t * (ymax - ymin)))
+    x, y = transformer(src, dst)(x, y)
+    return [float(x.min()), float(y.min()), float(x.max()), float(y.max())]
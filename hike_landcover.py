@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+"""hike_landcover.py: Turns NLCD land cover rasters into polygons for the Best Hikes maps."""
+
+# SETUP
+
+import time
+
+import numpy as np
+
+from hike_tracks import dp_mask, earth_r
+from hike_memory import strip_rows
+
+# NLCD classes drawn with the stipple fill: grassland/herbaceous and pasture/hay
+stipple_classes = [71, 81]
+
+# working memory per NLCD cell of generalize, measured with tracemalloc, for memory-budgeted strips
+landcover_cell_bytes = 48
+
+# FUNCTIONS
+
+def boundary_edges(mask):
+    """
+    Finds the cell edges between a mask and its surroundings.
+
+    Edges are directed so the masked cells lie on their right when drawn with
+    y pointing up, which makes outer rings clockwise and holes
+    counter-clockwise as in Esri JSON.
+
+    Parameters:
+    mask (ndarray): 2D boolean array, rows ordered north to south.
+
+    Returns:
+    (N, 4) int array of start col, start row, end col, end row on the vertex grid.
+    """
+    pad = np.pad(mask, 1, constant_values=False)
+    inner = pad[1:-1, 1:-1]
+    r, c = np.nonzero(inner & ~pad[:-2, 1:-1])
+    top = np.column_stack((c, r, c + 1, r))
+    r, c = np.nonzero(inner & ~pad[1:-1, 2:])
+    right = np.column_stack((c + 1, r, c + 1, r + 1))
+    r, c = np.nonzero(inner & ~pad[2:, 1:-1])
+    bottom = np.column_stack((c + 1, r + 1, c, r + 1))
+    r, c = np.nonzero(inner & ~pad[1:-1, :-2])
+    left = np.column_stack((c, r + 1, c, r))
+    return np.concatenate((top, right, bottom, left))
+
+def trace_rings(edges, ncols):
+    """
+    Chains directed boundary edges into closed rings.
+
+    Where two rings touch at a corner the walk turns right, so cells that
+    only meet diagonally become separate parts.
+
+    Parameters:
+    edges (ndarray): Output of boundary_edges.
+    ncols (int): Number of raster columns.
+
+    Returns:
+    List of (M, 2) int arrays of col, row vertices, first vertex repeated last.
+    """
+    width = ncols + 1
+    start = edges[:, 1] * width + edges[:, 0]
+    order = np.argsort(start, kind='stable')
+    first = np.searchsorted(start[order], np.arange(start.max() + 2 if len(start) else 1))
+
+    used = np.zeros(len(edges), dtype=bool)
+    rings = []
+    for e0 in range(len(edges)):
+        if used[e0]:
+            continue
+        ring = [edges[e0, :2]]
+        e = e0
+        while True:
+            used[e] = True
+            ring.append(edges[e, 2:])
+            v = edges[e, 3] * width + edges[e, 2]
+            options = [k for k in order[first[v]:first[v + 1]] if not used[k]]
+            if not options:
+                break
+            if len(options) > 1:
+                dc, dr = edges[e, 2] - edges[e, 0], edges[e, 3] - edges[e, 1]
+                right = (-dr, dc)
+                options.sort(key=lambda k: (edges[k, 2] - edges[k, 0], edges[k, 3] - edges[k, 1]) != right)
+            e = options[0]
+        rings.append(np.array(ring))
+    return rings
+
+def drop_collinear(ring):
+    """
+    Removes vertices in the middle of straight runs of a closed ring.
+
+    Parameters:
+    ring (ndarray): (M, 2) vertices with the first repeated last.
+
+    Returns:
+    Ring with only its corner vertices, still closed.
+    """
+    pts = ring[:-1]
+    d_in = pts - np.roll(pts, 1, axis=0)
+    d_out = np.roll(pts, -1, axis=0) - pts
+    corner = (d_in[:, 0] * d_out[:, 1] - d_in[:, 1] * d_out[:, 0]) != 0
+    pts = pts[corner]
+    return np.concatenate((pts, pts[:1]))
+
+def label_grid(codes, classes):
+    """
+    Keeps the requested class codes and sets every other cell to 0.
+
+    Parameters:
+    codes (ndarray): 2D array of class codes.
+    classes (list): Class codes to keep.
+
+    Returns:
+    2D int32 array of kept codes, 0 elsewhere.
+    """
+    return np.where(np.isin(codes, classes), codes, 0).astype(np.int32)
+
+def node_vertices(labels):
+    """
+    Flags the grid vertices where more than two regions meet.
+
+    Vertices with three or four different surrounding labels, and vertices
+    where two labels meet only diagonally, end the shared arcs.
+
+    Parameters:
+    labels (ndarray): Output of label_grid.
+
+    Returns:
+    2D boolean array on the (rows + 1, cols + 1) vertex grid.
+    """
+    pad = np.pad(labels, 1, constant_values=0)
+    a, b = pad[:-1, :-1], pad[:-1, 1:]
+    c, d = pad[1:, :-1], pad[1:, 1:]
+    distinct = (1 + (b != a) + ((c != a) & (c != b)) + ((d != a) & (d != b) & (d != c)))
+    diagonal = (a == d) & (b == c) & (a != b)
+    return (distinct >= 3) | diagonal
+
+def _split_ring(ring, nodes, width):
+    """
+    Splits a traced ring into pieces running from node to node.
+
+    Parameters:
+    ring (ndarray): (M, 2) col, row vertices, first repeated last.
+    nodes (ndarray): Output of node_vertices.
+    width (int): Number of vertex columns.
+
+    Returns:
+    List of (vertex ids, is_loop) pieces.
+    """
+    vid = ring[:-1, 1] * width + ring[:-1, 0]
+    at_node = np.nonzero(nodes[ring[:-1, 1], ring[:-1, 0]])[0]
+    if len(at_node) == 0:
+        # closed boundary without nodes, rotated to start at its smallest vertex
+        k = int(np.argmin(vid))
+        vid = np.roll(vid, -k)
+        return [(np.append(vid, vid[0]), True)]
+    vid = np.roll(vid, -at_node[0])
+    at_node = at_node - at_node[0]
+    vid = np.append(vid, vid[0])
+    bounds = list(at_node) + [len(vid) - 1]
+    return [(vid[i:j + 1], False) for i, j in zip(bounds[:-1], bounds[1:])]
+
+def _smooth_arc(xy, closed):
+    """
+    Cuts the corners of a staircase arc by moving to segment midpoints.
+
+    Midpoints are taken on the unit cell edges before straight runs are
+    merged, so only single staircase steps are cut and long straight edges
+    keep their length. The end vertices of open arcs stay fixed so arcs
+    still meet at nodes.
+
+    Parameters:
+    xy (ndarray): (M, 2) arc vertices, one per unit cell edge.
+    closed (bool): Whether the arc is a closed loop.
+
+    Returns:
+    Smoothed (K, 2) arc vertices.
+    """
+    mids = (xy[:-1] + xy[1:]) / 2
+    if closed:
+        pts = np.concatenate((mids, mids[:1]))
+    else:
+        pts = np.concatenate((xy[:1], mids, xy[-1:]))
+    d_in = pts[1:-1] - pts[:-2]
+    d_out = pts[2:] - pts[1:-1]
+    turn = (d_in[:, 0] * d_out[:, 1] - d_in[:, 1] * d_out[:, 0]) != 0
+    return np.concatenate((pts[:1], pts[1:-1][turn], pts[-1:]))
+
+def generalize(codes, extent, classes=stipple_classes, tol=5.0, wkid=4326, seams=(False, False)):
+    """
+    Builds smoothed and simplified land cover polygons whose shared edges stay gap-free.
+
+    Boundaries are cut into arcs between the vertices where regions meet.
+    Each arc is smoothed and simplified once and reused, reversed, by the
+    polygon on its other side, so neighbouring polygons never open gaps or
+    overlaps.
+
+    Parameters:
+    codes (ndarray): 2D array of class codes, rows ordered north to south.
+    extent (sequence): xmin, ymin, xmax, ymax of the raster.
+    classes (list): Class codes to vectorize.
+    tol (float): Simplification tolerance in meters, e.g. from the print scale.
+    wkid (int): Well-known ID of the extent coordinate system.
+    seams (tuple): Whether the top and bottom rows border another strip; their vertices stay fixed.
+
+    Returns:
+    features (list): (gridcode, Esri JSON polygon) for each class present.
+    stats (dict): Arc counts, vertex counts before and after, and timings.
+    """
+    t0 = time.perf_counter()
+    xmin, ymin, xmax, ymax = [float(v) for v in extent]
+    nrows, ncols = codes.shape
+    cx = (xmax - xmin) / ncols
+    cy = (ymax - ymin) / nrows
+    lat0 = np.radians((ymin + ymax) / 2)
+    # meters per vertex-grid step, for tolerances
+    mx = np.radians(cx) * np.cos(lat0) * earth_r
+    my = np.radians(cy) * earth_r
+    width = ncols + 1
+
+    labels = label_grid(codes, classes)
+    nodes = node_vertices(labels)
+    # pinning the strip seams keeps the pieces of the neighbouring strips meeting exactly
+    if seams[0]:
+        nodes[0] = True
+    if seams[1]:
+        nodes[-1] = True
+    traced = {}
+    for code in classes:
+        mask = labels == code
+        if mask.any():
+            traced[code] = trace_rings(boundary_edges(mask), ncols)
+    t_trace = time.perf_counter()
+
+    arcs = {}
+    stats = {'arcs': 0, 'vertices_before': 0, 'vertices_after': 0, 'rings_dropped': 0}
+
+    def arc_xy(vids, closed):
+        # shared arcs are keyed by their first two vertices in either direction
+        fwd, rev = (vids[0], vids[1]), (vids[-1], vids[-2])
+        if fwd in arcs:
+            return arcs[fwd]
+        if rev in arcs:
+            return arcs[rev][::-1]
+        grid = np.column_stack((vids % width, vids // width)).astype(np.float64)
+        xy = _smooth_arc(grid, closed)
+        keep = dp_mask(xy * (mx, my), tol)
+        if closed and keep.sum() < 4:
+            keep[:] = True
+        arcs[fwd] = xy[keep]
+        stats['arcs'] += 1
+        return arcs[fwd]
+
+    features = []
+    for code, rings in traced.items():
+        xy_rings = []
+        for ring in rings:
+            stats['vertices_before'] += len(drop_collinear(ring))
+            pieces = [arc_xy(vids, closed) for vids, closed in _split_ring(ring, nodes, width)]
+            grid = np.concatenate([pieces[0]] + [p[1:] for p in pieces[1:]])
+            if len(grid) < 4:
+                stats['rings_dropped'] += 1
+                continue
+            stats['vertices_after'] += len(grid)
+            xy = np.column_stack((xmin + grid[:, 0] * cx, ymax - grid[:, 1] * cy))
+            xy_rings.append(xy.tolist())
+        if xy_rings:
+            features.append((int(code), {'rings': xy_rings, 'spatialReference': {'wkid': wkid}}))
+
+    t1 = time.perf_counter()
+    stats['trace_seconds'] = round(t_trace - t0, 4)
+    stats['generalize_seconds'] = round(t1 - t_trace, 4)
+    return features, stats
+
+def generalize_strips(codes, extent, classes=stipple_classes, tol=5.0, wkid=4326, budget=None):
+    """
+    Generalizes land cover one row strip at a time to stay within a memory budget.
+
+    Polygons are cut at the strip seams, whose vertices are kept fixed, so
+    the pieces of neighbouring strips share their seam edges exactly and the
+    fill stays gap-free. Without a budget the raster is a single strip and
+    the result matches generalize.
+
+    Parameters:
+    codes (ndarray): 2D array of class codes, rows ordered north to south.
+    extent (sequence): xmin, ymin, xmax, ymax of the raster.
+    classes (list): Class codes to vectorize.
+    tol (float): Simplification tolerance in meters.
+    wkid (int): Well-known ID of the extent coordinate system.
+    budget (str or int): Working memory cap, e.g. '256 MB' [opt]
+
+    Yields:
+    features (list): (gridcode, Esri JSON polygon) for each class present in the strip.
+    stats (dict): Output of generalize for the strip.
+    """
+    xmin, ymin, xmax, ymax = [float(v) for v in extent]
+    nrows = codes.shape[0]
+    cy = (ymax - ymin) / nrows
+    rows = strip_rows(codes.shape, landcover_cell_bytes, budget)
+    for r0 in range(0, nrows, rows):
+        r1 = min(r0 + rows, nrows)
+        ext = (xmin, ymax - r1 * cy, xmax, ymax - r0 * cy)
+        yield generalize(codes[r0:r1], ext, classes, tol, wkid, (r0 > 0, r1 < nrows))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""hike_memory.py: Sizes raster strips to a memory budget and reports the memory each build stage used."""
+
+# SETUP
+
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+# bytes per unit, keyed by lowercase unit name
+size_units = {'b': 1,
+              'kb': 2**10,
+              'mb': 2**20,
+              'gb': 2**30}
+
+# stages measured by MemoryMonitor, in the order they finished
+memory_log = []
+
+# FUNCTIONS
+
+def to_bytes(size):
+    """
+    Converts a size like '512 MB' or a number of bytes to bytes.
+
+    Parameters:
+    size (str or int): Size with a unit, or bytes.
+
+    Returns:
+    Size in bytes (int)
+    """
+    if isinstance(size, str):
+        value, unit = re.match(r'\s*([\d.]+)\s*(\w*)', size).groups()
+        return int(float(value) * size_units[(unit or 'b').lower()])
+    return int(size)
+
+def strip_rows(shape, cell_bytes, budget=None, min_rows=2):
+    """
+    Picks how many raster rows to process at a time to stay within a memory budget.
+
+    Parameters:
+    shape (tuple): Rows and columns of the raster.
+    cell_bytes (float): Working memory per cell of a strip, from the stage's arrays.
+    budget (str or int): Memory cap, e.g. '512 MB', or None for the whole raster.
+    min_rows (int): Fewest rows per strip.
+
+    Returns:
+    Rows per strip (int)
+    """
+    nrows, ncols = shape
+    if budget is None:
+        return max(nrows, min_rows)
+    rows = int(to_bytes(budget) // max(cell_bytes * ncols, 1))
+    return max(min(rows, nrows), min_rows)
+
+def rss():
+    """
+    Reads the current and peak resident memory of this process.
+
+    Returns:
+    current, peak (int): Bytes, or None where the platform does not report them.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        c = Counters()
+        c.cb = ctypes.sizeof(c)
+        proc = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(proc, ctypes.byref(c), c.cb):
+            return c.WorkingSetSize, c.PeakWorkingSetSize
+        return None, None
+    try:
+        with open('/proc/self/status') as f:
+            status = dict(line.split(':', 1) for line in f)
+        return (int(status['VmRSS'].split()[0]) * 1024, int(status['VmHWM'].split()[0]) * 1024)
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None, peak if sys.platform == 'darwin' else peak * 1024
+
+def reset_peak_rss():
+    """
+    Resets the peak resident memory of this process where the platform allows it (Linux).
+
+    Returns:
+    True if the peak was reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+class MemoryMonitor:
+    """
+    Measures the memory a block of work uses, with tracemalloc and the process RSS.
+
+    tracemalloc counts the Python and NumPy allocations made inside the block,
+    while the RSS figures also include memory maps and native libraries. On
+    leaving, the figures are appended to memory_log for print_summary, so a
+    build prints one table instead of a line per stage.
+
+    Parameters:
+    name (str): Stage name.
+    enabled (bool): Measure the block; when False the monitor does nothing.
+    top (int): Allocation sites still holding memory after the block to list.
+    """
+    def __init__(self, name, enabled=True, top=3):
+        self.name = name
+        self.enabled = enabled
+        self.top = top
+        self.stats = {}
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.peak_reset = reset_peak_rss()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        current, peak = tracemalloc.get_traced_memory()
+        sites = tracemalloc.take_snapshot().statistics('lineno')[:self.top]
+        if self.started:
+            tracemalloc.stop()
+        rss1 = rss()
+        mb = 1 / 2**20
+        self.stats = {'stage': self.name,
+                      'seconds': round(time.perf_counter() - self.t0, 3),
+                      'alloc_peak_mb': round((peak - self.base) * mb, 1),
+                      'alloc_kept_mb': round((current - self.base) * mb, 1),
+                      'rss_mb': round(rss1[0] * mb, 1) if rss1[0] else None,
+                      'rss_peak_mb': round(rss1[1] * mb, 1) if rss1[1] else None,
+                      'rss_peak_is_stage': self.peak_reset,
+                      'kept_sites': [f'{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno} '
+                                    f'{s.size * mb:.1f} MB' for s in sites if s.size >= 2**20]}
+        memory_log.append(self.stats)
+        return False
+
+def print_summary(log=None):
+    """
+    Prints the stages measured by MemoryMonitor as a table, with the allocation sites they kept.
+
+    An RSS peak marked * is the process peak, where the platform cannot reset it per stage.
+
+    Parameters:
+    log (list): Stage figures, memory_log by default.
+
+    Returns:
+    None
+    """
+    log = memory_log if log is None else log
+    if not log:
+        return
+    print(f'{"stage":<28} {"wall s":>8} {"alloc MB":>9} {"kept MB":>8} {"RSS MB":>8} {"peak MB":>8}')
+    for st in log:
+        peak = '' if st['rss_peak_mb'] is None else f'{st["rss_peak_mb"]:.1f}' + ('' if st['rss_peak_is_stage'] else '*')
+        rss_mb = '' if st['rss_mb'] is None else f'{st["rss_mb"]:.1f}'
+        print(f'{st["stage"][:28]:<28} {st["seconds"]:>8.2f} {st["alloc_peak_mb"]:>9.1f} '
+              f'{st["alloc_kept_mb"]:>8.1f} {rss_mb:>8} {peak:>8}')
+    for st in log:
+        if st['kept_sites']:
+            print(f'Memory kept after \'{st["stage"]}\': {", ".join(st["kept_sites"])}')
+    pass
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""hike_poi.py: Grid index over the points of interest table for per-trail selection."""
+
+# SETUP
+
+import os
+import csv
+
+import numpy as np
+
+from hike_tracks import earth_r, local_xy
+from hike_build import file_digest
+
+# FUNCTIONS
+
+def read_poi_csv(csv_path, x_field='longitude', y_field='latitude'):
+    """
+    Reads the POI table into coordinate and attribute arrays.
+
+    Parameters:
+    csv_path (str): Path of the POI CSV.
+    x_field (str): Longitude column.
+    y_field (str): Latitude column.
+
+    Returns:
+    xy (ndarray): (N, 2) float64 longitude, latitude.
+    columns (list): Attribute column names, coordinates excluded.
+    rows (ndarray): (N, len(columns)) string array of attribute values.
+    """
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        columns = [c for c in reader.fieldnames if c not in (x_field, y_field)]
+        xy, rows = [], []
+        for rec in reader:
+            try:
+                xy.append((float(rec[x_field]), float(rec[y_field])))
+            except (TypeError, ValueError):
+                continue
+            rows.append([rec[c] or '' for c in columns])
+    return (np.array(xy, dtype=np.float64).reshape(-1, 2), columns,
+            np.array(rows, dtype=str).reshape(len(xy), len(columns)))
+
+def column_types(rows):
+    """
+    Infers the field type of each attribute column, as ArcGIS does reading a CSV.
+
+    Columns whose filled values are all whole numbers in the 32-bit range
+    are LONG, columns of other numbers DOUBLE, and the rest TEXT.
+
+    Parameters:
+    rows (ndarray): (N, M) string array of attribute values.
+
+    Returns:
+    List of 'LONG', 'DOUBLE' or 'TEXT' per column.
+    """
+    types = []
+    for col in rows.T:
+        values = [v.strip() for v in col.tolist() if v.strip()]
+        try:
+            nums = [float(v) for v in values]
+        except ValueError:
+            nums = None
+        if not values or nums is None:
+            types.append('TEXT')
+        elif all(v.lstrip('+-').isdigit() for v in values) and all(abs(n) < 2 ** 31 for n in nums):
+            types.append('LONG')
+        else:
+            types.append('DOUBLE')
+    return types
+
+class POIIndex:
+    """
+    Uniform grid index over the POI table, saved next to the CSV and reused.
+
+    Points are sorted by grid cell, so a window query reads one contiguous
+    slice of the sorted points per grid row before the exact test.
+
+    Parameters:
+    csv_path (str): Path of the POI CSV.
+    cell (float): Grid cell size in degrees.
+    x_field (str): Longitude column.
+    y_field (str): Latitude column.
+    """
+    def __init__(self, csv_path, cell=0.01, x_field='longitude', y_field='latitude'):
+        self.csv_path = csv_path
+        self.path = os.path.splitext(csv_path)[0] + '.poi_index.npz'
+        digest = file_digest(csv_path)
+        if os.path.exists(self.path):
+            with np.load(self.path) as idx:
+                if 'types' in idx.files and str(idx['digest']) == digest and float(idx['cell']) == cell:
+                    self._load(idx)
+                    self.stats = {'built': False, 'queries': 0}
+                    return
+        self._build(digest, cell, x_field, y_field)
+        self.stats = {'built': True, 'queries': 0}
+
+    def _load(self, idx):
+        """
+        Restores the index arrays from the saved .npz file.
+
+        Parameters:
+        idx (NpzFile): Opened index file.
+
+        Returns:
+        None
+        """
+        self.xy = idx['xy']
+        self.columns = [str(c) for c in idx['columns']]
+        self.types = [str(t) for t in idx['types']]
+        self.rows = idx['rows']
+        self.cell = float(idx['cell'])
+        self.origin = tuple(idx['origin'])
+        self.shape = tuple(int(v) for v in idx['shape'])
+        self.starts = idx['starts']
+
+    def _build(self, digest, cell, x_field, y_field):
+        """
+        Sorts the POI table by grid cell and saves the index next to the CSV.
+
+        Parameters:
+        digest (str): Hash of the CSV the index is built from.
+        cell (float): Grid cell size in degrees.
+        x_field (str): Longitude column.
+        y_field (str): Latitude column.
+
+        Returns:
+        None
+        """
+        xy, columns, rows = read_poi_csv(self.csv_path, x_field, y_field)
+        origin = xy.min(axis=0) if len(xy) else np.zeros(2)
+        ij = np.floor((xy - origin) / cell).astype(np.int64)
+        shape = (int(ij[:, 1].max()) + 1, int(ij[:, 0].max()) + 1) if len(xy) else (1, 1)
+        key = ij[:, 1] * shape[1] + ij[:, 0]
+        order = np.argsort(key, kind='stable')
+        starts = np.searchsorted(key[order], np.arange(shape[0] * shape[1] + 1))
+
+        self.xy, self.columns, self.rows = xy[order], columns, rows[order]
+        self.types = column_types(rows)
+        self.cell, self.origin, self.shape, self.starts = cell, tuple(origin), shape, starts
+        tmp = f'{self.path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, xy=self.xy, columns=np.array(columns, dtype=str), types=np.array(self.types, dtype=str),
+                 rows=self.rows, cell=cell, origin=origin, shape=shape, starts=starts, digest=digest)
+        os.replace(tmp, self.path)
+
+    def candidates(self, xmin, ymin, xmax, ymax):
+        """
+        Lists the points in the grid cells overlapping a window.
+
+        Parameters:
+        xmin, ymin, xmax, ymax (float): Window in degrees.
+
+        Returns:
+        Indices into the sorted points (ndarray).
+        """
+        nrows, ncols = self.shape
+        c0, r0 = np.floor((np.array([xmin, ymin]) - self.origin) / self.cell).astype(int)
+        c1, r1 = np.floor((np.array([xmax, ymax]) - self.origin) / self.cell).astype(int)
+        c0, c1 = max(c0, 0), min(c1, ncols - 1)
+        r0, r1 = max(r0, 0), min(r1, nrows - 1)
+        if c0 > c1 or r0 > r1:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(self.starts[r * ncols + c0], self.starts[r * ncols + c1 + 1])
+                               for r in range(r0, r1 + 1)])
+
+    def within(self, xmin, ymin, xmax, ymax):
+        """
+        Finds the points inside a window, e.g. a trail's topo_ext.
+
+        Parameters:
+        xmin, ymin, xmax, ymax (float): Window in degrees.
+
+        Returns:
+        Indices into xy and rows (ndarray).
+        """
+        self.stats['queries'] += 1
+        idx = self.candidates(xmin, ymin, xmax, ymax)
+        x, y = self.xy[idx, 0], self.xy[idx, 1]
+        return idx[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]
+
+    def near(self, coords, distance):
+        """
+        Finds the points within a distance of a route, like a route buffer.
+
+        Parameters:
+        coords (ndarray): (N, 2+) route lon, lat vertices.
+        distance (float): Buffer distance in meters.
+
+        Returns:
+        Indices into xy and rows (ndarray).
+        """
+        self.stats['queries'] += 1
+        coords = np.asarray(coords, dtype=np.float64)[:, :2]
+        lat = np.radians(np.nanmean(coords[:, 1]))
+        dy = np.degrees(distance / earth_r)
+        dx = dy / np.cos(lat)
+        (xmin, ymin), (xmax, ymax) = np.nanmin(coords, axis=0), np.nanmax(coords, axis=0)
+        idx = self.candidates(xmin - dx, ymin - dy, xmax + dx, ymax + dy)
+        if not len(idx) or len(coords) < 2:
+            return idx[:0]
+
+        # route and candidates in one local metric frame
+        xy = local_xy(np.vstack((coords, self.xy[idx])))
+        line, pts = xy[:len(coords)], xy[len(coords):]
+        a, b = line[:-1], line[1:]
+        ab = b - a
+        ab2 = np.maximum((ab ** 2).sum(axis=1), 1e-12)
+        ap_ = pts[:, None, :] - a[None, :, :]
+        t = np.clip((ap_ * ab[None]).sum(axis=2) / ab2[None], 0, 1)
+        d = np.hypot(*(ap_ - t[..., None] * ab[None]).transpose(2, 0, 1))
+        return idx[np.nanmin(d, axis=1) <= distance]
+
+    def records(self, idx):
+        """
+        Returns the selected points with their attributes as values of the column types.
+
+        Parameters:
+        idx (ndarray): Indices from within or near.
+
+        Returns:
+        List of ((lon, lat), [values...]) in column order; empty numbers are None.
+        """
+        casts = [int if t == 'LONG' else float if t == 'DOUBLE' else None for t in self.types]
+        rows = [[v if cast is None else cast(v) if v.strip() else None for cast, v in zip(casts, row)]
+                for row in self.rows[idx].tolist()]
+        return list(zip(map(tuple, self.xy[idx].tolist()), rows))
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+
+"""hike_preview.py: Draws draft PNG previews of Best Hikes trail maps from the cached pipeline data, without arcpy."""
+
+# SETUP
+
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+
+import numpy as np
+
+import hike_crs
+import hike_poi
+import hike_batch
+import hike_tracks
+import hike_terrain
+import hike_services
+import hike_landcover
+
+# route and POI inputs in the data folder, as read by the map script
+gpx_name = 'best-hikes-all-routes-22Jan25.gpx'
+poi_name = 'POI_hikes_18Jan25.csv'
+
+# service layers drawn in order: name, service constant in the map script, layer id
+# (None takes the trail's roads scale level), geometry, RGB, alpha, width in points
+preview_layers = [('hydro', 'nys_hydro', '9', 'polygon', [153, 153, 153], 1.0, 0),
+                  ('streams', 'nys_hydro', '15', 'line', [153, 153, 153], 1.0, 0.6),
+                  ('roads', 'nys_streets', None, 'line', [76, 76, 76], 1.0, 1.5),
+                  ('rails', 'usa_rails', '0', 'line', [102, 102, 102], 1.0, 1.0)]
+
+# FUNCTIONS
+
+class Canvas:
+    """
+    RGB raster of the map frame with a geographic camera, as set by set_mf.
+
+    Parameters:
+    camx, camy (float): Camera center longitude and latitude.
+    scale (float): Map scale denominator.
+    frame (tuple): Map frame width and height in inches.
+    dpi (int): Draft resolution.
+    """
+    def __init__(self, camx, camy, scale, frame=hike_tracks.map_frame, dpi=96):
+        self.width = int(round(frame[0] * dpi))
+        self.height = int(round(frame[1] * dpi))
+        self.dpi = dpi
+        self.camx, self.camy = camx, camy
+        m_px = scale * 0.0254 / dpi
+        m_per_deg = np.radians(1) * hike_tracks.earth_r
+        self.dlat = m_px / m_per_deg
+        self.dlon = self.dlat / np.cos(np.radians(camy))
+        self.rgb = np.full((self.height, self.width, 3), 255.0)
+
+    def extent(self):
+        """
+        Returns the frame extent as xmin, ymin, xmax, ymax in degrees.
+        """
+        hw, hh = self.width / 2 * self.dlon, self.height / 2 * self.dlat
+        return [self.camx - hw, self.camy - hh, self.camx + hw, self.camy + hh]
+
+    def to_px(self, xy):
+        """
+        Converts (N, 2) lon, lat to fractional pixel column, row.
+        """
+        xy = np.asarray(xy, dtype=np.float64)
+        return np.column_stack(((xy[:, 0] - self.camx) / self.dlon + self.width / 2,
+                                self.height / 2 - (xy[:, 1] - self.camy) / self.dlat))
+
+    def centers(self):
+        """
+        Returns the lon, lat of every pixel center as two 2D arrays.
+        """
+        cols = np.arange(self.width) + 0.5
+        rows = np.arange(self.height) + 0.5
+        lon = self.camx + (cols - self.width / 2) * self.dlon
+        lat = self.camy - (rows - self.height / 2) * self.dlat
+        return np.meshgrid(lon, lat)
+
+    def points(self, pt):
+        """
+        Converts a width in points to pixels.
+        """
+        return pt / 72.0 * self.dpi
+
+    def paint(self, mask, rgb, alpha=1.0):
+        """
+        Blends a color into the pixels of a mask.
+
+        Parameters:
+        mask (ndarray): 2D boolean or 0-1 coverage array.
+        rgb (list): Color as 0-255 RGB.
+        alpha (float): Opacity.
+
+        Returns:
+        None
+        """
+        a = (np.asarray(mask, dtype=np.float64) * alpha)[..., None]
+        self.rgb = self.rgb * (1 - a) + np.asarray(rgb, dtype=np.float64) * a
+
+    def fill_mask(self, rings):
+        """
+        Rasterizes polygon rings with the even-odd rule at pixel centers.
+
+        Parameters:
+        rings (list): (N, 2) pixel-space rings.
+
+        Returns:
+        2D boolean mask.
+        """
+        toggles = np.zeros((self.height, self.width + 1), dtype=np.int32)
+        for ring in rings:
+            a, b = ring[:-1], ring[1:]
+            lo = np.ceil(np.minimum(a[:, 1], b[:, 1]) - 0.5).astype(np.int64)
+            hi = np.ceil(np.maximum(a[:, 1], b[:, 1]) - 0.5).astype(np.int64)
+            lo, hi = np.clip(lo, 0, self.height), np.clip(hi, 0, self.height)
+            n = hi - lo
+            keep = n > 0
+            if not keep.any():
+                continue
+            a, b, lo, n = a[keep], b[keep], lo[keep], n[keep]
+            edge = np.repeat(np.arange(len(n)), n)
+            row = lo[edge] + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            yc = row + 0.5
+            t = (yc - a[edge, 1]) / (b[edge, 1] - a[edge, 1])
+            xc = a[edge, 0] + t * (b[edge, 0] - a[edge, 0])
+            col = np.clip(np.ceil(xc - 0.5).astype(np.int64), 0, self.width)
+            np.add.at(toggles, (row, col), 1)
+        return (np.cumsum(toggles, axis=1)[:, :-1] % 2).astype(bool)
+
+    def line_mask(self, paths, width):
+        """
+        Rasterizes polylines with round caps at a pixel width.
+
+        Parameters:
+        paths (list): (N, 2) pixel-space paths.
+        width (float): Line width in pixels.
+
+        Returns:
+        2D boolean mask.
+        """
+        mask = np.zeros((self.height, self.width), dtype=bool)
+        r = max(width / 2, 0.5)
+        off = np.arange(-int(np.ceil(r)), int(np.ceil(r)) + 1)
+        ox, oy = np.meshgrid(off, off)
+        disk = (ox ** 2 + oy ** 2) <= r ** 2 + 0.25
+        ox, oy = ox[disk], oy[disk]
+        for path in paths:
+            if len(path) < 2:
+                continue
+            seg = np.hypot(*np.diff(path, axis=0).T)
+            steps = np.maximum(np.ceil(seg / 0.5).astype(np.int64), 1)
+            idx = np.repeat(np.arange(len(seg)), steps)
+            t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+            pts = path[idx] + t[:, None] * (path[idx + 1] - path[idx])
+            pts = np.vstack((pts, path[-1:]))
+            inside = ((pts[:, 0] > -r - 1) & (pts[:, 0] < self.width + r + 1) &
+                      (pts[:, 1] > -r - 1) & (pts[:, 1] < self.height + r + 1))
+            pts = pts[inside]
+            if not len(pts):
+                continue
+            cx = (np.floor(pts[:, 0]).astype(np.int64)[:, None] + ox).ravel()
+            cy = (np.floor(pts[:, 1]).astype(np.int64)[:, None] + oy).ravel()
+            ok = (cx >= 0) & (cx < self.width) & (cy >= 0) & (cy < self.height)
+            mask[cy[ok], cx[ok]] = True
+        return mask
+
+    def save_png(self, path):
+        """
+        Writes the canvas as an 8-bit RGB PNG.
+
+        Parameters:
+        path (str): Output file.
+
+        Returns:
+        None
+        """
+        img = np.clip(np.round(self.rgb), 0, 255).astype(np.uint8)
+        raw = np.hstack((np.zeros((self.height, 1), dtype=np.uint8),
+                         img.reshape(self.height, -1))).tobytes()
+
+        def chunk(tag, data):
+            return (struct.pack('>I', len(data)) + tag + data +
+                    struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+            f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)))
+            f.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+            f.write(chunk(b'IEND', b''))
+
+def draw_hillshade(cv, store_dir, params=hike_terrain.hillshade_params, gamma=2.0):
+    """
+    Shades the canvas with a hillshade of the local DEM store, if its tiles are filled.
+
+    Returns:
+    True if drawn.
+    """
+    if not os.path.exists(os.path.join(store_dir, 'meta.json')):
+        return False
+    store = hike_terrain.DEMStore(store_dir)
+    wkt = store.meta['wkt']
+    try:
+        dem, ul = store.window(*hike_crs.transform_extent(cv.extent(), hike_crs.wgs84_wkid, wkt))
+    except ValueError:
+        return False
+    cx, cy = store.meta['cellsize']
+    hs = hike_terrain.hillshade(dem, (cx, cy), workers=1, **params)
+    lon, lat = cv.centers()
+    x, y = hike_crs.transformer(hike_crs.wgs84_wkid, wkt)(lon.ravel(), lat.ravel())
+    shade = hike_terrain.bilinear(hs.astype(np.float64), (ul[1] - y) / cy - 0.5, (x - ul[0]) / cx - 0.5)
+    shade = np.nan_to_num(shade.reshape(lon.shape), nan=255.0) / 255.0
+    cv.rgb *= (shade ** (1 / gamma))[..., None]
+    return True
+
+def draw_landcover(cv, nlcd_npz, classes=hike_landcover.stipple_classes, step=4):
+    """
+    Stipples the canvas where the cached NLCD window has the stipple classes.
+
+    Returns:
+    True if drawn.
+    """
+    if not os.path.exists(nlcd_npz):
+        return False
+    with np.load(nlcd_npz) as f:
+        codes, (xmin, ymin, xmax, ymax) = f['codes'], f['extent']
+    lon, lat = cv.centers()
+    nrows, ncols = codes.shape
+    r = np.floor((ymax - lat) / (ymax - ymin) * nrows).astype(np.int64)
+    c = np.floor((lon - xmin) / (xmax - xmin) * ncols).astype(np.int64)
+    inside = (r >= 0) & (r < nrows) & (c >= 0) & (c < ncols)
+    land = np.zeros(lon.shape, dtype=bool)
+    land[inside] = np.isin(codes[r[inside], c[inside]], classes)
+    rows, cols = np.indices(lon.shape)
+    dots = (rows % step == 0) & ((cols + (rows // step % 2) * (step // 2)) % step == 0)
+    cv.paint(land & dots, [25, 25, 25], 0.9)
+    return True
+
+def feature_parts(fset, key):
+    """
+    Lists the rings or paths of an Esri JSON feature set.
+
+    Returns:
+    List of (N, 2) lon, lat arrays.
+    """
+    return [np.asarray(part, dtype=np.float64)[:, :2]
+            for ft in fset.get('features', []) for part in (ft.get('geometry') or {}).get(key, [])
+            if len(part) > 1]
+
+def render(trail, data_dir, out_png, dpi=96, script=hike_batch.template):
+    """
+    Draws a draft preview of a trail map into a PNG.
+
+    Layers are drawn from the data the pipeline has already cached: the DEM
+    store, the NLCD window, the service feature cache, the routes GPX and the
+    POI index. Missing inputs are skipped.
+
+    Parameters:
+    trail (str): Trail key in trails_dict, or a route name from the GPX file.
+    data_dir (str): Folder of the map data, aprx_dir in the map script.
+    out_png (str): Output PNG path.
+    dpi (int): Draft resolution.
+    script (str): Path of the map script to read trails_dict and service URLs from.
+
+    Returns:
+    stats (dict): Layers drawn, feature counts and seconds taken.
+    """
+    t0 = time.perf_counter()
+    consts = hike_batch.read_script_values(script, ['nys_hydro', 'nys_streets',
+                                                    'usa_rails', 'roads_svc', 'svc_margin'])
+    trails = hike_batch.read_trails(script, data_dir)
+    routes = {}
+    gpx = os.path.join(data_dir, gpx_name)
+    if os.path.exists(gpx):
+        routes = hike_tracks.read_gpx_tracks(gpx)
+
+    attr = dict(trails.get(trail, {}))
+    if 'mf_camScale' not in attr:
+        frm = hike_tracks.track_frames({trail: routes[attr.get('route', trail)]})[trail]
+        attr.update(mf_camx=frm['camx'], mf_camy=frm['camy'], mf_camScale=frm['scale'],
+                    topo_ext=' '.join(f'{v:.4f}' for v in frm['extent']))
+    cv = Canvas(attr['mf_camx'], attr['mf_camy'], attr['mf_camScale'], dpi=dpi)
+    ext = cv.extent()
+    stats = {'trail': trail, 'size': [cv.width, cv.height], 'layers': []}
+
+    svc_dir = os.path.join(data_dir, 'service_cache')
+    if draw_hillshade(cv, os.path.join(data_dir, 'dem_store_tompkins')):
+        stats['layers'].append('topo')
+    if draw_landcover(cv, os.path.join(svc_dir, f'nlcd_{trail}.npz')):
+        stats['layers'].append('landcov')
+
+    cache_path = os.path.join(svc_dir, 'features.sqlite')
+    if os.path.exists(cache_path):
+        cache = hike_services.FeatureCache(cache_path, offline=True)
+        for name, svc, layer, kind, rgb, alpha, width in preview_layers:
+            if layer is None:
+                layer = consts['roads_svc'][attr.get('roads') or hike_tracks.scale_roads(trails, attr['mf_camScale'])]
+            fsets = cache.cached(consts[svc], layer, ext)
+            if kind == 'polygon':
+                rings = [cv.to_px(r) for fs in fsets for r in feature_parts(fs, 'rings')]
+                cv.paint(cv.fill_mask(rings), rgb, alpha)
+                stats[name] = len(rings)
+            else:
+                paths = [cv.to_px(p) for fs in fsets for p in feature_parts(fs, 'paths')]
+                cv.paint(cv.line_mask(paths, cv.points(width)), rgb, alpha)
+                stats[name] = len(paths)
+            if fsets:
+                stats['layers'].append(name)
+        cache.db.close()
+
+    if routes:
+        paths = [cv.to_px(xy[:, :2]) for xy in routes.values()]
+        cv.paint(cv.line_mask(paths, cv.points(3.4)), [52, 52, 52], 0.6)
+        stats['layers'].append('routes')
+
+    poi_csv = os.path.join(data_dir, poi_name)
+    if os.path.exists(poi_csv):
+        idx = hike_poi.POIIndex(poi_csv)
+        sel = idx.within(*ext)
+        pts = [cv.to_px(idx.xy[sel])] if len(sel) else []
+        cv.paint(cv.line_mask([np.repeat(p[i:i + 1], 2, axis=0) for p in pts for i in range(len(p))],
+                              cv.points(6)), [0, 0, 0])
+        stats['poi'] = int(len(sel))
+        stats['layers'].append('poi')
+
+    cv.save_png(out_png)
+    stats['seconds'] = round(time.perf_counter() - t0, 3)
+    return stats
+
+if __name__ == '__main__':
+    defaults = hike_batch.read_script_values(hike_batch.template, ['aprx_dir'])
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('trails', nargs='+', help="trail keys from trails_dict, or 'all'")
+    parser.add_argument('--data', default=os.environ.get('HIKE_DATA', defaults.get('aprx_dir')),
+                        help='map data folder (aprx_dir, or HIKE_DATA if set)')
+    parser.add_argument('--out', default='preview', help='output folder')
+    parser.add_argument('--dpi', type=int, default=96, help='draft resolution')
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    for key in hike_batch.trail_keys(args.trails, data_dir=args.data):
+        res = render(key, args.data, os.path.join(args.out, f'{key}.png'), args.dpi)
+        print(f'{key}: {", ".join(res["layers"]) or "no layers"} in {res["seconds"]} s')
+    sys.exit(0)
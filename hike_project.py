@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""hike_project.py: Looks up and edits the maps, layers and layouts of the Best Hikes ArcGIS project."""
+
+# SETUP
+
+# CIMEdit transactions, the label classes, renderer classes and elements they edited, and the
+# getDefinition / setDefinition round trips saved over editing each of those separately
+cim_stats = {'transactions': 0, 'edits': 0, 'round_trips_saved': 0}
+
+# FUNCTIONS
+
+class Registry:
+    """
+    Name index of the project's maps, layers and layouts.
+
+    Each map's table of contents is scanned once and kept up to date by
+    lyr_rename, lyr_remove and add_data, so lookups are dictionary reads.
+    A name that is not indexed triggers one rescan of that map, which picks
+    up layers added by geoprocessing tools, before a LookupError is raised.
+
+    stats counts lookups that found their item, with or without a rescan,
+    as hits, lookups that found nothing as misses, and the scans made.
+
+    Parameters:
+    aprx (ArcGISProject): The project to index.
+    """
+    def __init__(self, aprx):
+        self.aprx = aprx
+        self.maps = None
+        self.layouts = None
+        self.layers = {}
+        self.stats = {'hits': 0, 'misses': 0, 'scans': 0}
+
+    def _scan(self, m):
+        index = {}
+        for lyr in m.listLayers():
+            index.setdefault(lyr.name, []).append(lyr)
+        self.layers[m.name] = index
+        self.stats['scans'] += 1
+        return index
+
+    def _get(self, index, name, rescan, kind, where):
+        if name not in index:
+            index = rescan()
+        if name not in index:
+            self.stats['misses'] += 1
+            raise self._missing(kind, name, index, where)
+        self.stats['hits'] += 1
+        return index[name][0] if isinstance(index[name], list) else index[name]
+
+    def _missing(self, kind, name, index, where):
+        return LookupError(f'{kind} \'{name}\' not found in {where}; '
+                           f'available: {", ".join(sorted(index)) or "none"}')
+
+    def map(self, name):
+        """
+        Returns the map with the given name.
+        """
+        def rescan():
+            self.maps = {mp.name: mp for mp in self.aprx.listMaps()}
+            return self.maps
+        if self.maps is None:
+            rescan()
+        return self._get(self.maps, name, rescan, 'Map', 'project')
+
+    def layout(self, name):
+        """
+        Returns the layout with the given name.
+        """
+        def rescan():
+            self.layouts = {lyt.name: lyt for lyt in self.aprx.listLayouts()}
+            return self.layouts
+        if self.layouts is None:
+            rescan()
+        return self._get(self.layouts, name, rescan, 'Layout', 'project')
+
+    def layer(self, m, name):
+        """
+        Returns the first layer in a map's table of contents with the given name.
+        """
+        if '*' in name:
+            found = m.listLayers(name)
+            if found:
+                self.stats['hits'] += 1
+                return found[0]
+            self.stats['misses'] += 1
+            raise self._missing('Layer', name, self._scan(m), f'map \'{m.name}\'')
+        index = self.layers.get(m.name)
+        if index is None:
+            index = self._scan(m)
+        return self._get(index, name, lambda: self._scan(m), 'Layer', f'map \'{m.name}\'')
+
+    def added(self, m, lyr):
+        """
+        Indexes a layer just added to the top of a map.
+        """
+        if m.name in self.layers:
+            self.layers[m.name].setdefault(lyr.name, []).insert(0, lyr)
+
+    def _drop(self, index, name, lyr):
+        """
+        Drops a layer from one name entry of a map index.
+
+        If the entry holds the name but not this layer object, the whole
+        entry is dropped so its next lookup rescans the map.
+
+        Returns:
+        True if the layer object was in the entry.
+        """
+        entries = index.get(name, [])
+        rest = [l for l in entries if l is not lyr]
+        if rest and len(rest) < len(entries):
+            index[name] = rest
+        else:
+            index.pop(name, None)
+        return len(rest) < len(entries)
+
+    def removed(self, m, lyr):
+        """
+        Drops a removed layer from the index.
+        """
+        index = self.layers.get(m.name)
+        if index is not None:
+            self._drop(index, lyr.name, lyr)
+
+    def renamed(self, lyr, old_name):
+        """
+        Moves a renamed layer to its new name in every map index holding it.
+        """
+        for index in self.layers.values():
+            if old_name not in index:
+                continue
+            if self._drop(index, old_name, lyr):
+                index.setdefault(lyr.name, []).append(lyr)
+            else:
+                # another object for the same layer; the new name's entry may be missing it too
+                index.pop(lyr.name, None)
+
+class CIMEdit:
+    """
+    Transaction that reads a layer's or layout's CIM once and writes it back once.
+
+    Label classes, renderer classes and layout elements are edited in the
+    fetched definition instead of through a getDefinition / setDefinition
+    pair each. The definition is committed when the block exits without an
+    error, and cim_stats counts the round trips that saved.
+
+    Parameters:
+    obj (Layer or Layout object): Object whose definition is edited.
+    stats (dict): Counters to add the transaction to, cim_stats by default.
+
+    Usage:
+    with CIMEdit(lyr) as tx:
+        tx.label_class('Label Class 3').visibility = True
+    """
+    def __init__(self, obj, stats=cim_stats):
+        self.obj = obj
+        self.stats = stats
+        self.cim = None
+        self.edits = 0
+
+    def __enter__(self):
+        self.cim = self.obj.getDefinition('V3')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.obj.setDefinition(self.cim)
+            self.stats['transactions'] += 1
+            self.stats['edits'] += self.edits
+            self.stats['round_trips_saved'] += max(self.edits - 1, 0)
+        return False
+
+    def label_classes(self):
+        """
+        Returns the layer's label class definitions in table of contents order.
+        """
+        self.edits += len(self.cim.labelClasses)
+        return list(self.cim.labelClasses)
+
+    def label_class(self, name):
+        """
+        Returns the definition of the label class with the given name.
+        """
+        for lbl_cim in self.cim.labelClasses:
+            if lbl_cim.name == name:
+                self.edits += 1
+                return lbl_cim
+        raise LookupError(f'Label class \'{name}\' not found in \'{self.obj.name}\'')
+
+    def renderer_classes(self, labels):
+        """
+        Returns the unique value classes of the layer's renderer with the given labels.
+        """
+        found = [cls for grp in self.cim.renderer.groups for cls in grp.classes if cls.label in labels]
+        self.edits += len(found)
+        return found
+
+    def element(self, name):
+        """
+        Returns the definition of the layout element with the given name.
+        """
+        for elm_cim in self.cim.elements:
+            if elm_cim.name == name:
+                self.edits += 1
+                return elm_cim
+        raise LookupError(f'Element \'{name}\' not found in \'{self.obj.name}\'')
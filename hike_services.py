@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+
+"""hike_services.py: Fetches and caches features from the ArcGIS REST services used by the Best Hikes maps."""
+
+# SETUP
+
+import os
+import re
+import json
+import time
+import zlib
+import random
+import sqlite3
+import asyncio
+import threading
+import http.client
+import urllib.parse
+
+import numpy as np
+
+from hike_trace import tracer
+
+# HTTP statuses worth retrying after a pause
+retry_status = {429, 500, 502, 503, 504}
+
+# FUNCTIONS
+
+def extent_key(extent):
+    """
+    Normalizes an extent to a cache key string.
+
+    Parameters:
+    extent (str or sequence): 'xmin ymin xmax ymax ' string or four numbers.
+
+    Returns:
+    Extent string rounded to 1e-6 (str)
+    """
+    if isinstance(extent, str):
+        extent = extent.split()
+    return ' '.join(f'{float(v):.6f}' for v in extent)
+
+class HTTPPool:
+    """
+    Keep-alive HTTP connections shared across threads, limited per host.
+
+    Parameters:
+    per_host (int): Maximum concurrent connections to one host.
+    timeout (float): Socket timeout in seconds.
+    """
+    def __init__(self, per_host=4, timeout=60):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.idle = {}
+        self.stats = {'requests': 0, 'connections': 0, 'retries': 0, 'bytes': 0}
+
+    def _host(self, scheme, netloc):
+        key = (scheme, netloc)
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.per_host)
+                self.idle[key] = []
+            return self.slots[key], self.idle[key]
+
+    def request(self, url):
+        """
+        Sends a GET request over a pooled connection.
+
+        Parameters:
+        url (str): Full URL including the query string.
+
+        Returns:
+        status (int): HTTP status code.
+        body (bytes): Response body.
+        """
+        parts = urllib.parse.urlsplit(url)
+        slot, idle = self._host(parts.scheme, parts.netloc)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        with slot:
+            with self.lock:
+                conn = idle.pop() if idle else None
+            if conn is None:
+                cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+                conn = cls(parts.netloc, timeout=self.timeout)
+                self.stats['connections'] += 1
+            try:
+                conn.request('GET', path, headers={'Connection': 'keep-alive'})
+                resp = conn.getresponse()
+                body = resp.read()
+            except Exception:
+                conn.close()
+                raise
+            with self.lock:
+                idle.append(conn)
+                self.stats['requests'] += 1
+                self.stats['bytes'] += len(body)
+        return resp.status, body
+
+    def close(self):
+        """
+        Closes every idle connection.
+
+        Returns:
+        None
+        """
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+                conns.clear()
+
+# connection pool used by every request in this module
+http_pool = HTTPPool()
+
+def get_bytes(url, params=None, retries=3, backoff=0.5):
+    """
+    Sends a GET request, retrying transient failures with exponential backoff.
+
+    Parameters:
+    url (str): Endpoint URL.
+    params (dict): Query parameters.
+    retries (int): Retries after the first attempt.
+    backoff (float): Seconds before the first retry, doubled each time.
+
+    Returns:
+    Response body (bytes)
+    """
+    if params:
+        url = url + '?' + urllib.parse.urlencode(params)
+    path = urllib.parse.urlsplit(url).path
+    with tracer.span('/'.join(path.split('/')[-3:]), 'rest'):
+        for attempt in range(retries + 1):
+            try:
+                status, body = http_pool.request(url)
+                tracer.add_bytes(len(body))
+                if status not in retry_status:
+                    break
+                err = IOError(f'{url}: HTTP {status}')
+            except (OSError, http.client.HTTPException) as e:
+                err = e
+            if attempt == retries:
+                raise err
+            with http_pool.lock:
+                http_pool.stats['retries'] += 1
+            time.sleep(backoff * 2**attempt * (1 + random.random() / 2))
+    if status >= 400:
+        raise IOError(f'{url}: HTTP {status}')
+    return body
+
+def get_json(url, params=None, retries=3, backoff=0.5):
+    """
+    Sends a GET request to a REST endpoint and decodes the JSON response.
+
+    Parameters:
+    url (str): Endpoint URL.
+    params (dict): Query parameters.
+    retries (int): Retries after the first attempt.
+    backoff (float): Seconds before the first retry, doubled each time.
+
+    Returns:
+    Decoded JSON (dict)
+    """
+    data = json.loads(get_bytes(url, params, retries, backoff).decode('utf-8'))
+    if 'error' in data:
+        raise IOError(f'{url}: {data["error"].get("message", data["error"])}')
+    return data
+
+def fetch_image(svc_url, extent, size, sr, pixel_type='F32', token=None):
+    """
+    Reads a window of an ImageServer as a NumPy array with exportImage.
+
+    Parameters:
+    svc_url (str): ImageServer URL.
+    extent (sequence): xmin, ymin, xmax, ymax of the window.
+    size (tuple): Columns and rows of the output.
+    sr (int or str): Well-known ID or WKT of the extent coordinate system.
+    pixel_type (str): 'F32' for elevation, 'U8' for class codes.
+    token (str): ArcGIS token for subscriber services.
+
+    Returns:
+    2D array of the first band, NoData as NaN for float pixels.
+    """
+    nodata = -3.4e38 if pixel_type == 'F32' else 0
+    params = {'bbox': ','.join(str(v) for v in extent),
+              'bboxSR': sr if isinstance(sr, int) else json.dumps({'wkt': sr}),
+              'imageSR': sr if isinstance(sr, int) else json.dumps({'wkt': sr}),
+              'size': f'{size[0]},{size[1]}',
+              'format': 'bsq',
+              'pixelType': pixel_type,
+              'noData': nodata,
+              'interpolation': 'RSP_NearestNeighbor',
+              'f': 'image'}
+    if token:
+        params['token'] = token
+    body = get_bytes(f'{svc_url.rstrip("/")}/exportImage', params)
+    dtype = '<f4' if pixel_type == 'F32' else np.uint8
+    arr = np.frombuffer(body, dtype=dtype)[:size[0] * size[1]].reshape(size[1], size[0])
+    if pixel_type == 'F32':
+        arr = np.where(arr <= nodata, np.nan, arr)
+    return arr
+
+async def _run_job(name, job, results):
+    """
+    Runs one blocking fetch job on a worker thread and records its outcome.
+
+    Parameters:
+    name (str): Job name.
+    job (function): Blocking callable doing the fetch.
+    results (dict): Receives the result, or the exception raised.
+
+    Returns:
+    None
+    """
+    t0 = time.perf_counter()
+    try:
+        results[name] = await asyncio.to_thread(job)
+    except Exception as e:
+        results[name] = e
+    print(f'Fetched \'{name}\' in {time.perf_counter() - t0:.2f} s')
+
+def fetch_all(jobs):
+    """
+    Runs independent fetch jobs concurrently and waits for all of them.
+
+    Each job runs on its own thread; requests share http_pool, which holds
+    the per-host connection limit, and get_bytes retries with backoff.
+
+    Parameters:
+    jobs (dict): Job name to blocking callable.
+
+    Returns:
+    results (dict): Job name to result, or to the exception it raised.
+    """
+    results = {}
+
+    async def run():
+        await asyncio.gather(*(_run_job(name, job, results) for name, job in jobs.items()))
+
+    t0 = time.perf_counter()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(run())
+    else:
+        # already inside an event loop, e.g. a notebook; run on a fresh thread
+        worker = threading.Thread(target=lambda: asyncio.run(run()))
+        worker.start()
+        worker.join()
+    print(f'Fetched {len(jobs)} layers in {time.perf_counter() - t0:.2f} s')
+    return results
+
+def pad_extent(extent, margin=0.05):
+    """
+    Grows an extent by a fraction of its width and height on each side.
+
+    Parameters:
+    extent (str or sequence): 'xmin ymin xmax ymax ' string or four numbers.
+    margin (float): Fraction of the width and height added on each side.
+
+    Returns:
+    List of xmin, ymin, xmax, ymax.
+    """
+    xmin, ymin, xmax, ymax = [float(v) for v in extent_key(extent).split()]
+    dx = (xmax - xmin) * margin
+    dy = (ymax - ymin) * margin
+    return [xmin - dx, ymin - dy, xmax + dx, ymax + dy]
+
+# service layer descriptions keyed by layer URL
+layer_infos = {}
+
+def layer_info(svc_url, layer):
+    """
+    Returns the description of a service layer, fetched once per session.
+
+    Parameters:
+    svc_url (str): MapServer or FeatureServer URL.
+    layer (str): Layer id in the service.
+
+    Returns:
+    Layer description JSON (dict)
+    """
+    url = f'{svc_url.rstrip("/")}/{layer}'
+    if url not in layer_infos:
+        layer_infos[url] = get_json(url, {'f': 'json'})
+    return layer_infos[url]
+
+def expression_fields(expressions, field_names):
+    """
+    Finds the fields referenced by label, renderer and query expressions.
+
+    Parameters:
+    expressions (list): Expression strings, e.g. '[NAME]' or '$feature.NAME'.
+    field_names (list): Field names available on the layer.
+
+    Returns:
+    List of referenced field names in layer order.
+    """
+    tokens = set()
+    for expr in expressions:
+        tokens.update(t.upper() for t in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', expr or ''))
+    return [f for f in field_names if f.upper() in tokens]
+
+def fetch_features(svc_url, layer, extent, fields='*', wkid=4326, page_size=None):
+    """
+    Queries only the features and fields of a service layer needed for an extent.
+
+    The request is filtered to the extent on the server and paged with
+    resultOffset, or by object id for services without pagination, until
+    every matching feature has been read.
+
+    Parameters:
+    svc_url (str): MapServer or FeatureServer URL.
+    layer (str): Layer id in the service.
+    extent (str or sequence): Extent in the wkid coordinate system.
+    fields (str or list): Output fields, '*' for all.
+    wkid (int): Well-known ID of the extent and output coordinates.
+    page_size (int): Features per request, defaults to the layer maxRecordCount.
+
+    Returns:
+    Esri JSON feature set (dict)
+    """
+    info = layer_info(svc_url, layer)
+    oid = info.get('objectIdField') or next((f['name'] for f in info.get('fields', [])
+                                             if f['type'] == 'esriFieldTypeOID'), 'OBJECTID')
+    if not isinstance(fields, str):
+        fields = ','.join([oid] + [f for f in fields if f != oid])
+    page_size = page_size or info.get('maxRecordCount') or 1000
+    paging = info.get('advancedQueryCapabilities', {}).get('supportsPagination', False)
+
+    url = f'{svc_url.rstrip("/")}/{layer}/query'
+    xmin, ymin, xmax, ymax = extent_key(extent).split()
+    params = {'where': '1=1',
+              'geometry': f'{xmin},{ymin},{xmax},{ymax}',
+              'geometryType': 'esriGeometryEnvelope',
+              'inSR': wkid,
+              'spatialRel': 'esriSpatialRelIntersects',
+              'outFields': fields,
+              'outSR': wkid,
+              'geometryPrecision': 6,
+              'returnGeometry': 'true',
+              'f': 'json'}
+
+    pages = []
+    if paging:
+        offset = 0
+        while True:
+            page = get_json(url, dict(params, resultOffset=offset, resultRecordCount=page_size,
+                                      orderByFields=oid))
+            pages.append(page)
+            offset += len(page.get('features', []))
+            if not page.get('exceededTransferLimit') or not page.get('features'):
+                break
+    else:
+        ids = get_json(url, dict(params, returnIdsOnly='true')).get('objectIds') or []
+        ids = sorted(ids)
+        for i in range(0, len(ids), page_size):
+            chunk = ','.join(str(v) for v in ids[i:i + page_size])
+            by_id = {k: v for k, v in params.items()
+                     if k not in ('geometry', 'geometryType', 'inSR', 'spatialRel')}
+            pages.append(get_json(url, dict(by_id, objectIds=chunk)))
+        if not pages:
+            pages.append(get_json(url, dict(params, where='1=0')))
+
+    fset = {k: v for k, v in pages[0].items() if k not in ('features', 'exceededTransferLimit')}
+    fset['features'] = [ft for page in pages for ft in page.get('features', [])]
+    return fset
+
+class FeatureCache:
+    """
+    Read-through on-disk cache of service features keyed by (service URL, layer id, extent, fields).
+
+    Feature sets are stored as zlib-compressed JSON in a SQLite file. Entries
+    older than ttl are refetched, and the least recently used entries are
+    evicted once the cache grows past max_bytes. In offline mode nothing is
+    fetched and stale entries are served as they are.
+
+    Parameters:
+    path (str): Path of the cache database file.
+    ttl (float): Seconds before an entry is refetched, None to never expire.
+    max_bytes (int): Size limit of the stored feature sets.
+    offline (bool): Serve only cached entries.
+    fetch (function): Called as fetch(svc_url, layer, extent, fields) on a miss.
+    """
+    # bumped when the table layout changes; older caches are discarded
+    schema = 2
+
+    def __init__(self, path, ttl=30 * 86400, max_bytes=512 * 2**20, offline=False, fetch=fetch_features):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.fetch = fetch
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evicted': 0}
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.schema:
+            self.db.execute('DROP TABLE IF EXISTS features')
+            self.db.execute(f'PRAGMA user_version = {self.schema}')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS features (
+                               svc TEXT, layer TEXT, extent TEXT, fields TEXT,
+                               fetched REAL, accessed REAL, size INTEGER, data BLOB,
+                               PRIMARY KEY (svc, layer, extent, fields))''')
+        self.db.commit()
+
+    def get(self, svc_url, layer, extent, fields='*'):
+        """
+        Returns the features of a service layer for an extent, fetching on a miss.
+
+        Parameters:
+        svc_url (str): MapServer or FeatureServer URL.
+        layer (str): Layer id in the service.
+        extent (str or sequence): Query extent.
+        fields (str or list): Output fields, '*' for all.
+
+        Returns:
+        Esri JSON feature set (dict)
+        """
+        if not isinstance(fields, str):
+            fields = ','.join(fields)
+        key = (svc_url.rstrip('/'), str(layer), extent_key(extent), fields)
+        where = 'svc=? AND layer=? AND extent=? AND fields=?'
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(f'SELECT fetched, data FROM features WHERE {where}', key).fetchone()
+            if row is not None:
+                fresh = self.ttl is None or now - row[0] < self.ttl
+                if fresh or self.offline:
+                    self.stats['hits'] += 1
+                    self.db.execute(f'UPDATE features SET accessed=? WHERE {where}', (now,) + key)
+                    self.db.commit()
+                    return json.loads(zlib.decompress(row[1]))
+                self.stats['stale'] += 1
+            elif self.offline:
+                raise ValueError(f'Offline and not cached: {key[0]}/{key[1]} {key[2]}')
+            self.stats['misses'] += 1
+
+        fset = self.fetch(key[0], key[1], key[2], fields if fields == '*' else fields.split(','))
+        self.put(key, fset, now)
+        return fset
+
+    def cached(self, svc_url, layer, extent=None):
+        """
+        Returns the stored feature sets of a service layer without fetching.
+
+        Parameters:
+        svc_url (str): MapServer or FeatureServer URL.
+        layer (str): Layer id in the service.
+        extent (str or sequence): Only entries whose query extent overlaps this one [opt]
+
+        Returns:
+        List of Esri JSON feature sets (dict).
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT extent, data FROM features WHERE svc=? AND layer=?',
+                                   (svc_url.rstrip('/'), str(layer))).fetchall()
+        if extent is not None:
+            xmin, ymin, xmax, ymax = [float(v) for v in extent_key(extent).split()]
+            boxes = [[float(v) for v in ext.split()] for ext, _ in rows]
+            rows = [row for row, b in zip(rows, boxes)
+                    if b[0] <= xmax and b[2] >= xmin and b[1] <= ymax and b[3] >= ymin]
+        return [json.loads(zlib.decompress(data)) for _, data in rows]
+
+    def put(self, key, fset, now=None):
+        """
+        Stores a feature set and evicts least recently used entries over the size limit.
+
+        Parameters:
+        key (tuple): Service URL, layer id, extent key and fields.
+        fset (dict): Esri JSON feature set.
+        now (float): Fetch time, defaults to the current time.
+
+        Returns:
+        None
+        """
+        now = now or time.time()
+        blob = zlib.compress(json.dumps(fset, separators=(',', ':')).encode('utf-8'), 6)
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            key + (now, now, len(blob), blob))
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache fits max_bytes.
+
+        Returns:
+        Number of entries evicted (int)
+        """
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM features').fetchone()[0]
+        count = 0
+        rows = self.db.execute('SELECT svc, layer, extent, fields, size FROM features ORDER BY accessed').fetchall()
+        for svc, layer, extent, fields, size in rows[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.db.execute('DELETE FROM features WHERE svc=? AND layer=? AND extent=? AND fields=?',
+                            (svc, layer, extent, fields))
+            total -= size
+            count += 1
+        self.stats['evicted'] += count
+        return count
+
+    def close(self):
+        """
+        Closes the cache database.
+
+        Returns:
+        None
+        """
+        self.db.close()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+"""hike_stages.py: Runs the stages of a Best Hikes trail build as a dependency graph."""
+
+# SETUP
+
+import os
+import json
+import time
+import threading
+import concurrent.futures
+
+from hike_trace import tracer
+
+# FUNCTIONS
+
+class Stage:
+    """
+    Named step of a trail build with the data it reads and writes.
+
+    Parameters:
+    name (str): Stage name.
+    run (function): Called with no arguments to do the work.
+    inputs (list): Names of the data the stage reads, e.g. 'dem' or 'features:hydro'.
+    outputs (list): Names of the data the stage writes, e.g. 'layer:topo'.
+    serial (bool): Runs on the main thread in graph order, for map and geodatabase edits.
+    optional (bool): A failure is reported but does not stop the build.
+    """
+    def __init__(self, name, run, inputs=(), outputs=(), serial=True, optional=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.serial = serial
+        self.optional = optional
+
+class StageJournal:
+    """
+    Journal of the stages a build has completed, so an interrupted build can resume.
+
+    Entries are kept per build, e.g. per trail, with the map items each serial
+    stage added. A build that finishes clears its entry, so the journal only
+    ever describes interrupted builds.
+
+    Parameters:
+    path (str): Path of the journal JSON file.
+    build (str): Name of the build, e.g. the trail key.
+    """
+    def __init__(self, path, build):
+        self.path = path
+        self.build = build
+        self.data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+        self.stages = self.data.setdefault(build, {})
+
+    def done(self, name):
+        """
+        Returns the journal entry of a completed stage, or None.
+        """
+        entry = self.stages.get(name)
+        return entry if entry and entry.get('status') == 'done' else None
+
+    def record(self, name, status, added=(), error=None):
+        """
+        Records the outcome of a stage and saves the journal.
+
+        Parameters:
+        name (str): Stage name.
+        status (str): 'done' or 'failed'.
+        added (list): Map items the stage added, e.g. layer names.
+        error (str): Error message of a failed stage.
+
+        Returns:
+        None
+        """
+        self.stages[name] = {'status': status, 'added': list(added), 'time': time.time()}
+        if error is not None:
+            self.stages[name]['error'] = error
+        self.save()
+
+    def clear(self):
+        """
+        Removes the entry of this build once it has finished.
+
+        Returns:
+        None
+        """
+        self.stages.clear()
+        self.data.pop(self.build, None)
+        self.save()
+
+    def save(self):
+        """
+        Writes the journal to disk, replacing the file atomically.
+
+        Returns:
+        None
+        """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp, self.path)
+
+class StageGraph:
+    """
+    Dependency graph of build stages, run with independent stages in parallel.
+
+    A stage depends on every earlier-declared stage that writes one of its
+    inputs. Serial stages run one at a time on the calling thread in a fixed
+    topological order, declaration order breaking ties, so the layers they add
+    stack the same way on every run. Other stages run on a thread pool as soon
+    as their inputs are written.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, run, inputs=(), outputs=(), serial=True, optional=False):
+        """
+        Declares a stage.
+
+        Parameters:
+        See Stage.
+
+        Returns:
+        Stage object.
+        """
+        if name in self.stages:
+            raise ValueError(f'Stage \'{name}\' is already declared')
+        self.stages[name] = Stage(name, run, inputs, outputs, serial, optional)
+        return self.stages[name]
+
+    def needs(self, name):
+        """
+        Lists the stages a stage depends on.
+
+        Parameters:
+        name (str): Stage name.
+
+        Returns:
+        List of stage names in declaration order.
+        """
+        inputs = set(self.stages[name].inputs)
+        deps = []
+        for other in self.stages.values():
+            if other.name == name:
+                break
+            if inputs & set(other.outputs):
+                deps.append(other.name)
+        missing = inputs - {o for n in deps for o in self.stages[n].outputs}
+        if missing:
+            raise ValueError(f'Stage \'{name}\' reads {sorted(missing)}, which no earlier stage writes')
+        return deps
+
+    def order(self):
+        """
+        Sorts the stages so every stage follows the stages it depends on.
+
+        Declaring inputs only against earlier stages keeps the graph acyclic,
+        so declaration order is already a valid order.
+
+        Returns:
+        List of stage names.
+        """
+        for name in self.stages:
+            self.needs(name)
+        return list(self.stages)
+
+    def resume_point(self, journal, snapshot=None):
+        """
+        Finds the stages an interrupted build has already completed.
+
+        Parallel stages count as complete if the journal says so. Serial
+        stages count only up to the first one that is not journaled as done
+        or whose map items are gone, e.g. because the project was not saved;
+        every serial stage from there on runs again so the layers stack in
+        the same order as in a full build.
+
+        Parameters:
+        journal (StageJournal): Journal of the build.
+        snapshot (function): Returns the current map items, e.g. layer and dataset names.
+
+        Returns:
+        Set of stage names to skip.
+        """
+        current = set(snapshot()) if snapshot else set()
+        skip = {n for n, st in self.stages.items() if not st.serial and journal.done(n)}
+        for name in [n for n in self.order() if self.stages[n].serial]:
+            entry = journal.done(name)
+            if not entry or (snapshot and not set(entry['added']) <= current):
+                break
+            skip.add(name)
+        return skip
+
+    def run(self, workers=4, journal=None, snapshot=None, rollback=None):
+        """
+        Runs every stage, parallel stages on a thread pool and serial stages in order here.
+
+        With a journal, stages an interrupted build already completed are
+        skipped and every stage outcome is recorded. When a serial stage
+        fails, the map items it added, e.g. layers and datasets, are handed to
+        rollback before the error is raised, so no half-built output is left
+        behind for the resumed build to trip over.
+
+        Parameters:
+        workers (int): Threads for the parallel stages.
+        journal (StageJournal): Journal to resume from and record to [opt]
+        snapshot (function): Returns the current map items as a list, e.g. layer and dataset names [opt]
+        rollback (function): Called with the list of map items a failed stage added [opt]
+
+        Returns:
+        results (dict): Stage name to return value, or to the exception an optional stage raised.
+        """
+        order = self.order()
+        needs = {name: self.needs(name) for name in order}
+        skip = self.resume_point(journal, snapshot) if journal else set()
+        if skip:
+            print(f'Resuming build: {len(skip)} of {len(order)} stages already done')
+        serial = [n for n in order if self.stages[n].serial]
+        done, results = set(skip), dict.fromkeys(skip)
+        running = {}
+        self.timings = {}
+        t0 = time.perf_counter()
+
+        def run_serial(stage):
+            before = snapshot() if snapshot else []
+            try:
+                value = call(stage)
+            except Exception as e:
+                added = [x for x in snapshot() if x not in before] if snapshot else []
+                if rollback and added:
+                    rollback(added)
+                if journal:
+                    journal.record(stage.name, 'failed', error=repr(e))
+                raise
+            if journal:
+                journal.record(stage.name, 'done', [x for x in snapshot() if x not in before] if snapshot else [])
+            return value
+
+        def call(stage):
+            start = time.perf_counter() - t0
+            try:
+                with tracer.span(stage.name, 'stage'):
+                    return stage.run()
+            finally:
+                self.timings[stage.name] = {'start': start, 'end': time.perf_counter() - t0,
+                                            'thread': threading.current_thread().name}
+
+        def finish(name, value=None, error=None):
+            if error is None:
+                results[name] = value
+                done.add(name)
+                return
+            results[name] = error
+            print(f'Stage \'{name}\' failed: {error!r}')
+            if not self.stages[name].optional:
+                raise error
+            done.add(name)
+
+        def ready(name):
+            return name not in results and name not in running and all(d in done for d in needs[name])
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stage') as pool:
+            try:
+                while len(results) < len(order):
+                    for name in order:
+                        if not self.stages[name].serial and ready(name):
+                            running[name] = pool.submit(call, self.stages[name])
+                    nxt = next((n for n in serial if n not in results), None)
+                    if nxt is not None and ready(nxt):
+                        try:
+                            value = run_serial(self.stages[nxt])
+                        except Exception as e:
+                            finish(nxt, error=e)
+                        else:
+                            finish(nxt, value)
+                        continue
+                    if not running:
+                        raise RuntimeError(f'Stage \'{nxt}\' can never run')
+                    finished, _ = concurrent.futures.wait(running.values(),
+                                                          return_when=concurrent.futures.FIRST_COMPLETED)
+                    for name in [n for n, f in running.items() if f in finished]:
+                        fut = running.pop(name)
+                        if fut.exception() is not None:
+                            if journal:
+                                journal.record(name, 'failed', error=repr(fut.exception()))
+                            finish(name, error=fut.exception())
+                        else:
+                            if journal:
+                                journal.record(name, 'done')
+                            finish(name, fut.result())
+            finally:
+                # let stages already running finish before leaving the pool
+                for fut in running.values():
+                    fut.cancel()
+        if journal:
+            journal.clear()
+        return results
+
+    def critical_path(self):
+        """
+        Finds the chain of stages that set the length of the last run.
+
+        Each stage's predecessor on the path is the dependency, or for serial
+        stages the previous serial stage, that finished last before it started.
+
+        Returns:
+        List of stage names, first to last.
+        """
+        if not self.timings:
+            return []
+        order = [n for n in self.order() if n in self.timings]
+        serial = [n for n in order if self.stages[n].serial]
+        path = [max(order, key=lambda n: self.timings[n]['end'])]
+        while True:
+            name = path[-1]
+            preds = [d for d in self.needs(name) if d in self.timings]
+            if self.stages[name].serial and serial.index(name) > 0:
+                preds.append(serial[serial.index(name) - 1])
+            if not preds:
+                break
+            path.append(max(preds, key=lambda n: self.timings[n]['end']))
+        return path[::-1]
+
+    def report(self):
+        """
+        Prints the stage timings of the last run with the critical path marked.
+
+        Returns:
+        None
+        """
+        critical = self.critical_path()
+        total = max((t['end'] for t in self.timings.values()), default=0)
+        busy = sum(t['end'] - t['start'] for t in self.timings.values())
+        for name in self.order():
+            if name not in self.timings:
+                continue
+            t = self.timings[name]
+            mark = '*' if name in critical else ' '
+            print(f'{mark} {name:<16} {t["start"]:7.2f} {t["end"]:7.2f} {t["end"] - t["start"]:7.2f} s  {t["thread"]}')
+        print(f'Stages: {total:.2f} s elapsed, {busy:.2f} s of work, critical path '
+              f'{" > ".join(critical)}')
+        pass
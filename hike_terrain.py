@@ -0,0 +1,639 @@
+#!/usr/bin/env python
+
+"""hike_terrain.py: Computes hillshades from DEM arrays for the Best Hikes maps."""
+
+# SETUP
+
+import os
+import sys
+import json
+import shutil
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hike_tracks import dp_mask
+from hike_memory import strip_rows
+
+# HillShade parameters used by the book maps
+hillshade_params = {'azimuth': 315,
+                    'altitude': 45,
+                    'z_factor': 1}
+
+# Contours in feet like the old county contours, from a DEM in meters
+contour_params = {'interval': 20,
+                  'major': 200,
+                  'z_factor': 3.28084}
+
+# working memory per DEM cell, measured with tracemalloc, for memory-budgeted strips
+hillshade_cell_bytes = 80
+contour_cell_bytes = 32
+
+# Marching squares cases as pairs of crossed square edges: 0 top, 1 right, 2 bottom, 3 left.
+# Corner bits are top-left 8, top-right 4, bottom-right 2, bottom-left 1.
+# Saddles 5 and 10 cross all four edges; ms_saddle gives their two segments
+# for a low center and for a high center.
+ms_first = np.array([-1, 3, 2, 3, 0, 0, 0, 3, 3, 0, 3, 0, 3, 2, 3, -1])
+ms_second = np.array([-1, 2, 1, 1, 1, 1, 2, 0, 0, 2, 0, 1, 1, 1, 2, -1])
+ms_saddle = {5: (((0, 1), (3, 2)), ((3, 0), (2, 1))),
+             10: (((3, 0), (2, 1)), ((0, 1), (3, 2)))}
+
+# FUNCTIONS
+
+def _pool(workers):
+    """
+    Creates a process pool that also works inside ArcGIS Pro.
+
+    ArcGIS Pro embeds Python, so sys.executable points at ArcGISPro.exe and
+    workers must be started with the pythonw.exe of the active environment.
+
+    Parameters:
+    workers (int): Number of worker processes.
+
+    Returns:
+    ProcessPoolExecutor
+    """
+    exe = os.path.basename(sys.executable).lower()
+    if not exe.startswith('python'):
+        mp.set_executable(os.path.join(sys.exec_prefix, 'pythonw.exe'))
+    return ProcessPoolExecutor(max_workers=workers)
+
+def _pool_safe():
+    """
+    Checks whether worker processes can start without re-running the main script.
+
+    Spawned and forkserver workers, the default on Windows and so in ArcGIS
+    Pro, import the main script again. The map script runs its build at the
+    top level with no __main__ guard, so a pool is only used when workers
+    are forked or the main module is not a script file, as in the ArcGIS Pro
+    Python window or a notebook.
+
+    Returns:
+    True if a process pool can be used.
+    """
+    main = sys.modules.get('__main__')
+    return mp.get_start_method() == 'fork' or not getattr(main, '__file__', None)
+
+def _pad(dem):
+    """
+    Pads a DEM by one cell on each side, repeating the edge values.
+
+    Parameters:
+    dem (ndarray): 2D elevation array.
+
+    Returns:
+    Padded float64 array.
+    """
+    return np.pad(dem.astype(np.float64, copy=False), 1, mode='edge')
+
+def hillshade_core(padded, cellsize, azimuth=315, altitude=45, z_factor=1):
+    """
+    Computes a hillshade from a DEM padded with a one-cell halo.
+
+    Uses the Horn slope and aspect kernel and the illumination formula of
+    the ArcGIS HillShade tool without shadow modeling. As in that tool, a
+    NoData cell stays NoData and a NoData neighbour takes the value of the
+    center cell.
+
+    Parameters:
+    padded (ndarray): 2D elevation array with a one-cell halo.
+    cellsize (tuple): Cell width and height in map units.
+    azimuth (float): Sun azimuth in degrees clockwise from north.
+    altitude (float): Sun altitude in degrees above the horizon.
+    z_factor (float): Ratio of z units to ground x, y units.
+
+    Returns:
+    hs (ndarray): 2D float32 array of shaded relief, 0-255, NoData as NaN.
+    """
+    cx, cy = cellsize
+    e = padded[1:-1, 1:-1]
+    nodata = np.isnan(e)
+    fill = nodata.any() or np.isnan(padded).any()
+
+    def cell(r, k):
+        n = padded[r:r + e.shape[0], k:k + e.shape[1]]
+        return np.where(np.isnan(n), e, n) if fill else n
+
+    dzdx = ((cell(0, 2) + 2 * cell(1, 2) + cell(2, 2)) - (cell(0, 0) + 2 * cell(1, 0) + cell(2, 0))) / (8 * cx)
+    dzdy = ((cell(2, 0) + 2 * cell(2, 1) + cell(2, 2)) - (cell(0, 0) + 2 * cell(0, 1) + cell(0, 2))) / (8 * cy)
+
+    zenith = np.radians(90.0 - altitude)
+    az = np.radians((360.0 - azimuth + 90.0) % 360.0)
+
+    slope = np.arctan(z_factor * np.hypot(dzdx, dzdy))
+    aspect = np.arctan2(dzdy, -dzdx)
+    aspect = np.where(aspect < 0, aspect + 2 * np.pi, aspect)
+    flat = dzdx == 0
+    aspect = np.where(flat & (dzdy > 0), np.pi / 2, aspect)
+    aspect = np.where(flat & (dzdy < 0), 2 * np.pi - np.pi / 2, aspect)
+
+    hs = 255.0 * (np.cos(zenith) * np.cos(slope) +
+                  np.sin(zenith) * np.sin(slope) * np.cos(az - aspect))
+    hs = np.floor(np.clip(hs, 0, 255)).astype(np.float32)
+    hs[nodata] = np.nan
+    return hs
+
+def _hillshade_tile(args):
+    """
+    Process pool worker computing one hillshade tile.
+
+    Parameters:
+    args (tuple): Row, column, padded tile, and hillshade_core arguments.
+
+    Returns:
+    (row, col, hs) (tuple): Tile origin and its hillshade.
+    """
+    r0, c0, tile, cellsize, params = args
+    return r0, c0, hillshade_core(tile, cellsize, **params)
+
+def tile_windows(shape, tile):
+    """
+    Splits a raster shape into tile windows.
+
+    Parameters:
+    shape (tuple): Rows and columns of the raster.
+    tile (int): Tile edge length in cells.
+
+    Returns:
+    List of (row0, row1, col0, col1) windows.
+    """
+    nrows, ncols = shape
+    return [(r0, min(r0 + tile, nrows), c0, min(c0 + tile, ncols))
+            for r0 in range(0, nrows, tile)
+            for c0 in range(0, ncols, tile)]
+
+def hillshade(dem, cellsize, azimuth=315, altitude=45, z_factor=1, tile=1024, workers=None, budget=None):
+    """
+    Computes a hillshade, splitting large DEMs into overlapping tiles on a process pool.
+
+    Each tile is read with a one-cell halo so the tiled result is identical
+    to computing the whole array at once. With a memory budget the DEM is
+    instead shaded in-process one row strip at a time, so only a strip is
+    ever held as float64 and the DEM can stay a memory map.
+
+    Parameters:
+    dem (ndarray): 2D elevation array, rows ordered north to south.
+    cellsize (float or tuple): Cell size, or cell width and height, in map units.
+    azimuth (float): Sun azimuth in degrees clockwise from north.
+    altitude (float): Sun altitude in degrees above the horizon.
+    z_factor (float): Ratio of z units to ground x, y units.
+    tile (int): Tile edge length in cells.
+    workers (int): Worker processes, or None for one per core. 1 runs in-process, as do
+        scripts whose workers would be spawned; see _pool_safe.
+    budget (str or int): Working memory cap, e.g. '256 MB', for strip processing [opt]
+
+    Returns:
+    hs (ndarray): 2D float32 array of shaded relief, 0-255, NoData as NaN.
+    """
+    if np.isscalar(cellsize):
+        cellsize = (cellsize, cellsize)
+    params = {'azimuth': azimuth, 'altitude': altitude, 'z_factor': z_factor}
+    if budget is not None:
+        nrows = dem.shape[0]
+        rows = strip_rows(dem.shape, hillshade_cell_bytes, budget)
+        hs = np.empty(dem.shape, dtype=np.float32)
+        for r0 in range(0, nrows, rows):
+            r1 = min(r0 + rows, nrows)
+            a, b = max(r0 - 1, 0), min(r1 + 1, nrows)
+            # one-row halo from the neighbouring strips, edge values at the raster border
+            part = np.pad(dem[a:b].astype(np.float64), ((int(a == r0), int(b == r1)), (1, 1)), mode='edge')
+            hs[r0:r1] = hillshade_core(part, cellsize, **params)
+        return hs
+
+    padded = _pad(dem)
+    windows = tile_windows(dem.shape, tile)
+
+    if workers == 1 or len(windows) == 1:
+        return hillshade_core(padded, cellsize, **params)
+
+    hs = np.empty(dem.shape, dtype=np.float32)
+    jobs = [(r0, c0, padded[r0:r1 + 2, c0:c1 + 2], cellsize, params)
+            for r0, r1, c0, c1 in windows]
+    if not _pool_safe():
+        # tiles are shaded here one at a time instead
+        for r0, c0, part in map(_hillshade_tile, jobs):
+            hs[r0:r0 + part.shape[0], c0:c0 + part.shape[1]] = part
+        return hs
+    with _pool(workers or os.cpu_count()) as pool:
+        for r0, c0, part in pool.map(_hillshade_tile, jobs):
+            hs[r0:r0 + part.shape[0], c0:c0 + part.shape[1]] = part
+    return hs
+
+def contour_levels(dem, interval=20, major=200):
+    """
+    Lists the contour levels crossing a DEM and flags the major ones in one pass.
+
+    Parameters:
+    dem (ndarray): 2D elevation array in contour units, NoData as NaN.
+    interval (float): Contour interval.
+    major (float): Interval of the major (index) contours.
+
+    Returns:
+    levels (ndarray): Contour elevations, ascending; empty if the DEM is all NoData.
+    majors (ndarray): Boolean flag per level.
+    """
+    if np.isnan(dem).all():
+        return np.empty(0), np.empty(0, dtype=bool)
+    lo, hi = np.nanmin(dem), np.nanmax(dem)
+    levels = np.arange(np.ceil(lo / interval), np.floor(hi / interval) + 1) * interval
+    majors = np.isclose(levels / major, np.round(levels / major))
+    return levels, majors
+
+def contour_segments(z, level):
+    """
+    Finds the marching squares segments of one contour level.
+
+    Crossings sit on the edges between cell centers. Edge ids number the
+    horizontal edges first, then the vertical edges, so neighbouring squares
+    share the id of their common edge.
+
+    Parameters:
+    z (ndarray): 2D elevation array, NoData as NaN.
+    level (float): Contour elevation.
+
+    Returns:
+    a, b (ndarray): Edge ids at the two ends of each segment.
+    """
+    nrows, ncols = z.shape
+    high = z >= level
+    case = (high[:-1, :-1] * 8 + high[:-1, 1:] * 4 + high[1:, 1:] * 2 + high[1:, :-1])
+    valid = ~np.isnan(z)
+    valid = valid[:-1, :-1] & valid[:-1, 1:] & valid[1:, 1:] & valid[1:, :-1]
+    i, j = np.nonzero(valid & (case != 0) & (case != 15))
+    case = case[i, j]
+    top = i * ncols + j
+    edges = np.stack((top,
+                      nrows * ncols + i * ncols + j + 1,
+                      top + ncols,
+                      nrows * ncols + i * ncols + j))
+    k = np.arange(len(case))
+    a, b = edges[ms_first[case], k], edges[ms_second[case], k]
+    center = (z[i, j] + z[i, j + 1] + z[i + 1, j] + z[i + 1, j + 1]) / 4 >= level
+    extra_a, extra_b = [], []
+    for code, pairs in ms_saddle.items():
+        sel = np.nonzero(case == code)[0]
+        pairs = np.array(pairs)[center[sel].astype(int)]
+        a[sel], b[sel] = edges[pairs[:, 0, 0], sel], edges[pairs[:, 0, 1], sel]
+        extra_a.append(edges[pairs[:, 1, 0], sel])
+        extra_b.append(edges[pairs[:, 1, 1], sel])
+    a, b = [a] + extra_a, [b] + extra_b
+    return np.concatenate(a), np.concatenate(b)
+
+def edge_points(z, level, ids):
+    """
+    Interpolates the contour crossing on each square edge.
+
+    Parameters:
+    z (ndarray): 2D elevation array.
+    level (float): Contour elevation.
+    ids (ndarray): Edge ids from contour_segments.
+
+    Returns:
+    (N, 2) float array of row, col positions on the cell-center grid.
+    """
+    nrows, ncols = z.shape
+    vert = ids >= nrows * ncols
+    e = np.where(vert, ids - nrows * ncols, ids)
+    i, j = e // ncols, e % ncols
+    i1, j1 = np.where(vert, i + 1, i), np.where(vert, j, j + 1)
+    z0, z1 = z[i, j], z[np.minimum(i1, nrows - 1), np.minimum(j1, ncols - 1)]
+    t = (level - z0) / (z1 - z0)
+    return np.column_stack((i + vert * t, j + ~vert * t))
+
+def stitch_segments(a, b):
+    """
+    Chains segments sharing edge ids into polylines.
+
+    Parameters:
+    a, b (ndarray): Edge ids at the two ends of each segment.
+
+    Returns:
+    List of edge id lists; closed lines repeat their first id last.
+    """
+    ends = {}
+    for s, (u, v) in enumerate(zip(a.tolist(), b.tolist())):
+        ends.setdefault(u, []).append(s)
+        ends.setdefault(v, []).append(s)
+    used = np.zeros(len(a), dtype=bool)
+
+    def walk(s, v):
+        # follows segments from s out through edge v until the line ends
+        line = [v]
+        while True:
+            nxt = [t for t in ends[v] if not used[t]]
+            if not nxt:
+                return line
+            s = nxt[0]
+            used[s] = True
+            v = b[s] if a[s] == v else a[s]
+            line.append(int(v))
+
+    lines = []
+    for s in range(len(a)):
+        if used[s]:
+            continue
+        used[s] = True
+        fwd = walk(s, int(b[s]))
+        back = walk(s, int(a[s]))
+        lines.append(back[::-1] + fwd)
+    return lines
+
+def contours(dem, cellsize, ul, interval=20, major=200, z_factor=1, tol=0, budget=None):
+    """
+    Traces contour lines from a DEM window with marching squares.
+
+    The DEM is read in row strips that share their boundary row. Edge ids are
+    numbered over the whole window, so segments from neighbouring strips
+    meet on the same ids and stitch into unbroken lines. Without a memory
+    budget the window is a single strip.
+
+    Parameters:
+    dem (ndarray): 2D elevation array, rows ordered north to south, NoData as NaN.
+    cellsize (float or tuple): Cell size, or cell width and height, in map units.
+    ul (tuple): x, y of the upper-left corner of the window.
+    interval (float): Contour interval in contour units.
+    major (float): Interval of the major contours.
+    z_factor (float): Multiplier from DEM z units to contour units.
+    tol (float): Douglas-Peucker tolerance in map units, 0 to keep every vertex.
+    budget (str or int): Working memory cap, e.g. '256 MB', for strip processing [opt]
+
+    Returns:
+    lines (list): (level, is_major, (N, 2) x, y array) per contour line.
+    stats (dict): Levels, strips, lines and vertices before and after simplification.
+    """
+    if np.isscalar(cellsize):
+        cellsize = (cellsize, cellsize)
+    cx, cy = cellsize
+    nrows, ncols = dem.shape
+    rows = strip_rows(dem.shape, contour_cell_bytes, budget)
+    strips = [(r0, min(r0 + rows, nrows - 1)) for r0 in range(0, max(nrows - 1, 1), rows)]
+
+    # levels from the strip ranges, without a float64 copy of the whole window; all-NoData strips have none
+    ranges = [(np.nanmin(part), np.nanmax(part)) for part in (dem[r0:r1 + 1] for r0, r1 in strips)
+              if not np.isnan(part).all()]
+    levels, majors = contour_levels(np.array(ranges, dtype=np.float64).reshape(-1, 2) * z_factor, interval, major)
+
+    # per level: segment ends and edge crossings as global edge ids and row, col positions
+    found = {level: ([], [], [], []) for level in levels.tolist()}
+    for r0, r1 in strips:
+        z = dem[r0:r1 + 1].astype(np.float64) * z_factor
+        if np.isnan(z).all():
+            continue
+        n = z.shape[0] * ncols
+        zlo, zhi = np.nanmin(z), np.nanmax(z)
+
+        def to_global(ids):
+            return np.where(ids < n, ids + r0 * ncols, ids - n + (nrows + r0) * ncols)
+
+        for level in levels[(levels >= zlo) & (levels <= zhi)].tolist():
+            a, b = contour_segments(z, level)
+            if not len(a):
+                continue
+            ids = np.unique(np.concatenate((a, b)))
+            rc = edge_points(z, level, ids)
+            rc[:, 0] += r0
+            for lst, arr in zip(found[level], (to_global(a), to_global(b), to_global(ids), rc)):
+                lst.append(arr)
+
+    lines = []
+    stats = {'levels': len(levels), 'strips': len(strips), 'lines': 0, 'vertices_before': 0, 'vertices_after': 0}
+    for level, is_major in zip(levels.tolist(), majors.tolist()):
+        a, b, ids, rc = found.pop(level)
+        if not a:
+            continue
+        a, b = np.concatenate(a), np.concatenate(b)
+        # boundary rows are crossed in both strips; keep one copy of each edge
+        ids, first = np.unique(np.concatenate(ids), return_index=True)
+        rc = np.concatenate(rc)[first]
+        for line in stitch_segments(a, b):
+            pts = rc[np.searchsorted(ids, line)]
+            if not np.ptp(pts, axis=0).any():
+                # a level touching a single cell center exactly
+                continue
+            xy = np.column_stack((ul[0] + (pts[:, 1] + 0.5) * cx, ul[1] - (pts[:, 0] + 0.5) * cy))
+            stats['vertices_before'] += len(xy)
+            if tol:
+                xy = xy[dp_mask(xy, tol)]
+            stats['vertices_after'] += len(xy)
+            lines.append((level, is_major, xy))
+    stats['lines'] = len(lines)
+    return lines, stats
+
+def bilinear(grid, rows, cols):
+    """
+    Samples a grid at fractional cell-center positions with bilinear interpolation.
+
+    Parameters:
+    grid (ndarray): 2D array, e.g. a DEM or its memory map.
+    rows, cols (ndarray): Fractional positions, 0 at the first cell center.
+
+    Returns:
+    Interpolated values (ndarray); NaN outside the grid.
+    """
+    nrows, ncols = grid.shape
+    r0 = np.clip(np.floor(rows).astype(np.int64), 0, max(nrows - 2, 0))
+    c0 = np.clip(np.floor(cols).astype(np.int64), 0, max(ncols - 2, 0))
+    r1, c1 = np.minimum(r0 + 1, nrows - 1), np.minimum(c0 + 1, ncols - 1)
+    fr, fc = rows - r0, cols - c0
+    top = grid[r0, c0] * (1 - fc) + grid[r0, c1] * fc
+    bottom = grid[r1, c0] * (1 - fc) + grid[r1, c1] * fc
+    out = top * (1 - fr) + bottom * fr
+    outside = (rows < -0.5) | (rows > nrows - 0.5) | (cols < -0.5) | (cols > ncols - 0.5)
+    return np.where(outside, np.nan, out)
+
+class DEMStore:
+    """
+    Local memory-mapped copy of a DEM, filled tile by tile and read by window.
+
+    The cells are kept row-major in a single .npy file so that any window is a
+    zero-copy view of the memory map; only the pages under the window are read
+    from disk. A per-tile flag records which tiles have been filled, so a store
+    can be filled once up front or lazily as trail windows are requested.
+
+    Parameters:
+    path (str): Directory holding dem.npy, filled.npy and meta.json.
+    mode (str): 'r' to read, 'r+' to allow filling.
+    """
+    def __init__(self, path, mode='r'):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.dem = np.load(os.path.join(path, 'dem.npy'), mmap_mode=mode)
+        self.filled = np.load(os.path.join(path, 'filled.npy'), mmap_mode=mode)
+        self.tile = self.meta['tile']
+        self.reads = {'windows': 0, 'tiles': 0, 'fetched': 0}
+
+    @classmethod
+    def create(cls, path, shape, origin, cellsize, wkt='', tile=512, dtype='float32'):
+        """
+        Creates an empty store.
+
+        The files are written to a temporary directory that is renamed into
+        place, so processes sharing the data folder never see a half-written
+        store. If another process created the store first, that one is opened.
+
+        Parameters:
+        path (str): Directory for the store files.
+        shape (tuple): Rows and columns of the full DEM.
+        origin (tuple): x, y of the upper-left corner of the DEM.
+        cellsize (tuple): Cell width and height.
+        wkt (str): WKT of the DEM coordinate system.
+        tile (int): Tile edge length in cells.
+        dtype (str): Cell data type.
+
+        Returns:
+        DEMStore opened for filling.
+        """
+        tmp = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        dem = np.lib.format.open_memmap(os.path.join(tmp, 'dem.npy'), mode='w+',
+                                        dtype=dtype, shape=tuple(shape))
+        dem.flush()
+        ntiles = (-(-shape[0] // tile), -(-shape[1] // tile))
+        filled = np.lib.format.open_memmap(os.path.join(tmp, 'filled.npy'), mode='w+',
+                                           dtype=np.uint8, shape=ntiles)
+        filled.flush()
+        meta = {'shape': list(shape),
+                'origin': list(origin),
+                'cellsize': list(cellsize),
+                'wkt': wkt,
+                'tile': tile}
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+        del dem, filled
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                raise
+        return cls(path, 'r+')
+
+    def cells(self, xmin, ymin, xmax, ymax):
+        """
+        Converts a map extent to the cell window that covers it.
+
+        An extent partly outside the DEM is clipped to it; one wholly outside
+        raises a ValueError rather than returning an empty window.
+
+        Parameters:
+        xmin, ymin, xmax, ymax (float): Extent in the DEM coordinate system.
+
+        Returns:
+        (row0, row1, col0, col1) window clipped to the DEM.
+        """
+        x0, y0 = self.meta['origin']
+        cx, cy = self.meta['cellsize']
+        nrows, ncols = self.meta['shape']
+
+        def clip(i, n):
+            return min(max(int(i), 0), n)
+        col0 = clip((xmin - x0) // cx, ncols)
+        row0 = clip((y0 - ymax) // cy, nrows)
+        col1 = clip(-(-(xmax - x0) // cx), ncols)
+        row1 = clip(-(-(y0 - ymin) // cy), nrows)
+        if row0 >= row1 or col0 >= col1:
+            raise ValueError(f'Extent ({xmin}, {ymin}, {xmax}, {ymax}) does not overlap DEM store {self.path}')
+        return row0, row1, col0, col1
+
+    def tiles(self, row0, row1, col0, col1):
+        """
+        Lists the tiles intersecting a cell window.
+
+        Returns:
+        List of (tile_row, tile_col) indices.
+        """
+        t = self.tile
+        return [(tr, tc)
+                for tr in range(row0 // t, -(-row1 // t))
+                for tc in range(col0 // t, -(-col1 // t))]
+
+    def fill(self, fetch, tiles=None):
+        """
+        Fills tiles from the source raster.
+
+        Parameters:
+        fetch (function): Called as fetch(row0, row1, col0, col1), returns the cells.
+        tiles (list): Tiles to fill, or None for every unfilled tile.
+
+        Returns:
+        Number of tiles fetched (int)
+        """
+        if tiles is None:
+            tiles = [tuple(idx) for idx in np.argwhere(self.filled == 0)]
+        t = self.tile
+        nrows, ncols = self.meta['shape']
+        count = 0
+        for tr, tc in tiles:
+            if self.filled[tr, tc]:
+                continue
+            r0, c0 = tr * t, tc * t
+            r1, c1 = min(r0 + t, nrows), min(c0 + t, ncols)
+            self.dem[r0:r1, c0:c1] = fetch(r0, r1, c0, c1)
+            self.filled[tr, tc] = 1
+            count += 1
+        if count:
+            self.dem.flush()
+            self.filled.flush()
+        self.reads['fetched'] += count
+        return count
+
+    def window(self, xmin, ymin, xmax, ymax, fetch=None):
+        """
+        Returns the DEM cells covering an extent as a view of the memory map.
+
+        Parameters:
+        xmin, ymin, xmax, ymax (float): Extent in the DEM coordinate system.
+        fetch (function): Fills missing tiles if given; see fill.
+
+        Returns:
+        dem (ndarray): 2D view of the window, NoData as NaN.
+        ul (tuple): x, y of the upper-left corner of the window.
+        """
+        row0, row1, col0, col1 = self.cells(xmin, ymin, xmax, ymax)
+        tiles = self.tiles(row0, row1, col0, col1)
+        missing = [idx for idx in tiles if not self.filled[idx]]
+        if missing:
+            if fetch is None:
+                raise ValueError(f'DEM store {self.path} has {len(missing)} unfilled tiles in window')
+            self.fill(fetch, missing)
+        self.reads['windows'] += 1
+        self.reads['tiles'] += len(tiles)
+
+        x0, y0 = self.meta['origin']
+        cx, cy = self.meta['cellsize']
+        ul = (x0 + col0 * cx, y0 - row0 * cy)
+        return self.dem[row0:row1, col0:col1], ul
+
+    def sample(self, x, y, fetch=None):
+        """
+        Interpolates the DEM under scattered points, filling only the tiles they touch.
+
+        Parameters:
+        x, y (ndarray): Point coordinates in the DEM coordinate system.
+        fetch (function): Fills missing tiles if given; see fill.
+
+        Returns:
+        Elevations (ndarray), NaN outside the DEM.
+        """
+        x0, y0 = self.meta['origin']
+        cx, cy = self.meta['cellsize']
+        nrows, ncols = self.meta['shape']
+        cols = (np.asarray(x, dtype=np.float64) - x0) / cx - 0.5
+        rows = (y0 - np.asarray(y, dtype=np.float64)) / cy - 0.5
+        t = self.tile
+        r = np.clip(np.floor(rows).astype(np.int64), 0, nrows - 1)
+        c = np.clip(np.floor(cols).astype(np.int64), 0, ncols - 1)
+        # each point reads its cell and the next row and column
+        rr = np.concatenate((r, np.minimum(r + 1, nrows - 1), r, np.minimum(r + 1, nrows - 1))) // t
+        cc = np.concatenate((c, c, np.minimum(c + 1, ncols - 1), np.minimum(c + 1, ncols - 1))) // t
+        touched = np.zeros(self.filled.shape, dtype=bool)
+        touched[rr, cc] = True
+        missing = [tuple(idx) for idx in np.argwhere(touched & (self.filled[:] == 0)).tolist()]
+        if missing:
+            if fetch is None:
+                raise ValueError(f'DEM store {self.path} has {len(missing)} unfilled tiles under the points')
+            self.fill(fetch, missing)
+        self.reads['tiles'] += int(touched.sum())
+        return bilinear(self.dem, rows, cols)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+"""hike_trace.py: Times the stages, geoprocessing tools and REST requests of Best Hikes builds."""
+
+# SETUP
+
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import threading
+import contextlib
+
+# FUNCTIONS
+
+class Tracer:
+    """
+    Records timed spans with CPU time and bytes fetched, exported as a Chrome trace.
+
+    Spans nest per thread. CPU time is the thread's own, and bytes are those
+    fetched on the span's thread while it was open, so parallel fetches are
+    attributed to the stage that made them.
+    """
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.t0 = time.perf_counter()
+        self.enabled = True
+
+    def add_bytes(self, n):
+        """
+        Counts bytes fetched on the current thread.
+
+        Parameters:
+        n (int): Bytes received.
+
+        Returns:
+        None
+        """
+        self.local.bytes = getattr(self.local, 'bytes', 0) + n
+
+    @contextlib.contextmanager
+    def span(self, name, cat='stage', **args):
+        """
+        Times the enclosed block as one trace event.
+
+        Parameters:
+        name (str): Event name, e.g. a function or tool name.
+        cat (str): Category, e.g. 'stage', 'map', 'gp' or 'rest'.
+        args: Extra values stored with the event.
+
+        Returns:
+        Context manager.
+        """
+        if not self.enabled:
+            yield
+            return
+        b0 = getattr(self.local, 'bytes', 0)
+        c0 = time.thread_time()
+        w0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            w1 = time.perf_counter()
+            event = {'name': name, 'cat': cat, 'ph': 'X',
+                     'ts': round((w0 - self.t0) * 1e6, 1),
+                     'dur': round((w1 - w0) * 1e6, 1),
+                     'pid': os.getpid(),
+                     'tid': threading.get_ident(),
+                     'args': dict(args, cpu_ms=round((time.thread_time() - c0) * 1e3, 3),
+                                  bytes=getattr(self.local, 'bytes', 0) - b0)}
+            with self.lock:
+                self.events.append(event)
+
+    def wrap(self, fn, cat, name=None):
+        """
+        Wraps a function so every call is recorded as a span.
+
+        Parameters:
+        fn (function): Function to time.
+        cat (str): Span category.
+        name (str): Span name, defaults to the function name.
+
+        Returns:
+        Wrapped function.
+        """
+        if getattr(fn, 'traced', False):
+            return fn
+        label = name or getattr(fn, '__name__', str(fn))
+
+        @functools.wraps(fn)
+        def traced(*args, **kwargs):
+            with self.span(label, cat):
+                return fn(*args, **kwargs)
+        traced.traced = True
+        return traced
+
+    def trace_functions(self, namespace, prefixes, cat='map'):
+        """
+        Replaces the functions of a namespace whose names start with a prefix by traced ones.
+
+        Calls between the functions look the names up in the namespace, so
+        nested calls are traced too.
+
+        Parameters:
+        namespace (dict): e.g. globals() of the map script.
+        prefixes (tuple): Name prefixes, e.g. ('gen_', 'add', 'create', 'set_mf').
+        cat (str): Span category.
+
+        Returns:
+        List of traced names.
+        """
+        names = [n for n, fn in namespace.items() if n.startswith(prefixes) and callable(fn)
+                 and not isinstance(fn, type)]
+        for n in names:
+            namespace[n] = self.wrap(namespace[n], cat, n)
+        return names
+
+    def trace_module(self, module, cat='gp', prefix='', names=None):
+        """
+        Replaces the public functions of a module, e.g. a geoprocessing toolbox, by traced ones.
+
+        Parameters:
+        module (module): Module whose functions to trace.
+        cat (str): Span category.
+        prefix (str): Added to span names, e.g. 'management.'.
+        names (list): Names of the functions to trace, or None for every public function.
+
+        Returns:
+        originals (dict): Name to the replaced function, for untrace.
+        """
+        originals = {}
+        for n in names if names is not None else dir(module):
+            fn = getattr(module, n)
+            if n.startswith('_') or isinstance(fn, type) or not callable(fn):
+                continue
+            originals[n] = fn
+            setattr(module, n, self.wrap(fn, cat, prefix + n))
+        return originals
+
+    def untrace(self, module, originals):
+        """
+        Puts back the functions trace_module replaced.
+
+        Parameters:
+        module (module): Module passed to trace_module.
+        originals (dict): Its return value.
+
+        Returns:
+        None
+        """
+        for n, fn in originals.items():
+            setattr(module, n, fn)
+
+    @contextlib.contextmanager
+    def traced_modules(self, modules, cat='gp'):
+        """
+        Traces the functions of modules for the length of a block and restores them afterwards.
+
+        Parameters:
+        modules (list): (module, prefix, names) per module, as for trace_module.
+        cat (str): Span category.
+
+        Returns:
+        Context manager.
+        """
+        patched = []
+        try:
+            for module, prefix, names in modules:
+                patched.append((module, self.trace_module(module, cat, prefix, names)))
+            yield
+        finally:
+            for module, originals in reversed(patched):
+                self.untrace(module, originals)
+
+    def write(self, path, meta=None):
+        """
+        Writes the recorded spans as a Chrome trace file (chrome://tracing, Perfetto).
+
+        Parameters:
+        path (str): Output JSON path.
+        meta (dict): Extra values stored with the trace, e.g. the trail.
+
+        Returns:
+        None
+        """
+        with self.lock:
+            events = list(self.events)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        threads = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                    'args': {'name': names.get(tid, str(tid))}}
+                   for tid in sorted({e['tid'] for e in events})]
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'traceEvents': threads + events, 'displayTimeUnit': 'ms',
+                       'otherData': meta or {}}, f)
+        os.replace(tmp, path)
+
+    def reset(self):
+        """
+        Drops the recorded spans and restarts the clock.
+
+        Returns:
+        None
+        """
+        with self.lock:
+            self.events = []
+            self.t0 = time.perf_counter()
+
+# shared by the map script and the helper modules
+tracer = Tracer()
+
+def load_events(path):
+    """
+    Reads the span events of a trace file.
+
+    Parameters:
+    path (str): Trace JSON written by Tracer.write.
+
+    Returns:
+    events (list): Complete ('X') events.
+    meta (dict): Values stored with the trace.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return [e for e in data['traceEvents'] if e.get('ph') == 'X'], data.get('otherData', {})
+
+def summarize(paths, cats=('stage', 'map'), top=15):
+    """
+    Ranks the slowest stages across the trace files of a batch of trails.
+
+    Parameters:
+    paths (list): Trace JSON files.
+    cats (tuple): Categories to rank, e.g. ('gp',) for geoprocessing tools.
+    top (int): Rows to keep.
+
+    Returns:
+    rows (list): Dictionaries of name, category, calls, trails, wall, mean, max, cpu seconds and bytes.
+    """
+    rows = {}
+    for path in paths:
+        events, meta = load_events(path)
+        trail = meta.get('trail', os.path.basename(os.path.dirname(os.path.abspath(path))))
+        for e in events:
+            if e['cat'] not in cats:
+                continue
+            row = rows.setdefault((e['cat'], e['name']), {'name': e['name'], 'cat': e['cat'], 'calls': 0,
+                                                          'trails': set(), 'wall': 0.0, 'max': 0.0,
+                                                          'cpu': 0.0, 'bytes': 0})
+            row['calls'] += 1
+            row['trails'].add(trail)
+            row['wall'] += e['dur'] / 1e6
+            row['max'] = max(row['max'], e['dur'] / 1e6)
+            row['cpu'] += e['args'].get('cpu_ms', 0) / 1e3
+            row['bytes'] += e['args'].get('bytes', 0)
+    rows = sorted(rows.values(), key=lambda r: r['wall'], reverse=True)[:top]
+    for r in rows:
+        r['trails'] = len(r['trails'])
+        r['mean'] = r['wall'] / r['calls']
+    return rows
+
+def print_summary(rows):
+    """
+    Prints the output of summarize as a table.
+
+    Returns:
+    None
+    """
+    print(f'{"stage":<28} {"cat":<6} {"calls":>5} {"trails":>6} {"wall s":>8} {"mean s":>8} '
+          f'{"max s":>8} {"cpu s":>8} {"MB":>8}')
+    for r in rows:
+        print(f'{r["name"][:28]:<28} {r["cat"]:<6} {r["calls"]:>5} {r["trails"]:>6} {r["wall"]:>8.2f} '
+              f'{r["mean"]:>8.3f} {r["max"]:>8.2f} {r["cpu"]:>8.2f} {r["bytes"] / 2**20:>8.2f}')
+    pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('traces', nargs='+', help='trace JSON files, e.g. batch/*/scratch.trace.json')
+    parser.add_argument('--cats', default='stage,map', help='comma-separated categories to rank')
+    parser.add_argument('--top', type=int, default=15, help='rows to show')
+    args = parser.parse_args()
+    print_summary(summarize(args.traces, tuple(args.cats.split(',')), args.top))
+    sys.exit(0)
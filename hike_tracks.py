@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+
+"""hike_tracks.py: Streams GPX routes into NumPy coordinate arrays for the Best Hikes maps."""
+
+# SETUP
+
+import os
+from array import array
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# mean Earth radius in meters
+earth_r = 6371008.8
+
+# GPX elements that hold ordered vertices, keyed by their parent element
+gpx_parts = {'trk': 'trkpt',
+             'rte': 'rtept'}
+
+# layout map frame width and height in inches, from layout_init
+map_frame = (5.0, 3.75)
+
+# map scale denominators to choose camera scales from
+standard_scales = [5000, 7500, 10000, 12000, 15000, 20000, 24000, 25000, 30000,
+                   35000, 40000, 50000, 62500, 75000, 100000, 125000, 150000, 250000]
+
+# FUNCTIONS
+
+def _tag(elem):
+    """
+    Strips the XML namespace from an element tag.
+
+    Parameters:
+    elem (Element): Parsed XML element.
+
+    Returns:
+    Local tag name (str)
+    """
+    return elem.tag.rsplit('}', 1)[-1]
+
+def iter_gpx_tracks(gpx_path):
+    """
+    Streams tracks and routes out of a GPX file one at a time.
+
+    The file is parsed incrementally and each finished track is cleared from
+    the element tree, so memory use is bounded by the largest single track.
+
+    Parameters:
+    gpx_path (str): Path to the GPX file.
+
+    Yields:
+    (name, coords) (tuple): Track name and (N, 3) float64 array of lon, lat, ele.
+    """
+    name = None
+    part = None
+    depth = 0
+    buf = array('d')
+    pt = [np.nan, np.nan, np.nan]
+
+    for event, elem in ET.iterparse(gpx_path, events=('start', 'end')):
+        tag = _tag(elem)
+        if event == 'start':
+            if part is None and tag in gpx_parts:
+                part, name, depth, buf = tag, None, 0, array('d')
+            elif part is not None:
+                depth += 1
+                if tag == gpx_parts[part]:
+                    pt = [float(elem.get('lon')), float(elem.get('lat')), np.nan]
+            continue
+
+        if part is None:
+            continue
+        if tag == part:
+            coords = np.frombuffer(buf, dtype=np.float64).reshape(-1, 3)
+            yield (name or '', coords)
+            part = None
+            elem.clear()
+            continue
+
+        depth -= 1
+        if tag == 'name' and depth == 0:
+            name = (elem.text or '').strip()
+        elif tag == 'ele':
+            pt[2] = float(elem.text)
+        elif tag == gpx_parts[part]:
+            buf.extend(pt)
+            elem.clear()
+
+def read_gpx_tracks(gpx_path):
+    """
+    Reads every track in a GPX file and groups the vertices by track name.
+
+    Tracks sharing a name are joined end to end in file order, matching
+    PointsToLine with Line_Field = "Name" and CONTINUOUS construction.
+
+    Parameters:
+    gpx_path (str): Path to the GPX file.
+
+    Returns:
+    tracks (dict): Track name to (N, 3) float64 array of lon, lat, ele.
+    """
+    parts = {}
+    for name, coords in iter_gpx_tracks(gpx_path):
+        parts.setdefault(name, []).append(coords)
+
+    tracks = {}
+    for name, arrs in parts.items():
+        tracks[name] = arrs[0] if len(arrs) == 1 else np.concatenate(arrs)
+    return tracks
+
+def track_json(coords, wkid=4326):
+    """
+    Builds an Esri JSON polyline from a track coordinate array.
+
+    Parameters:
+    coords (ndarray): (N, 2) or (N, 3) array of lon, lat[, ele].
+    wkid (int): Well-known ID of the coordinate system.
+
+    Returns:
+    Dictionary of the Esri JSON polyline.
+    """
+    return {'paths': [coords[:, :2].tolist()],
+            'spatialReference': {'wkid': wkid}}
+
+def simplify_tolerance(scale, width, frac=0.5):
+    """
+    Converts a printed line width into a ground tolerance at a map scale.
+
+    Vertices that deviate less than a fraction of the stroke width are hidden
+    under the line itself once printed.
+
+    Parameters:
+    scale (float): Map scale denominator, e.g. mf_camScale.
+    width (float): Printed line width in points.
+    frac (float): Fraction of the line width allowed as deviation.
+
+    Returns:
+    Tolerance in meters (float)
+    """
+    return scale * (width / 72.0) * 0.0254 * frac
+
+def local_xy(coords):
+    """
+    Projects lon/lat to local equirectangular meters about the track center.
+
+    Parameters:
+    coords (ndarray): (N, 2+) array of lon, lat.
+
+    Returns:
+    (N, 2) float64 array of x, y in meters.
+    """
+    lon = np.radians(coords[:, 0])
+    lat = np.radians(coords[:, 1])
+    lat0 = lat.mean() if len(lat) else 0.0
+    return np.column_stack(((lon - lon.mean()) * np.cos(lat0) * earth_r,
+                            (lat - lat0) * earth_r))
+
+def dp_mask(xy, tol):
+    """
+    Douglas-Peucker vertex selection with vectorized segment distances.
+
+    Parameters:
+    xy (ndarray): (N, 2) array of planar coordinates.
+    tol (float): Maximum perpendicular deviation in coordinate units.
+
+    Returns:
+    keep (ndarray): Boolean mask of retained vertices.
+    """
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    if n < 3:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        seg = xy[j] - xy[i]
+        pts = xy[i + 1:j] - xy[i]
+        seg_len = np.hypot(*seg)
+        if seg_len == 0:
+            d = np.hypot(pts[:, 0], pts[:, 1])
+        else:
+            d = np.abs(seg[0] * pts[:, 1] - seg[1] * pts[:, 0]) / seg_len
+        k = int(np.argmax(d))
+        if d[k] > tol:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return keep
+
+def simplify_track(coords, tol):
+    """
+    Simplifies a lon/lat track to a ground tolerance.
+
+    Parameters:
+    coords (ndarray): (N, 3) array of lon, lat, ele.
+    tol (float): Tolerance in meters.
+
+    Returns:
+    Simplified (M, 3) coordinate array.
+    """
+    return coords[dp_mask(local_xy(coords), tol)]
+
+# simplified tracks keyed by (track name, scale, line width)
+simplify_cache = {}
+
+def simplify_tracks(tracks, scale, width=3.4):
+    """
+    Simplifies every track for a map scale, reusing cached results.
+
+    Parameters:
+    tracks (dict): Track name to coordinate array.
+    scale (float): Map scale denominator, e.g. mf_camScale.
+    width (float): Printed line width in points.
+
+    Returns:
+    simp (dict): Track name to simplified coordinate array.
+    stats (dict): Vertex counts before and after, and cache hits.
+    """
+    tol = simplify_tolerance(scale, width)
+    simp = {}
+    stats = {'before': 0, 'after': 0, 'removed': 0, 'cached': 0}
+    for name, coords in tracks.items():
+        key = (name, scale, width)
+        hit = simplify_cache.get(key)
+        if hit is not None and hit[0] is coords:
+            stats['cached'] += 1
+        else:
+            hit = (coords, simplify_track(coords, tol))
+            simplify_cache[key] = hit
+        simp[name] = hit[1]
+        stats['before'] += len(coords)
+        stats['after'] += len(hit[1])
+    stats['removed'] = stats['before'] - stats['after']
+    return simp, stats
+
+def track_frames(tracks, frame=map_frame, pad=0.1, margin=0.5, scales=standard_scales):
+    """
+    Computes the map camera and data extent of every track in one vectorized pass.
+
+    Each track's bounding box is padded by a fraction of its size on every
+    side, and the smallest standard scale whose map frame holds the padded
+    box is picked. The data extent is the frame's ground footprint at that
+    scale, grown by a margin so layers cover the whole frame.
+
+    Parameters:
+    tracks (dict): Track name to coordinate array of lon, lat.
+    frame (tuple): Map frame width and height in inches.
+    pad (float): Padding around the bounding box as a fraction of its size.
+    margin (float): Extra data extent as a fraction of the frame footprint.
+    scales (list): Standard scale denominators, ascending.
+
+    Returns:
+    frames (dict): Name to bbox, camera x, y, scale and extent (xmin, ymin, xmax, ymax).
+    """
+    names = [n for n, xy in tracks.items() if len(xy)]
+    if not names:
+        return {}
+    xy = np.concatenate([tracks[n][:, :2] for n in names])
+    starts = np.cumsum([0] + [len(tracks[n]) for n in names[:-1]])
+    lo = np.minimum.reduceat(xy, starts)
+    hi = np.maximum.reduceat(xy, starts)
+    center = (lo + hi) / 2
+
+    # degrees to ground meters at each track's center latitude
+    m_per_deg = np.radians(1) * earth_r
+    kx = m_per_deg * np.cos(np.radians(center[:, 1]))
+    size_m = (hi - lo) * np.column_stack((kx, np.full(len(kx), m_per_deg)))
+    frame_m = np.array(frame) * 0.0254
+    need = np.max(size_m * (1 + 2 * pad) / frame_m, axis=1)
+    scales = np.asarray(scales)
+    scale = scales[np.minimum(np.searchsorted(scales, need), len(scales) - 1)]
+    scale = np.maximum(scale, need)
+
+    half = frame_m * scale[:, None] * (1 + margin) / 2
+    half_deg = half / np.column_stack((kx, np.full(len(kx), m_per_deg)))
+    ext = np.hstack((center - half_deg, center + half_deg))
+    return {n: {'bbox': tuple(np.hstack((lo[i], hi[i])).tolist()),
+                'camx': float(center[i, 0]),
+                'camy': float(center[i, 1]),
+                'scale': int(np.ceil(scale[i])),
+                'extent': tuple(ext[i].tolist())}
+            for i, n in enumerate(names)}
+
+def route_trail(trails, route):
+    """
+    Finds the trail of a route by its 'route' entry, or its trail name if it has none.
+
+    Parameters:
+    trails (dict): trails_dict of the map script.
+    route (str): Route name from the GPX file.
+
+    Returns:
+    Trail key (str), or None if no trail matches.
+    """
+    for key, attr in trails.items():
+        if attr.get('route', attr['trail_name']) == route:
+            return key
+    return None
+
+def scale_roads(trails, scale, default='roads8'):
+    """
+    Picks the roads service layer for a map scale from the trail with the nearest camera scale.
+
+    Parameters:
+    trails (dict): trails_dict of the map script.
+    scale (float): Camera scale denominator.
+    default (str): Roads layer if no trail has one.
+
+    Returns:
+    Key of roads_svc (str).
+    """
+    known = [(abs(np.log(attr['mf_camScale'] / scale)), attr['roads']) for attr in trails.values()
+             if 'roads' in attr and 'mf_camScale' in attr]
+    return min(known)[1] if known else default
+
+def add_frames(trails, frames, overwrite=False, roads=None):
+    """
+    Fills trails_dict with the extents and cameras of framed routes.
+
+    Routes without a trail get a new entry keyed by route name. Hand-tuned
+    values are kept unless overwrite is set.
+
+    Parameters:
+    trails (dict): trails_dict of the map script, updated in place.
+    frames (dict): Output of track_frames.
+    overwrite (bool): Replace existing topo_ext and camera values.
+    roads (str): Roads layer for new entries, or None for the one of scale_roads.
+
+    Returns:
+    trails (dict): The updated trails_dict.
+    """
+    for route, frm in frames.items():
+        key = route_trail(trails, route) or route
+        if key not in trails:
+            trails[key] = {'trail_name': route, 'route': route,
+                           'roads': roads or scale_roads(trails, frm['scale'])}
+        attr = trails[key]
+        computed = {'topo_ext': ''.join(f'{v:.4f} ' for v in frm['extent']),
+                    'mf_camx': frm['camx'],
+                    'mf_camy': frm['camy'],
+                    'mf_camScale': frm['scale']}
+        for name, value in computed.items():
+            if overwrite or name not in attr:
+                attr[name] = value
+    return trails
+
+def haversine(lon0, lat0, lon1, lat1):
+    """
+    Computes great-circle distances between arrays of points.
+
+    Parameters:
+    lon0, lat0, lon1, lat1 (ndarray): Coordinates in degrees.
+
+    Returns:
+    Distances in meters (ndarray).
+    """
+    lon0, lat0, lon1, lat1 = [np.radians(v) for v in (lon0, lat0, lon1, lat1)]
+    h = (np.sin((lat1 - lat0) / 2) ** 2 +
+         np.cos(lat0) * np.cos(lat1) * np.sin((lon1 - lon0) / 2) ** 2)
+    return 2 * earth_r * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+def track_profiles(tracks, sample=None, spacing=20.0):
+    """
+    Computes distance, elevation gain and loss and a resampled profile for every track at once.
+
+    Distances and elevations of all tracks are computed in one NumPy call
+    each; every track is then resampled on its own distance axis, so a
+    track never borrows elevations from its neighbours. Gain and loss are
+    summed on the evenly resampled profile, which keeps DEM noise between
+    close vertices out of the totals. A track without any valid elevation,
+    e.g. outside the DEM, gets NaN elevations, gain, loss, min and max.
+
+    Parameters:
+    tracks (dict): Track name to coordinate array of lon, lat[, ele].
+    sample (function): Called as sample(lon, lat) for elevations, e.g. from the DEM;
+        the track's own elevations are used if None.
+    spacing (float): Profile sample spacing in meters.
+
+    Returns:
+    stats (dict): Name to distance, gain, loss, min and max elevation in meters.
+    profiles (dict): Name to (M, 2) array of distance and elevation.
+    """
+    names = [n for n, xy in tracks.items() if len(xy) > 1]
+    if not names:
+        return {}, {}
+    coords = np.concatenate([tracks[n] for n in names])
+    counts = np.array([len(tracks[n]) for n in names])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    seg = np.empty(len(coords))
+    seg[0] = 0
+    seg[1:] = haversine(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    seg[starts] = 0
+    cum = np.cumsum(seg)
+    length = np.add.reduceat(seg, starts)
+    dist = cum - np.repeat(cum[starts], counts)
+    ele = np.asarray(sample(coords[:, 0], coords[:, 1]) if sample else coords[:, 2], dtype=float)
+
+    stats, profiles = {}, {}
+    for i, n in enumerate(names):
+        d = dist[starts[i]:starts[i] + counts[i]]
+        z = ele[starts[i]:starts[i] + counts[i]]
+        valid = ~np.isnan(z)
+        along = np.minimum(np.arange(int(length[i] // spacing) + 2) * spacing, length[i])
+        if valid.any():
+            prof = np.interp(along, d[valid], z[valid])
+            step = np.diff(prof)
+            gain, loss = np.maximum(step, 0).sum(), np.maximum(-step, 0).sum()
+            lo, hi = prof.min(), prof.max()
+        else:
+            prof = np.full(len(along), np.nan)
+            gain = loss = lo = hi = np.nan
+        stats[n] = {'distance': float(length[i]),
+                    'gain': float(gain),
+                    'loss': float(loss),
+                    'min_ele': float(lo),
+                    'max_ele': float(hi)}
+        profiles[n] = np.column_stack((along, prof))
+    return stats, profiles
+
+def save_profiles(path, stats, profiles):
+    """
+    Writes track stats and profiles to one .npz file.
+
+    Parameters:
+    path (str): Output .npz path.
+    stats (dict): Output of track_profiles.
+    profiles (dict): Output of track_profiles.
+
+    Returns:
+    None
+    """
+    names = list(stats)
+    keys = ['distance', 'gain', 'loss', 'min_ele', 'max_ele']
+    tmp = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp, names=np.array(names, dtype=str), keys=np.array(keys, dtype=str),
+             stats=np.array([[stats[n][k] for k in keys] for n in names]).reshape(len(names), len(keys)),
+             **{f'profile_{i}': profiles[n] for i, n in enumerate(names)})
+    os.replace(tmp, path)
+
+def load_profiles(path):
+    """
+    Reads track stats and profiles written by save_profiles.
+
+    Parameters:
+    path (str): .npz path.
+
+    Returns:
+    stats (dict), profiles (dict) as from track_profiles.
+    """
+    with np.load(path) as f:
+        keys = [str(k) for k in f['keys']]
+        stats, profiles = {}, {}
+        for i, n in enumerate(str(n) for n in f['names']):
+            stats[n] = dict(zip(keys, f['stats'][i].tolist()))
+            profiles[n] = f[f'profile_{i}']
+    return stats, profiles
+
+def track_summary(tracks):
+    """
+    Summarizes track and vertex counts for a set of tracks.
+
+    Parameters:
+    tracks (dict): Track name to coordinate array.
+
+    Returns:
+    Dictionary of track and vertex counts.
+    """
+    return {'tracks': len(tracks),
+            'vertices': int(sum(len(xy) for xy in tracks.values()))}
+
+if __name__ == '__main__':
+    import sys
+    for gpx_path in sys.argv[1:]:
+        trks = read_gpx_tracks(gpx_path)
+        print(os.path.basename(gpx_path), track_summary(trks))
+        for trk_name, trk_xy in trks.items():
+            print(f'  {trk_name}: {len(trk_xy)} vertices')
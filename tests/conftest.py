@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the helper modules sit in the repository root, next to the map script
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root not in sys.path:
+    sys.path.insert(0, root)
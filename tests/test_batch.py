@@ -0,0 +1,88 @@
+import os
+import json
+
+import hike_batch
+import hike_bench
+
+def test_script_defaults_are_literal():
+    values = hike_batch.read_script_values(hike_batch.template, ['aprx_dir', 'trails_dict'])
+    assert isinstance(values['aprx_dir'], str)
+    assert 'lp' in values['trails_dict']
+
+def test_trail_keys_include_framed_trails(tmp_path):
+    literal = hike_batch.read_trails(data_dir=str(tmp_path))
+    framed = {'lp': dict(literal['lp'], trail_name='framed', mf_camScale=1.0),
+              'Route 7': {'trail_name': 'Route 7', 'route': 'Route 7', 'topo_ext': '0 0 1 1 '}}
+    (tmp_path / hike_batch.trails_file).write_text(json.dumps(framed))
+
+    keys = hike_batch.trail_keys(['all'], data_dir=str(tmp_path))
+    assert set(keys) == set(literal) | {'Route 7'}
+    trails = hike_batch.read_trails(data_dir=str(tmp_path))
+    # hand-written values in the script win
+    assert trails['lp']['trail_name'] == literal['lp']['trail_name']
+    assert hike_batch.trail_keys(['Route 7'], data_dir=str(tmp_path)) == ['Route 7']
+
+def test_build_trails_with_stub(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    hike_bench.build_fixtures(data_dir, 0.25)
+    out_dir = str(tmp_path / 'batch')
+    results = hike_batch.build_trails(['lp'], os.path.join(data_dir, 'bench.aprx'), out_dir, workers=1,
+                                      stub_dir=hike_bench.bench_dir, extra_env={'HIKE_DATA': data_dir})
+    assert [r['status'] for r in results] == ['ok'], open(results[0]['log']).read()[-2000:]
+    assert os.path.exists(os.path.join(out_dir, 'lp', 'lp.aprx'))
+    assert os.path.exists(results[0]['trace'])
+    with open(os.path.join(out_dir, 'summary.json')) as f:
+        summary = json.load(f)
+    assert summary['workers'] == 1 and summary['slowest_stages']
+    with open(os.path.join(out_dir, 'batch.log')) as f:
+        assert f.readline().startswith('===== lp (ok')
+
+def test_run_trail_twice_on_same_gdb(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    hike_bench.build_fixtures(data_dir, 0.25)
+    out_dir = str(tmp_path / 'batch')
+    for run in range(2):
+        res = hike_batch.run_trail('lp', os.path.join(data_dir, 'bench.aprx'), out_dir,
+                                   stub_dir=hike_bench.bench_dir, extra_env={'HIKE_DATA': data_dir})
+        with open(res['log']) as f:
+            log = f.read()
+        assert res['status'] == 'ok', log[-2000:]
+    # the second build reuses the service layers it clipped the first time
+    assert "Stage 'svc_hydro' is up to date" in log
+    assert "Stage 'hike_routes_tracks' is up to date" in log
+    assert "Stage 'hike_routes_simplified' is up to date" in log
+    # profiles are kept per trail and cover only the trail's own route
+    assert "Stage 'scratch.lp.profiles.npz' is up to date" in log
+    assert sum(' mi, ' in line for line in log.splitlines()) == 1
+    # workers never rewrite the trails file the batch shares
+    assert not os.path.exists(os.path.join(data_dir, hike_batch.trails_file))
+    # no service feature JSON left next to the geodatabase
+    assert sorted(f for f in os.listdir(os.path.join(out_dir, 'lp')) if f.endswith('.json')) == \
+        ['scratch.journal.json', 'scratch.manifest.json', 'scratch.trace.json']
+
+def test_interrupted_build_resumes(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    hike_bench.build_fixtures(data_dir, 0.25)
+    out_dir = str(tmp_path / 'batch')
+    aprx = os.path.join(data_dir, 'bench.aprx')
+    env = {'HIKE_DATA': data_dir}
+    # the first layer edit after the hydro clip fails, inside the 'water' stage
+    res = hike_batch.run_trail('lp', aprx, out_dir, stub_dir=hike_bench.bench_dir,
+                               extra_env=dict(env, HIKE_FAKE_FAIL='mp.updateConnectionProperties'))
+    assert res['status'] == 'failed'
+    with open(os.path.join(out_dir, 'lp', 'scratch.journal.json')) as f:
+        stages = json.load(f)['lp']
+    assert stages['routes']['status'] == 'done' and stages['water']['status'] == 'failed'
+    # the failed stage's dataset was rolled back
+    assert not os.path.exists(os.path.join(out_dir, 'lp', 'scratch.gdb', 'svc_hydro'))
+
+    res = hike_batch.run_trail('lp', aprx, out_dir, stub_dir=hike_bench.bench_dir, extra_env=env)
+    with open(res['log']) as f:
+        log = f.read()
+    assert res['status'] == 'ok', log[-2000:]
+    assert 'Resuming build' in log
+    with open(os.path.join(out_dir, 'lp', 'scratch.journal.json')) as f:
+        assert json.load(f) == {}
+    with open(res['aprx']) as f:
+        names = [lyr['name'] for mp in json.load(f)['maps'] for lyr in mp['layers']]
+    assert names.count('hydro') == 1
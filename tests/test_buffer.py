@@ -0,0 +1,33 @@
+import numpy as np
+
+import hike_buffer
+
+def ring_area(ring):
+    return 0.5 * np.sum(ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1])
+
+def test_buffer_route_segment_area():
+    d, length = 100.0, 5000.0
+    rings = hike_buffer.buffer_route(np.array([[0.0, 0.0], [length * 0.8, length * 0.6]]), d)
+    assert len(rings) == 1
+    assert ring_area(rings[0]) < 0
+    assert abs(-ring_area(rings[0]) / (2 * d * length + np.pi * d ** 2) - 1) < 1e-3
+
+def test_buffer_route_loop_has_hole():
+    t = np.linspace(0, 2 * np.pi, 200)
+    rings = hike_buffer.buffer_route(np.column_stack((1000 * np.cos(t), 1000 * np.sin(t))), 100.0)
+    areas = sorted(ring_area(r) for r in rings)
+    assert len(rings) == 2
+    assert areas[0] < 0 < areas[1]
+    assert abs((-areas[0] - areas[1]) / (2 * np.pi * 1000 * 200) - 1) < 1e-2
+
+def test_buffer_route_single_vertex_is_a_disc():
+    d, h = 100.0, 100.0 / 24
+    for xy in (np.array([[500.0, 200.0]]), np.array([[500.0, 200.0]] * 3)):
+        rings = hike_buffer.buffer_route(xy, d)
+        assert len(rings) == 1 and ring_area(rings[0]) < 0
+        ring = rings[0]
+        assert np.array_equal(ring[0], ring[-1]) and len(ring) > 16
+        # vertices lie on the circle, chords cut inside it by at most the simplification tolerance
+        r = np.hypot(ring[:, 0] - 500.0, ring[:, 1] - 200.0)
+        assert np.abs(r - d).max() < 0.01 * h
+        assert 1 - (h / 8) / d * 2 < -ring_area(ring) / (np.pi * d ** 2) <= 1
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+import hike_build
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_manifest_skips_current_output(tmp_path):
+    out = str(tmp_path / 'out.txt')
+    manifest = hike_build.Manifest(str(tmp_path / 'manifest.json'))
+
+    def build():
+        with open(out, 'w') as f:
+            f.write('a')
+    assert manifest.stage(out, [], {'v': 1}, build)
+    assert not hike_build.Manifest(manifest.path).stage(out, [], {'v': 1}, build)
+
+def test_manifest_deletes_stale_output_before_rebuild(tmp_path):
+    out = str(tmp_path / 'out.txt')
+    manifest = hike_build.Manifest(str(tmp_path / 'manifest.json'))
+
+    def build():
+        # like an arcpy tool with overwriteOutput off
+        with open(out, 'x') as f:
+            f.write('a')
+    manifest.stage(out, [], {'v': 1}, build, delete=os.remove)
+    assert manifest.stage(out, [], {'v': 2}, build, delete=os.remove)
+    assert manifest.stats['built'] == [out, out]
+
+@pytest.fixture
+def ap(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.join(root, 'bench'))
+    import arcpy
+    yield arcpy
+    for name in [n for n in sys.modules if n == 'arcpy' or n.startswith('arcpy.')]:
+        monkeypatch.delitem(sys.modules, name)
+
+def test_manifest_rebuild_with_arcpy_defaults(ap, tmp_path):
+    assert not ap.env.overwriteOutput
+    gdb = ap.management.CreateFileGDB(str(tmp_path), 'scratch.gdb')
+    out = os.path.join(gdb, 'water')
+    manifest = hike_build.Manifest(str(tmp_path / 'scratch.manifest.json'))
+
+    def build():
+        ap.management.CreateFeatureclass(gdb, 'water', 'POLYGON')
+    manifest.stage(out, [], {'ext': 1}, build, ap.Exists, ap.management.Delete)
+    with pytest.raises(ap.ExecuteError):
+        build()
+    assert manifest.stage(out, [], {'ext': 2}, build, ap.Exists, ap.management.Delete)
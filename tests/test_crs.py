@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import hike_crs
+
+# UTM 18N (EPSG:32618) coordinates of WGS84 points, from PROJ
+utm18n_points = [((-75.0, 42.0), (500000.0000, 4649776.2248)),
+                 ((-76.5, 42.44), (376631.7495, 4699720.6858)),
+                 ((-76.5155907, 42.3139858), (375099.9274, 4685750.8710)),
+                 ((-78.0, 44.0), (259473.6789, 4876249.1270)),
+                 ((-72.1, 40.5), (745744.7983, 4487295.6083))]
+
+# New York Central state plane in US feet, with a vertical system in meters after it
+ny_central_wkt = ('PROJCS["NAD_1983_StatePlane_New_York_Central_FIPS_3102_Feet",'
+                  'GEOGCS["GCS_North_American_1983",DATUM["D_North_American_1983",'
+                  'SPHEROID["GRS_1980",6378137.0,298.257222101]],PRIMEM["Greenwich",0.0],'
+                  'UNIT["Degree",0.0174532925199433]],PROJECTION["Transverse_Mercator"],'
+                  'PARAMETER["False_Easting",820208.3333333333],PARAMETER["False_Northing",0.0],'
+                  'PARAMETER["Central_Meridian",-76.58333333333333],PARAMETER["Scale_Factor",0.9999375],'
+                  'PARAMETER["Latitude_Of_Origin",40.0],UNIT["Foot_US",0.3048006096012192]],'
+                  'VERTCS["NAVD_1988",VDATUM["North_American_Vertical_Datum_1988"],'
+                  'PARAMETER["Vertical_Shift",0.0],PARAMETER["Direction",1.0],UNIT["Meter",1.0]]')
+
+def test_utm_forward_matches_known_coordinates():
+    lonlat = np.array([p for p, _ in utm18n_points])
+    x, y = hike_crs.utm_forward(lonlat[:, 0], lonlat[:, 1])
+    assert np.allclose(np.column_stack((x, y)), [xy for _, xy in utm18n_points], atol=1e-3)
+
+def test_utm_round_trip():
+    lon, lat = np.meshgrid(np.linspace(-78, -72, 25), np.linspace(40, 45, 21))
+    x, y = hike_crs.utm_forward(lon, lat)
+    lon2, lat2 = hike_crs.utm_inverse(x, y)
+    assert np.abs(lon2 - lon).max() < 1e-9 and np.abs(lat2 - lat).max() < 1e-9
+    xy = [xy for _, xy in utm18n_points]
+    back = hike_crs.transform(xy, hike_crs.utm_wkid, hike_crs.wgs84_wkid)
+    assert np.allclose(back, [p for p, _ in utm18n_points], atol=1e-8)
+
+def test_wkt_unit_is_the_projcs_unit():
+    crs = hike_crs.CRS(ny_central_wkt)
+    assert crs.unit == 0.3048006096012192
+    assert crs.params['false_easting'] == pytest.approx(250000.0)
+    # PROJ gives 842701.8399, 889002.1685 US feet for this point
+    x, y = crs.from_lonlat(-76.5, 42.44)
+    assert np.allclose((x, y), (842701.8399, 889002.1685), atol=0.01)
+    lon, lat = crs.to_lonlat(x, y)
+    assert np.allclose((lon, lat), (-76.5, 42.44), atol=1e-9)
+
+def test_wkt_items():
+    items = hike_crs.wkt_items(ny_central_wkt)
+    assert items[0] == '"NAD_1983_StatePlane_New_York_Central_FIPS_3102_Feet"'
+    assert items[1].startswith('GEOGCS[') and items[-1] == 'UNIT["Foot_US",0.3048006096012192]'
+    assert not any('VERTCS' in item for item in items)
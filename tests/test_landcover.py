@@ -0,0 +1,61 @@
+import numpy as np
+
+import hike_landcover
+
+extent = (0.0, 0.0, 0.03, 0.03)
+
+def class_cells(features, code, ncells=30):
+    # signed sum over rings in cell units, outer rings minus holes
+    cell = (extent[2] - extent[0]) / ncells
+    total = 0.0
+    for gridcode, poly in features:
+        if gridcode != code:
+            continue
+        for ring in poly['rings']:
+            xy = np.asarray(ring)
+            total -= 0.5 * np.sum(xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1])
+    return total / cell ** 2
+
+def test_rectangle_area_preserved():
+    codes = np.zeros((30, 30), dtype=np.uint8)
+    codes[5:15, 5:25] = 71
+    features, _ = hike_landcover.generalize(codes, extent, tol=1.0)
+    assert abs(class_cells(features, 71) - 200) < 2
+
+def test_small_block_area_preserved():
+    codes = np.zeros((30, 30), dtype=np.uint8)
+    codes[10:15, 10:15] = 81
+    features, _ = hike_landcover.generalize(codes, extent, tol=1.0)
+    assert abs(class_cells(features, 81) - 25) < 1
+
+def test_adjacent_fields_keep_area_and_share_edge():
+    codes = np.zeros((30, 30), dtype=np.uint8)
+    codes[5:20, 5:15] = 71
+    codes[5:20, 15:25] = 81
+    features, _ = hike_landcover.generalize(codes, extent, tol=1.0)
+    assert abs(class_cells(features, 71) - 150) < 2
+    assert abs(class_cells(features, 81) - 150) < 2
+    # both sides walk the same vertices along x=15, in opposite directions
+    x = 15 * (extent[2] - extent[0]) / 30
+
+    def on_x(v):
+        return abs(v[0] - x) < 1e-12
+
+    edge = {code: [(tuple(p), tuple(q)) for gridcode, poly in features if gridcode == code
+                   for ring in poly['rings'] for p, q in zip(ring[:-1], ring[1:])
+                   if on_x(p) and on_x(q)]
+            for code in (71, 81)}
+    assert edge[71]
+    assert edge[71] == [(q, p) for p, q in edge[81][::-1]]
+
+def test_strips_match_area():
+    codes = np.zeros((40, 30), dtype=np.uint8)
+    codes[3:37, 4:26] = 71
+    ext = (0.0, 0.0, 0.03, 0.04)
+    total = 0.0
+    for feats, _ in hike_landcover.generalize_strips(codes, ext, tol=1.0, budget=30 * 48 * 8):
+        for gridcode, poly in feats:
+            for ring in poly['rings']:
+                xy = np.asarray(ring)
+                total -= 0.5 * np.sum(xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1])
+    assert abs(total / 0.001 ** 2 - 34 * 22) < 3
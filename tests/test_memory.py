@@ -0,0 +1,29 @@
+import numpy as np
+
+import hike_memory
+
+def test_strip_rows_fit_the_budget():
+    assert hike_memory.to_bytes('512 MB') == 512 * 2**20 and hike_memory.to_bytes('1.5kb') == 1536
+    assert hike_memory.to_bytes(4096) == 4096
+    assert hike_memory.strip_rows((1000, 500), 32) == 1000
+    assert hike_memory.strip_rows((1000, 500), 32, '1 MB') == 2**20 // (32 * 500)
+    # never more rows than the raster, never fewer than two
+    assert hike_memory.strip_rows((10, 500), 32, '1 GB') == 10
+    assert hike_memory.strip_rows((1000, 500), 32, 100) == 2
+
+def test_monitor_logs_stages_without_printing(capsys):
+    hike_memory.memory_log.clear()
+    with hike_memory.MemoryMonitor('hillshade') as mon:
+        a = np.ones(2**20)
+    with hike_memory.MemoryMonitor('contours', enabled=False):
+        pass
+    assert capsys.readouterr().out == ''
+    assert hike_memory.memory_log == [mon.stats]
+    assert mon.stats['stage'] == 'hillshade' and mon.stats['alloc_peak_mb'] >= 8.0
+    assert mon.stats['alloc_kept_mb'] >= 8.0 and mon.stats['kept_sites']
+    del a
+    hike_memory.print_summary()
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].split()[0] == 'stage' and out[1].startswith('hillshade')
+    assert out[2].startswith('Memory kept after \'hillshade\': ') and out[2].endswith('8.0 MB')
+    hike_memory.memory_log.clear()
@@ -0,0 +1,65 @@
+import csv
+
+import numpy as np
+
+import hike_poi
+from hike_tracks import local_xy
+
+def write_poi(path, n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-76.60, -76.40, n)
+    lat = rng.uniform(42.30, 42.50, n)
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['name', 'type', 'elevation', 'rank', 'longitude', 'latitude'])
+        for i in range(n):
+            w.writerow([f'P{i}', 'Viewpoint', f'{rng.uniform(100, 600):.1f}', '' if i == 3 else i, lon[i], lat[i]])
+    return np.column_stack((lon, lat))
+
+def test_within_matches_brute_force(tmp_path):
+    xy = write_poi(tmp_path / 'poi.csv')
+    index = hike_poi.POIIndex(str(tmp_path / 'poi.csv'))
+    for win in [(-76.55, 42.35, -76.50, 42.42), (-76.70, 42.20, -76.30, 42.60), (-76.20, 42.0, -76.1, 42.1)]:
+        expect = (xy[:, 0] >= win[0]) & (xy[:, 0] <= win[2]) & (xy[:, 1] >= win[1]) & (xy[:, 1] <= win[3])
+        got = index.xy[index.within(*win)]
+        assert sorted(map(tuple, got.tolist())) == sorted(map(tuple, xy[expect].tolist()))
+
+def test_near_matches_brute_force(tmp_path):
+    xy = write_poi(tmp_path / 'poi.csv')
+    index = hike_poi.POIIndex(str(tmp_path / 'poi.csv'))
+    route = np.array([[-76.55, 42.36], [-76.50, 42.40], [-76.48, 42.45]])
+    got = index.near(route, 800.0)
+    # distance from every point to every route segment, densely sampled
+    t = np.linspace(0, 1, 2001)[:, None]
+    line = np.concatenate([a + t * (b - a) for a, b in zip(route[:-1], route[1:])])
+    local = local_xy(np.vstack((route, xy, line)))
+    pts, dense = local[len(route):len(route) + len(xy)], local[len(route) + len(xy):]
+    d = np.min(np.hypot(*(pts[:, None] - dense[None]).transpose(2, 0, 1)), axis=1)
+    near = set(map(tuple, xy[d <= 800.0].tolist()))
+    assert set(map(tuple, index.xy[got].tolist())) == near and len(near) > 5
+
+def test_index_round_trip(tmp_path):
+    path = str(tmp_path / 'poi.csv')
+    write_poi(path)
+    built = hike_poi.POIIndex(path)
+    assert built.stats['built']
+    loaded = hike_poi.POIIndex(path)
+    assert not loaded.stats['built']
+    win = (-76.55, 42.35, -76.45, 42.45)
+    assert np.array_equal(loaded.within(*win), built.within(*win))
+    assert loaded.records(loaded.within(*win)) == built.records(built.within(*win))
+    assert loaded.types == built.types
+    # a changed table or cell size rebuilds the index
+    write_poi(path, seed=1)
+    assert hike_poi.POIIndex(path).stats['built']
+    assert hike_poi.POIIndex(path, cell=0.02).stats['built']
+
+def test_records_keep_column_types(tmp_path):
+    path = str(tmp_path / 'poi.csv')
+    write_poi(path)
+    index = hike_poi.POIIndex(path)
+    assert index.columns == ['name', 'type', 'elevation', 'rank']
+    assert index.types == ['TEXT', 'TEXT', 'DOUBLE', 'LONG']
+    records = dict((row[0], row) for _, row in index.records(np.arange(len(index.xy))))
+    assert isinstance(records['P7'][2], float) and records['P7'][3] == 7
+    assert records['P3'][3] is None
@@ -0,0 +1,31 @@
+import os
+import zlib
+import struct
+
+import numpy as np
+
+import hike_bench
+import hike_preview
+
+def read_png(path):
+    # the canvas writes one IDAT chunk of unfiltered RGB rows
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    width, height = struct.unpack('>II', data[16:24])
+    size = struct.unpack('>I', data[33:37])[0]
+    raw = np.frombuffer(zlib.decompress(data[41:41 + size]), dtype=np.uint8)
+    return raw.reshape(height, width * 3 + 1)[:, 1:].reshape(height, width, 3)
+
+def test_render_trail_from_fixtures(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    hike_bench.build_fixtures(data_dir, 0.25)
+    out_png = str(tmp_path / 'lp.png')
+    stats = hike_preview.render('lp', data_dir, out_png, dpi=48)
+    assert stats['layers'] == ['topo', 'landcov', 'hydro', 'streams', 'roads', 'rails', 'routes', 'poi']
+    assert stats['size'] == [240, 180] and stats['roads'] > 0 and stats['poi'] > 0
+    img = read_png(out_png)
+    assert img.shape == (180, 240, 3)
+    # shaded relief and dark route lines, not a blank frame
+    assert img.std() > 10 and img.min() < 100
+    assert os.path.getsize(out_png) > 1000
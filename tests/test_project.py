@@ -0,0 +1,129 @@
+import pytest
+
+import hike_project
+
+class Layer:
+    def __init__(self, name):
+        self.name = name
+
+class Map:
+    def __init__(self, name, layers):
+        self.name = name
+        self.layers = layers
+        self.listed = 0
+
+    def listLayers(self, wildcard=None):
+        self.listed += 1
+        return [lyr for lyr in self.layers if wildcard is None or lyr.name.startswith(wildcard.rstrip('*'))]
+
+class Project:
+    def __init__(self, maps):
+        self.maps = maps
+
+    def listMaps(self):
+        return self.maps
+
+    def listLayouts(self):
+        return []
+
+def project(*names):
+    m = Map('Map', [Layer(n) for n in names])
+    return hike_project.Registry(Project([m])), m
+
+def test_lookups_count_hits_and_misses():
+    reg, m = project('roads', 'topo')
+    assert reg.layer(m, 'roads') is m.layers[0]
+    assert reg.layer(m, 'topo') is m.layers[1]
+    assert reg.stats == {'hits': 2, 'misses': 0, 'scans': 1}
+    # a layer added behind the registry's back is found by one rescan and counts as a hit
+    m.layers.insert(0, Layer('hydro'))
+    assert reg.layer(m, 'hydro') is m.layers[0]
+    assert reg.stats == {'hits': 3, 'misses': 0, 'scans': 2}
+    with pytest.raises(LookupError, match='available: hydro, roads, topo'):
+        reg.layer(m, 'rails')
+    assert reg.stats == {'hits': 3, 'misses': 1, 'scans': 3}
+    assert reg.layer(m, 'ro*') is m.layers[1]
+    assert reg.map('Map') is m
+    assert reg.stats['hits'] == 5
+
+def test_remove_drops_only_that_layer():
+    reg, m = project('roads', 'topo', 'roads')
+    reg.layer(m, 'topo')
+    first = m.layers[0]
+    m.layers.remove(first)
+    reg.removed(m, first)
+    assert reg.layer(m, 'roads') is m.layers[1]
+    assert reg.layer(m, 'topo') is m.layers[0]
+    assert reg.stats['scans'] == 1
+
+def test_rename_moves_the_layer():
+    reg, m = project('HillSha_Coun1', 'roads')
+    reg.layer(m, 'roads')
+    lyr = m.layers[0]
+    lyr.name = 'topo'
+    reg.renamed(lyr, 'HillSha_Coun1')
+    assert reg.layer(m, 'topo') is lyr
+    assert reg.layer(m, 'roads') is m.layers[1]
+    assert reg.stats['scans'] == 1
+    with pytest.raises(LookupError):
+        reg.layer(m, 'HillSha_Coun1')
+
+def test_rename_of_another_object_rescans_that_name():
+    reg, m = project('HillSha_Coun1', 'roads')
+    reg.layer(m, 'roads')
+    # arcpy can hand out a second object for the same layer
+    other = Layer('topo')
+    m.layers[0].name = 'topo'
+    reg.renamed(other, 'HillSha_Coun1')
+    # only the old name is dropped, the rest of the index is kept
+    assert set(reg.layers['Map']) == {'roads'}
+    assert reg.layer(m, 'topo') is m.layers[0]
+    assert reg.stats['scans'] == 2
+
+class CIM:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class CIMLayer:
+    def __init__(self):
+        self.name = 'roads'
+        self.cim = CIM(labelClasses=[CIM(name=f'Label Class {i}', visibility=False) for i in range(4)],
+                       renderer=CIM(groups=[CIM(classes=[CIM(label=l, color=None) for l in ('71', '81', '90')])]),
+                       elements=[CIM(name='Title', text='')])
+        self.gets = self.sets = 0
+
+    def getDefinition(self, version):
+        self.gets += 1
+        return self.cim
+
+    def setDefinition(self, cim):
+        self.sets += 1
+        self.cim = cim
+
+def test_cim_edit_reads_and_writes_once():
+    lyr, stats = CIMLayer(), {'transactions': 0, 'edits': 0, 'round_trips_saved': 0}
+    with hike_project.CIMEdit(lyr, stats) as tx:
+        for lbl_cim in tx.label_classes():
+            lbl_cim.visibility = True
+        tx.label_class('Label Class 3').visibility = False
+        for cls in tx.renderer_classes(['71', '81']):
+            cls.color = [255, 255, 255, 0]
+        tx.element('Title').text = 'Lick Brook'
+    assert (lyr.gets, lyr.sets) == (1, 1)
+    assert [c.visibility for c in lyr.cim.labelClasses] == [True, True, True, False]
+    assert [c.color for c in lyr.cim.renderer.groups[0].classes] == [[255, 255, 255, 0]] * 2 + [None]
+    assert lyr.cim.elements[0].text == 'Lick Brook'
+    # 4 label classes, 1 label class, 2 renderer classes and 1 element would each have been a round trip
+    assert stats == {'transactions': 1, 'edits': 8, 'round_trips_saved': 7}
+
+def test_cim_edit_does_not_commit_a_failed_block():
+    lyr, stats = CIMLayer(), {'transactions': 0, 'edits': 0, 'round_trips_saved': 0}
+    with pytest.raises(LookupError, match='Label Class 9'):
+        with hike_project.CIMEdit(lyr, stats) as tx:
+            tx.label_class('Label Class 0').visibility = True
+            tx.label_class('Label Class 9')
+    assert (lyr.gets, lyr.sets) == (1, 0)
+    assert stats == {'transactions': 0, 'edits': 0, 'round_trips_saved': 0}
+    with hike_project.CIMEdit(lyr, stats) as tx:
+        tx.label_class('Label Class 1').visibility = True
+    assert lyr.sets == 1 and stats == {'transactions': 1, 'edits': 1, 'round_trips_saved': 0}
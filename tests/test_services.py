@@ -0,0 +1,143 @@
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import hike_services
+
+ext = '-76.6 42.3 -76.4 42.5 '
+
+def fset(n, seed=0):
+    return {'geometryType': 'esriGeometryPoint',
+            'features': [{'attributes': {'OBJECTID': i, 'NAME': f'{seed}-{i}-' + 'x' * (i % 7)},
+                          'geometry': {'x': i, 'y': seed}} for i in range(n)]}
+
+class Fetch:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, svc_url, layer, extent, fields):
+        self.calls.append((svc_url, layer, extent, fields))
+        return fset(3, len(self.calls))
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(hike_services.time, 'time', lambda: now[0])
+    return now
+
+def test_feature_cache_hits_and_ttl(tmp_path, clock):
+    fetch = Fetch()
+    cache = hike_services.FeatureCache(str(tmp_path / 'features.sqlite'), ttl=60, fetch=fetch)
+    first = cache.get('https://svc/MapServer/', 0, ext, ['NAME'])
+    assert cache.get('https://svc/MapServer', '0', ext.split(), ['NAME']) == first
+    assert len(fetch.calls) == 1 and fetch.calls[0][3] == ['NAME']
+
+    clock[0] += 61
+    assert cache.get('https://svc/MapServer', 0, ext, ['NAME']) != first
+    assert len(fetch.calls) == 2
+    assert cache.stats == {'hits': 1, 'misses': 2, 'stale': 1, 'evicted': 0}
+    cache.close()
+
+def test_feature_cache_evicts_least_recently_used(tmp_path, clock):
+    fetch = Fetch()
+    cache = hike_services.FeatureCache(str(tmp_path / 'features.sqlite'), fetch=fetch)
+    exts = [f'{i} 0 {i + 1} 1' for i in range(3)]
+    for e in exts:
+        clock[0] += 1
+        cache.get('https://svc/MapServer', 0, e)
+    size = cache.db.execute('SELECT MAX(size) FROM features').fetchone()[0]
+    cache.max_bytes = 3 * size
+
+    clock[0] += 1
+    cache.get('https://svc/MapServer', 0, exts[0])
+    clock[0] += 1
+    cache.get('https://svc/MapServer', 0, '9 0 10 1')
+    kept = {e for e, in cache.db.execute('SELECT extent FROM features')}
+    assert hike_services.extent_key(exts[1]) not in kept
+    assert hike_services.extent_key(exts[0]) in kept
+    assert cache.stats['evicted'] == 1
+    cache.close()
+
+def test_feature_cache_offline(tmp_path, clock):
+    path = str(tmp_path / 'features.sqlite')
+    online = hike_services.FeatureCache(path, ttl=60, fetch=Fetch())
+    stored = online.get('https://svc/MapServer', 0, ext)
+    online.close()
+
+    clock[0] += 3600
+    fetch = Fetch()
+    cache = hike_services.FeatureCache(path, ttl=60, offline=True, fetch=fetch)
+    assert cache.get('https://svc/MapServer', 0, ext) == stored
+    assert cache.cached('https://svc/MapServer', 0, '-76.5 42.4 -76.3 42.6') == [stored]
+    assert cache.cached('https://svc/MapServer', 0, '0 0 1 1') == []
+    with pytest.raises(ValueError):
+        cache.get('https://svc/MapServer', 1, ext)
+    assert fetch.calls == []
+    cache.close()
+
+class Service(BaseHTTPRequestHandler):
+    """
+    Layer 0 pages with resultOffset, layer 1 only by object id.
+    """
+    protocol_version = 'HTTP/1.1'
+    features = fset(7)['features']
+    requests = []
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        q = dict(urllib.parse.parse_qsl(url.query))
+        self.requests.append((url.path, q))
+        layer = url.path.split('/')[-2 if url.path.endswith('/query') else -1]
+        if not url.path.endswith('/query'):
+            body = {'objectIdField': 'OBJECTID', 'maxRecordCount': 3,
+                    'advancedQueryCapabilities': {'supportsPagination': layer == '0'}}
+        elif q.get('returnIdsOnly') == 'true':
+            body = {'objectIdFieldName': 'OBJECTID', 'objectIds': [ft['attributes']['OBJECTID'] for ft in self.features][::-1]}
+        elif 'objectIds' in q:
+            ids = {int(v) for v in q['objectIds'].split(',')}
+            body = {'geometryType': 'esriGeometryPoint',
+                    'features': [ft for ft in self.features if ft['attributes']['OBJECTID'] in ids]}
+        else:
+            start, count = int(q['resultOffset']), int(q['resultRecordCount'])
+            body = {'geometryType': 'esriGeometryPoint', 'features': self.features[start:start + count],
+                    'exceededTransferLimit': start + count < len(self.features)}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def service():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    Service.requests = []
+    yield f'http://127.0.0.1:{server.server_port}/arcgis/rest/services/Test/MapServer'
+    server.shutdown()
+    server.server_close()
+    hike_services.http_pool.close()
+
+def test_fetch_features_pages_by_offset(service):
+    out = hike_services.fetch_features(service, 0, ext, ['NAME'])
+    assert [ft['attributes']['OBJECTID'] for ft in out['features']] == list(range(7))
+    assert 'exceededTransferLimit' not in out
+    queries = [q for path, q in Service.requests if path.endswith('/query')]
+    assert [q['resultOffset'] for q in queries] == ['0', '3', '6']
+    assert queries[0]['outFields'] == 'OBJECTID,NAME'
+    assert queries[0]['geometry'] == '-76.600000,42.300000,-76.400000,42.500000'
+
+def test_fetch_features_pages_by_object_id(service):
+    out = hike_services.fetch_features(service, 1, ext, page_size=4)
+    assert sorted(ft['attributes']['OBJECTID'] for ft in out['features']) == list(range(7))
+    queries = [q for path, q in Service.requests if path.endswith('/query')]
+    assert queries[0]['returnIdsOnly'] == 'true'
+    assert [q['objectIds'] for q in queries[1:]] == ['0,1,2,3', '4,5,6']
+    assert 'geometry' not in queries[1]
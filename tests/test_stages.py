@@ -0,0 +1,105 @@
+import json
+import threading
+
+import pytest
+
+import hike_stages
+
+def test_serial_stages_wait_for_their_inputs_in_declaration_order():
+    calls = []
+    graph = hike_stages.StageGraph()
+    graph.add('fetch_dem', lambda: calls.append('fetch_dem'), outputs=['dem'], serial=False)
+    graph.add('routes', lambda: calls.append('routes'))
+    graph.add('hillshade', lambda: calls.append('hillshade') or threading.current_thread().name, ['dem'])
+    graph.add('camera', lambda: calls.append('camera'))
+    assert graph.needs('hillshade') == ['fetch_dem'] and graph.needs('camera') == []
+    results = graph.run()
+    assert [c for c in calls if c != 'fetch_dem'] == ['routes', 'hillshade', 'camera']
+    assert calls.index('fetch_dem') < calls.index('hillshade')
+    # map edits stay on the calling thread
+    assert results['hillshade'] == threading.current_thread().name
+    assert graph.timings['fetch_dem']['thread'].startswith('stage')
+
+def test_inputs_must_be_written_by_an_earlier_stage():
+    graph = hike_stages.StageGraph()
+    graph.add('hillshade', lambda: None, ['dem'])
+    graph.add('fetch_dem', lambda: None, outputs=['dem'], serial=False)
+    with pytest.raises(ValueError, match='dem'):
+        graph.run()
+    with pytest.raises(ValueError, match='already declared'):
+        graph.add('hillshade', lambda: None)
+
+def test_fetch_stages_run_in_parallel():
+    # each fetch waits for the others, so they only finish if they run at the same time
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fetch(name):
+        barrier.wait()
+        return name
+
+    graph = hike_stages.StageGraph()
+    for name in ('hydro', 'roads', 'rails'):
+        graph.add(f'fetch_{name}', lambda n=name: fetch(n), outputs=[name], serial=False)
+    graph.add('map', lambda: 'drawn', ['hydro', 'roads', 'rails'])
+    results = graph.run(workers=3)
+    assert results == {'fetch_hydro': 'hydro', 'fetch_roads': 'roads', 'fetch_rails': 'rails', 'map': 'drawn'}
+    assert len({graph.timings[f'fetch_{n}']['thread'] for n in ('hydro', 'roads', 'rails')}) == 3
+
+def fail():
+    raise RuntimeError('service down')
+
+def test_failed_fetch_stops_the_stages_reading_it():
+    calls = []
+    graph = hike_stages.StageGraph()
+    graph.add('fetch_hydro', fail, outputs=['hydro'], serial=False)
+    graph.add('routes', lambda: calls.append('routes'))
+    graph.add('water', lambda: calls.append('water'), ['hydro'])
+    graph.add('camera', lambda: calls.append('camera'))
+    with pytest.raises(RuntimeError, match='service down'):
+        graph.run()
+    assert 'water' not in calls and 'camera' not in calls
+
+def test_optional_failure_is_reported_and_the_build_goes_on():
+    graph = hike_stages.StageGraph()
+    graph.add('fetch_hydro', fail, outputs=['hydro'], serial=False, optional=True)
+    graph.add('water', lambda: 'drawn', ['hydro'])
+    results = graph.run()
+    assert isinstance(results['fetch_hydro'], RuntimeError) and results['water'] == 'drawn'
+
+def test_failed_serial_stage_rolls_back_and_resumes(tmp_path):
+    path = str(tmp_path / 'journal.json')
+    items, rolled_back = [], []
+    state = {'fail': True}
+
+    def water():
+        items.append('layer:hydro')
+        if state['fail']:
+            raise RuntimeError('lock')
+
+    def rollback(added):
+        rolled_back.extend(added)
+        items[:] = [x for x in items if x not in added]
+
+    def graph(calls):
+        g = hike_stages.StageGraph()
+        g.add('routes', lambda: calls.append('routes') or items.append('layer:routes'))
+        g.add('water', lambda: calls.append('water') or water())
+        g.add('camera', lambda: calls.append('camera'))
+        return g
+
+    calls = []
+    with pytest.raises(RuntimeError):
+        graph(calls).run(journal=hike_stages.StageJournal(path, 'lp'), snapshot=lambda: list(items),
+                         rollback=rollback)
+    assert calls == ['routes', 'water'] and rolled_back == ['layer:hydro'] and items == ['layer:routes']
+    with open(path) as f:
+        stages = json.load(f)['lp']
+    assert stages['routes'] == dict(stages['routes'], status='done', added=['layer:routes'])
+    assert stages['water']['status'] == 'failed' and 'lock' in stages['water']['error']
+
+    state['fail'] = False
+    calls = []
+    graph(calls).run(journal=hike_stages.StageJournal(path, 'lp'), snapshot=lambda: list(items), rollback=rollback)
+    assert calls == ['water', 'camera']
+    with open(path) as f:
+        assert json.load(f) == {}
@@ -0,0 +1,183 @@
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pytest
+
+import hike_memory
+import hike_terrain
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def dem(shape=(300, 400)):
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    return (300 + 40 * np.sin(x / 25.0) * np.cos(y / 31.0)).astype(np.float32)
+
+def test_hillshade_strips_match_whole():
+    d = dem()
+    whole = hike_terrain.hillshade(d, 2.0, workers=1)
+    assert np.array_equal(hike_terrain.hillshade(d, 2.0, budget=400 * 80 * 7), whole)
+
+def plane(east, north, shape=(20, 30), cell=2.0):
+    # rows run north to south, so north decreases with the row index
+    y, x = np.mgrid[0:shape[0], 0:shape[1]] * cell
+    return (100 + east * x - north * y).astype(np.float32)
+
+@pytest.mark.parametrize('east,north,azimuth,altitude', [
+    (0.0, 0.0, 315, 45), (0.3, 0.0, 315, 45), (-1.0, 1.0, 315, 45),
+    (0.0, -0.5, 180, 30), (0.8, 0.2, 90, 60)])
+def test_hillshade_plane_matches_sun_angle(east, north, azimuth, altitude):
+    # shade is the cosine between the plane normal and the sun direction
+    az, alt = np.radians(azimuth), np.radians(altitude)
+    sun = np.array([np.sin(az) * np.cos(alt), np.cos(az) * np.cos(alt), np.sin(alt)])
+    normal = np.array([-east, -north, 1.0]) / np.sqrt(east ** 2 + north ** 2 + 1)
+    expect = np.floor(255 * max(normal @ sun, 0))
+    hs = hike_terrain.hillshade(plane(east, north), 2.0, azimuth, altitude, workers=1)
+    assert hs.dtype == np.float32
+    assert np.allclose(hs[1:-1, 1:-1], expect, atol=1)
+
+def test_hillshade_nodata_stays_nodata():
+    d = dem((40, 50))
+    d[10:13, 20:24] = np.nan
+    hs = hike_terrain.hillshade(d, 2.0, workers=1)
+    assert np.array_equal(np.isnan(hs), np.isnan(d))
+    # neighbours of NoData use the center cell instead, like ArcGIS HillShade
+    assert np.isfinite(hs[9:14, 19:25][~np.isnan(d[9:14, 19:25])]).all()
+    assert np.array_equal(np.isnan(hike_terrain.hillshade(d, 2.0, budget=50 * 80 * 7)), np.isnan(d))
+
+def test_hillshade_script_under_spawn_runs_once(tmp_path):
+    # a script without a __main__ guard, like hike-template.py
+    script = tmp_path / 'build.py'
+    script.write_text(f'''
+import sys
+import multiprocessing as mp
+sys.path.insert(0, {root!r})
+mp.set_start_method('spawn', force=True)
+import numpy as np
+import pytest
+import hike_terrain
+print('build ran')
+dem = np.random.default_rng(0).random((600, 600))
+tiled = hike_terrain.hillshade(dem, 2.0, tile=256, workers=2)
+print('equal', np.array_equal(tiled, hike_terrain.hillshade(dem, 2.0, workers=1)))
+''')
+    out = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.count('build ran') == 1
+    assert 'equal True' in out.stdout
+
+def test_dem_store_create_keeps_existing_store(tmp_path):
+    path = str(tmp_path / 'store')
+    store = hike_terrain.DEMStore.create(path, (4, 4), (0.0, 4.0), (1.0, 1.0), tile=2)
+    store.fill(lambda r0, r1, c0, c1: np.full((r1 - r0, c1 - c0), 7.0))
+    # a second worker racing to create the same store opens the filled one
+    again = hike_terrain.DEMStore.create(path, (4, 4), (0.0, 4.0), (1.0, 1.0), tile=2)
+    assert np.all(again.dem[:] == 7.0)
+    assert os.listdir(tmp_path) == ['store']
+
+def test_dem_store_fills_tiles_lazily(tmp_path):
+    full = dem((100, 120))
+    calls = []
+
+    def fetch(r0, r1, c0, c1):
+        calls.append((r0, r1, c0, c1))
+        return full[r0:r1, c0:c1]
+    store = hike_terrain.DEMStore.create(str(tmp_path / 'store'), full.shape, (0.0, 100.0), (1.0, 1.0), tile=32)
+    with pytest.raises(ValueError):
+        store.window(10, 40, 20, 50)
+
+    win, ul = store.window(10, 40, 20, 50, fetch)
+    assert calls == [(32, 64, 0, 32)]
+    assert np.array_equal(win, full[50:60, 10:20]) and ul == (10.0, 50.0)
+    # filled tiles are not fetched again, also after reopening
+    store.window(0, 40, 30, 50, fetch)
+    reopened = hike_terrain.DEMStore(store.path)
+    reopened.window(10, 40, 20, 50)
+    assert len(calls) == 1 and reopened.filled.sum() == 1
+
+def test_dem_store_window_is_clipped_to_the_dem(tmp_path):
+    full = dem((64, 80))
+    store = hike_terrain.DEMStore.create(str(tmp_path / 'store'), full.shape, (100.0, 64.0), (1.0, 1.0), tile=32)
+    store.fill(lambda r0, r1, c0, c1: full[r0:r1, c0:c1])
+    # partly outside on each side: the window is the overlap, its corner moved inside
+    win, ul = store.window(90, 50, 110, 70)
+    assert np.array_equal(win, full[0:14, 0:10]) and ul == (100.0, 64.0)
+    win, ul = store.window(170, -10, 190, 5)
+    assert np.array_equal(win, full[59:64, 70:80]) and ul == (170.0, 5.0)
+    win, ul = store.window(50, -50, 250, 150)
+    assert np.array_equal(win, full)
+    # wholly outside, including past the far edges where the old indexes went negative or beyond the DEM
+    for ext in [(10, 10, 90, 40), (190, 10, 250, 40), (120, 70, 140, 90), (120, -40, 140, -5), (10, 70, 90, 90)]:
+        with pytest.raises(ValueError, match='does not overlap'):
+            store.window(*ext)
+
+def test_dem_store_window_is_zero_copy(tmp_path):
+    store = hike_terrain.DEMStore.create(str(tmp_path / 'store'), (64, 64), (0.0, 64.0), (1.0, 1.0), tile=32)
+    store.fill(lambda r0, r1, c0, c1: np.zeros((r1 - r0, c1 - c0)))
+    win, ul = store.window(5, 20, 40, 50)
+    assert np.shares_memory(win, store.dem)
+    assert isinstance(win, np.memmap)
+
+def cone(n=101):
+    y, x = np.mgrid[0:n, 0:n]
+    return 200 - np.hypot(x - n // 2, y - n // 2)
+
+def test_contours_of_a_cone():
+    lines, stats = hike_terrain.contours(cone(), 1.0, (0.0, 101.0), interval=10, major=50)
+    assert stats['levels'] == 8 and stats['lines'] == 16
+    # levels inside the window close into rings around the peak, the others are cut into four arcs
+    for level in (130, 140, 150):
+        assert sum(lv == level for lv, _, _ in lines) == 4
+    rings = [(lv, xy) for lv, _, xy in lines if lv > 150]
+    assert [lv for lv, _ in rings] == [160, 170, 180, 190]
+    for lv, xy in rings:
+        assert np.array_equal(xy[0], xy[-1])
+        r = np.hypot(xy[:, 0] - 50.5, xy[:, 1] - 50.5)
+        assert np.allclose(r, 200 - lv, atol=0.05)
+    assert {lv for lv, is_major, _ in lines if is_major} == {150}
+
+def test_contours_of_a_plane():
+    y, x = np.mgrid[0:40, 0:61]
+    lines, stats = hike_terrain.contours(2.5 + 0.5 * x, 2.0, (100.0, 80.0), interval=5, major=10)
+    assert [lv for lv, _, _ in lines] == [5, 10, 15, 20, 25, 30]
+    for lv, is_major, xy in lines:
+        # straight north-south lines through the whole window, at the cell centers' x
+        assert len(xy) == 40
+        assert np.allclose(xy[:, 0], 100.0 + ((lv - 2.5) / 0.5 + 0.5) * 2.0)
+        assert is_major == (lv % 10 == 0)
+
+def test_contour_strips_match_whole():
+    d = cone()
+    whole, _ = hike_terrain.contours(d, 1.0, (0.0, 101.0), interval=10)
+    strips, stats = hike_terrain.contours(d, 1.0, (0.0, 101.0), interval=10, budget=101 * 32 * 10)
+    assert stats['strips'] > 1
+    assert len(strips) == len(whole)
+
+    def vertices(lines):
+        return {lv: sorted(map(tuple, np.round(np.concatenate([xy for l, _, xy in lines if l == lv]), 9)))
+                for lv, _, _ in lines}
+    assert vertices(strips) == vertices(whole)
+
+def test_contour_budget_caps_working_memory():
+    d = dem((800, 600))
+    with hike_memory.MemoryMonitor('whole') as whole:
+        lines, _ = hike_terrain.contours(d, 1.0, (0.0, 800.0), interval=20)
+    with hike_memory.MemoryMonitor('strips') as strips:
+        budgeted, stats = hike_terrain.contours(d, 1.0, (0.0, 800.0), interval=20, budget='1 MB')
+    # 1 MB of 32-byte cells is 54 rows of 600 per strip
+    assert stats['strips'] == 15
+    assert sum(len(xy) for _, _, xy in budgeted) == sum(len(xy) for _, _, xy in lines)
+    # the whole window needs its float64 copy and 32 bytes per cell; strips keep mostly the traced lines
+    assert whole.stats['alloc_peak_mb'] > 10
+    assert strips.stats['alloc_peak_mb'] < whole.stats['alloc_peak_mb'] / 2
+
+def test_contours_skip_nodata():
+    d = np.full((30, 40), np.nan)
+    assert hike_terrain.contours(d, 1.0, (0.0, 30.0))[0] == []
+    assert len(hike_terrain.contour_levels(d)[0]) == 0
+    # NoData strips around data still contour the data
+    d[12:20] = np.arange(40) * 1.0
+    lines, stats = hike_terrain.contours(d, 1.0, (0.0, 30.0), interval=10, budget=40 * 32 * 4)
+    assert stats['strips'] > 2
+    assert sorted(lv for lv, _, _ in lines) == [10, 20, 30]
@@ -0,0 +1,51 @@
+import time
+import types
+
+import pytest
+
+import hike_trace
+
+def toolbox():
+    tbx = types.ModuleType('management')
+
+    def CopyFeatures(a, b):
+        time.sleep(0.02)
+        return b
+
+    def Delete(a):
+        time.sleep(0.01)
+    tbx.CopyFeatures, tbx.Delete = CopyFeatures, Delete
+    tbx.Result = type('Result', (), {})
+    return tbx
+
+def test_span_totals_of_traced_tools(tmp_path):
+    tracer = hike_trace.Tracer()
+    tbx = toolbox()
+    with tracer.traced_modules([(tbx, 'management.', None)]):
+        with tracer.span('water', 'stage'):
+            assert tbx.CopyFeatures('a', 'b') == 'b'
+            tbx.CopyFeatures('a', 'c')
+            tbx.Delete('c')
+    path = str(tmp_path / 'trace.json')
+    tracer.write(path, {'trail': 'lp'})
+    rows = {r['name']: r for r in hike_trace.summarize([path], ('stage', 'gp'))}
+    assert set(rows) == {'water', 'management.CopyFeatures', 'management.Delete'}
+    assert rows['management.CopyFeatures']['calls'] == 2 and rows['management.CopyFeatures']['cat'] == 'gp'
+    assert rows['management.CopyFeatures']['wall'] >= 0.04 and rows['management.Delete']['wall'] >= 0.01
+    # the tools ran inside the stage span
+    assert rows['water']['wall'] >= rows['management.CopyFeatures']['wall'] + rows['management.Delete']['wall']
+
+def test_traced_modules_are_restored():
+    tracer = hike_trace.Tracer()
+    tbx, ap = toolbox(), types.ModuleType('arcpy')
+    ap.NumPyArrayToRaster, ap.Exists = (lambda a: a), (lambda p: True)
+    originals = (tbx.CopyFeatures, tbx.Delete, ap.NumPyArrayToRaster, ap.Exists)
+    with pytest.raises(RuntimeError):
+        with tracer.traced_modules([(tbx, 'management.', None), (ap, '', ['NumPyArrayToRaster'])]):
+            assert tbx.CopyFeatures is not originals[0] and tbx.CopyFeatures.traced
+            assert ap.NumPyArrayToRaster.traced and ap.Exists is originals[3]
+            raise RuntimeError('stage failed')
+    # put back even when the build fails, classes untouched
+    assert (tbx.CopyFeatures, tbx.Delete, ap.NumPyArrayToRaster, ap.Exists) == originals
+    tbx.CopyFeatures('a', 'b')
+    assert tracer.events == []
@@ -0,0 +1,164 @@
+import numpy as np
+
+import hike_terrain
+import hike_tracks
+
+gpx = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <metadata><name>Best Hikes</name></metadata>
+  <trk>
+    <name>Lick Brook</name>
+    <trkseg>
+      <trkpt lat="42.40" lon="-76.55"><ele>150.0</ele><name>start</name></trkpt>
+      <trkpt lat="42.41" lon="-76.54"><ele>160.5</ele></trkpt>
+    </trkseg>
+    <trkseg>
+      <trkpt lat="42.42" lon="-76.53"></trkpt>
+    </trkseg>
+  </trk>
+  <rte>
+    <name>Loop</name>
+    <rtept lat="42.30" lon="-76.50"><ele>300</ele></rtept>
+    <rtept lat="42.31" lon="-76.51"><ele>310</ele></rtept>
+  </rte>
+  <trk>
+    <name>Lick Brook</name>
+    <trkseg><trkpt lat="42.43" lon="-76.52"><ele>170</ele></trkpt></trkseg>
+  </trk>
+</gpx>
+"""
+
+def test_iter_gpx_tracks_reads_tracks_and_routes(tmp_path):
+    path = tmp_path / 'routes.gpx'
+    path.write_text(gpx)
+    parts = list(hike_tracks.iter_gpx_tracks(str(path)))
+    assert [name for name, _ in parts] == ['Lick Brook', 'Loop', 'Lick Brook']
+    # every segment of a track, point names ignored, missing elevations NaN
+    assert np.allclose(parts[0][1][:2], [[-76.55, 42.40, 150.0], [-76.54, 42.41, 160.5]])
+    assert parts[0][1].shape == (3, 3) and np.isnan(parts[0][1][2, 2])
+    assert np.allclose(parts[1][1], [[-76.50, 42.30, 300], [-76.51, 42.31, 310]])
+
+def test_read_gpx_tracks_joins_same_name(tmp_path):
+    path = tmp_path / 'routes.gpx'
+    path.write_text(gpx)
+    tracks = hike_tracks.read_gpx_tracks(str(path))
+    assert list(tracks) == ['Lick Brook', 'Loop']
+    assert np.allclose(tracks['Lick Brook'][:, 1], [42.40, 42.41, 42.42, 42.43])
+    assert tracks['Loop'].shape == (2, 3)
+
+def test_dp_mask_keeps_corners_within_tolerance():
+    x = np.linspace(0, 100, 101)
+    xy = np.column_stack((x, np.where(x <= 50, 0.0, x - 50)))
+    xy[1::2, 1] += 0.4
+    keep = hike_tracks.dp_mask(xy, 1.0)
+    assert np.array_equal(np.flatnonzero(keep), [0, 50, 100])
+    assert hike_tracks.dp_mask(xy, 0.1).all()
+    assert hike_tracks.dp_mask(xy[:2], 1.0).all()
+
+def test_dp_mask_closed_ring():
+    t = np.linspace(0, 2 * np.pi, 200)
+    ring = np.column_stack((np.cos(t), np.sin(t))) * 100
+    keep = hike_tracks.dp_mask(ring, 1.0)
+    assert keep[0] and keep[-1] and 10 < keep.sum() < 50
+
+def test_simplify_tracks_tolerance_and_cache():
+    rng = np.random.default_rng(0)
+    lon = -76.5 + np.cumsum(rng.normal(1e-4, 2e-5, 500))
+    lat = 42.4 + np.cumsum(rng.normal(0, 2e-5, 500))
+    tracks = {'a': np.column_stack((lon, lat, np.zeros(500))), 'b': np.array([[-76.5, 42.4, 0.0]])}
+    hike_tracks.simplify_cache.clear()
+    simp, stats = hike_tracks.simplify_tracks(tracks, 24000, 3.4)
+    assert stats['before'] == 501 and stats['after'] == len(simp['a']) + 1 and stats['cached'] == 0
+    assert stats['removed'] > 400 and np.array_equal(simp['b'], tracks['b'])
+
+    # every dropped vertex is within the tolerance of the simplified line
+    tol = hike_tracks.simplify_tolerance(24000, 3.4)
+    xy = hike_tracks.local_xy(tracks['a'])
+    kept = np.flatnonzero(hike_tracks.dp_mask(xy, tol))
+    for i, j in zip(kept[:-1], kept[1:]):
+        seg, pts = xy[j] - xy[i], xy[i + 1:j] - xy[i]
+        assert np.all(np.abs(seg[0] * pts[:, 1] - seg[1] * pts[:, 0]) / np.hypot(*seg) <= tol)
+
+    again, stats = hike_tracks.simplify_tracks(tracks, 24000, 3.4)
+    assert stats['cached'] == 2 and again['a'] is simp['a']
+    # a changed track or scale is simplified again
+    _, stats = hike_tracks.simplify_tracks(dict(tracks, a=tracks['a'].copy()), 24000, 3.4)
+    assert stats['cached'] == 1
+    _, stats = hike_tracks.simplify_tracks(tracks, 12000, 3.4)
+    assert stats['cached'] == 0
+
+def dem_store(tmp_path):
+    # 200 x 200 cells of 0.001 degrees rising 1 m per cell eastwards
+    store = hike_terrain.DEMStore.create(str(tmp_path / 'dem'), (200, 200), (-76.6, 42.4), (0.001, 0.001), tile=64)
+    store.fill(lambda r0, r1, c0, c1: np.tile(np.arange(c0, c1, dtype=np.float32), (r1 - r0, 1)))
+    return store
+
+def test_track_profiles_route_outside_dem(tmp_path):
+    store = dem_store(tmp_path)
+    lon = np.linspace(-76.58, -76.42, 50)
+    tracks = {'inside': np.column_stack((lon, np.full(50, 42.3))),
+              'outside': np.column_stack((lon + 1.0, np.full(50, 42.3)))}
+    stats, profiles = hike_tracks.track_profiles(tracks, store.sample, spacing=50.0)
+
+    assert stats['inside']['gain'] > 150
+    assert stats['inside']['loss'] == 0 and not np.signbit(stats['inside']['loss'])
+    assert np.all(np.isfinite(profiles['inside'][:, 1]))
+    # no elevations borrowed from the neighbouring route
+    for key in ('gain', 'loss', 'min_ele', 'max_ele'):
+        assert np.isnan(stats['outside'][key])
+    assert np.all(np.isnan(profiles['outside'][:, 1]))
+    assert stats['outside']['distance'] > 0
+
+def test_track_profiles_all_nan():
+    tracks = {'a': np.array([[-76.5, 42.3, np.nan], [-76.49, 42.3, np.nan]])}
+    stats, profiles = hike_tracks.track_profiles(tracks)
+    assert np.isnan(stats['a']['gain'])
+    assert len(profiles['a']) > 1
+
+def box_track(lon0, lat0, width_m, height_m):
+    # a track running corner to corner of a box of known ground size
+    m_per_deg = np.radians(1) * hike_tracks.earth_r
+    dlon = width_m / (m_per_deg * np.cos(np.radians(lat0)))
+    return np.array([[lon0, lat0], [lon0 + dlon, lat0 + height_m / m_per_deg]])
+
+def test_track_frames_pick_smallest_fitting_scale():
+    # 1500 m padded by 10% a side needs 1800 m, 5 in of frame hold 1800 m at 1:14173
+    tracks = {'a': box_track(-76.5, 42.3, 1500, 500),
+              'b': box_track(-76.4, 42.4, 100, 2500),
+              'empty': np.empty((0, 2))}
+    frames = hike_tracks.track_frames(tracks)
+    assert set(frames) == {'a', 'b'}
+    assert frames['a']['scale'] == 15000
+    # 2500 m tall is 3000 m padded, over 3.75 in needs 1:31496
+    assert frames['b']['scale'] == 35000
+    for name, frm in frames.items():
+        xmin, ymin, xmax, ymax = frm['extent']
+        bx0, by0, bx1, by1 = frm['bbox']
+        assert xmin < bx0 < bx1 < xmax and ymin < by0 < by1 < ymax
+        assert np.isclose(frm['camx'], (bx0 + bx1) / 2) and np.isclose(frm['camy'], (by0 + by1) / 2)
+    # the extent is the frame footprint grown by half on each axis
+    height_m = (frames['a']['extent'][3] - frames['a']['extent'][1]) * np.radians(1) * hike_tracks.earth_r
+    assert np.isclose(height_m, 3.75 * 0.0254 * 15000 * 1.5)
+
+def test_add_frames_matches_routes_exactly():
+    trails = {'lp': {'trail_name': 'Lindsay-Parsons Preserve', 'route': 'Lindsay-Parsons',
+                     'mf_camScale': 14870, 'roads': 'roads7'},
+              'jms': {'trail_name': 'Dryden Rail Trail - Jim Schug Trail', 'topo_ext': 'hand ',
+                      'mf_camScale': 35000, 'roads': 'roads8'}}
+    frames = hike_tracks.track_frames({'Lindsay-Parsons': box_track(-76.5, 42.3, 1500, 500),
+                                       'Dryden Rail Trail - Jim Schug Trail': box_track(-76.3, 42.45, 1500, 500),
+                                       'Jim Schug Trail': box_track(-76.3, 42.45, 100, 2500),
+                                       'Parsons': box_track(-76.5, 42.3, 100, 100)})
+    hike_tracks.add_frames(trails, frames)
+    assert hike_tracks.route_trail(trails, 'Lindsay-Parsons') == 'lp'
+    # part of a trail name is a route of its own
+    assert set(trails) == {'lp', 'jms', 'Jim Schug Trail', 'Parsons'}
+    assert trails['Parsons']['route'] == 'Parsons'
+    # hand-tuned values stay, missing ones are filled
+    assert trails['lp']['mf_camScale'] == 14870 and 'topo_ext' in trails['lp']
+    assert trails['jms']['topo_ext'] == 'hand '
+    # new trails draw the roads of the trail with the nearest scale
+    assert trails['Jim Schug Trail']['roads'] == 'roads8'
+    assert trails['Parsons']['roads'] == 'roads7'
+    hike_tracks.add_frames(trails, frames, overwrite=True)
+    assert trails['jms']['topo_ext'] != 'hand ' and trails['lp']['mf_camScale'] == 15000